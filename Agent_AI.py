@@ -1,128 +1,144 @@
 import os  
+import sys
 import re 
 import uuid 
+import json
+import asyncio
+import threading
+from functools import lru_cache
+from urllib.parse import urlsplit
 from dotenv import load_dotenv  
-from langchain_openai import ChatOpenAI 
 from langchain_core.tools import tool 
-from langchain_core.messages import HumanMessage, SystemMessage, AIMessage  
+from langchain_core.messages import HumanMessage, SystemMessage, AIMessage, ToolMessage
+from langchain_core.runnables import RunnableLambda
 from langgraph.graph import StateGraph, MessagesState, START, END
-from langgraph.prebuilt import tools_condition, ToolNode
-from langgraph.checkpoint.memory import MemorySaver 
-from tavily import TavilyClient
-#import trafilatura
+from context import build_context
+from retrieval import get_index
+from dedup import dedup, dedup_stats
+from governor import get_backend, invoke_llm
+from reputation import get_reputation, aevaluate_with_reputation
+from variants import get_variants, ARTICLE_VARIANTS
+from claims import acheck_claims, format_verdicts, get_claim_store
+from domains import (DOMAINS, make_tools, select_tools, shared_llm, evaluation_messages, article_messages,
+                     report_messages, source_passages)
+from llm_cache import invoke_cached, ainvoke_cached, get_cache
+from scraper import scrape, scrape_many
+from telemetry import get_telemetry
 
 # === CARICAMENTO DELLE VARIABILI D'AMBIENTE ===
 load_dotenv()
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
 TAVILY_API_KEY = os.getenv("TAVILY_API_KEY")
+VERIFY_CONCURRENCY = int(os.getenv("VERIFY_CONCURRENCY", "5"))  # Chiamate LLM contemporanee nella verifica delle fonti
+REVIEW_POLICY = os.getenv("REVIEW_POLICY", "interactive")  # interactive, auto oppure interrupt
+DOMAIN = DOMAINS["cinema"]  # prompt, modello, ricerca e tool del blog di cinema
 
 # === INIZIALIZZAZIONE DEI CLIENT ===
-client = TavilyClient(api_key=TAVILY_API_KEY)
-llm = ChatOpenAI(model="gpt-4o-mini", temperature=0.7)
+# I client vengono creati al primo utilizzo e poi condivisi: importare questo modulo (da un worker, da un test
+# o da un server) non costa né l'import di langchain_openai e tavily né la creazione dei client.
+_clients = {}
+_clients_lock = threading.Lock()
+
+def get_llm():
+    with _clients_lock:
+        if "llm" not in _clients:
+            # Client condiviso con gli altri domini dello stesso processo (stesso pool di connessioni), vedi domains.py
+            _clients["llm"] = shared_llm(DOMAIN["model"], DOMAIN["temperature"])
+        return _clients["llm"]
+
+def get_client():
+    with _clients_lock:
+        if "tavily" not in _clients:
+            from tavily import TavilyClient
+            _clients["tavily"] = TavilyClient(api_key=TAVILY_API_KEY)
+        return _clients["tavily"]
+
+def get_llm_with_tools():
+    llm = get_llm()
+    with _clients_lock:
+        if "llm_with_tools" not in _clients:
+            _clients["llm_with_tools"] = llm.bind_tools(tools=tools, tool_choice="auto")
+        return _clients["llm_with_tools"]
+
+def configure_clients(llm=None, client=None):
+    """Sostituisce i client condivisi, ad esempio con quelli finti del benchmark."""
+    with _clients_lock:
+        if llm is not None:
+            _clients["llm"] = llm
+            _clients.pop("llm_with_tools", None)
+        if client is not None:
+            _clients["tavily"] = client
 
 # === DEFINIZIONE DEI TOOLS PERSONALIZZATI ===
+def tavily_search(topic):
+    # Restituisce solo i risultati con URL e contenuto, nel formato di Tavily.
+    # Prima si consulta l'indice locale: Tavily viene chiamato solo se il topic non è noto o i risultati sono vecchi
+    # Le copie della stessa notizia vengono ridotte a un solo risultato, prima di scraping e verifica
+    index = get_index()
+    cached = index.search(topic, max_results=5)
+    if cached:
+        return dedup(cached)
+    results = get_backend("tavily").call(get_client().search, query=topic, max_results=5)
+    if not results or "results" not in results:
+        return None
+    results = [r for r in results["results"] if r.get("url") and r.get("content", "").strip()]
+    index.add_search(topic, results)
+    return dedup(results)
+
+def format_search_results(topic, results):
+    formatted_results = [f"- {r['url']}\n  → {r['content'].strip()[:200]}..."
+                         + (f"\n  (stessa notizia anche in {len(r['duplicates'])} altre fonti, non ripetute)"
+                            if r.get("duplicates") else "")
+                         for r in results]
+    return f"Risultati per '{topic}':\n" + "\n\n".join(formatted_results)
+
 @tool
 def web_search(topic: str) -> str:
     """Esegue una ricerca web sul topic fornito, usando Tavily."""
     if not topic:
         return "Errore: nessun topic fornito."
     try:
-        results = client.search(query=topic, max_results=5)
-        if not results or "results" not in results:
+        results = tavily_search(topic)
+        if results is None:
             return "Nessun risultato trovato."
-        formatted_results = []
-        for r in results["results"]:
-            summary = r.get("content", "").strip()
-            url = r.get("url", "")
-            if url and summary:
-                formatted_results.append(f"- {url}\n  → {summary[:200]}...")
-        if not formatted_results:
+        if not results:
             return "Nessun risultato utile trovato."
-        return f"Risultati per '{topic}':\n" + "\n\n".join(formatted_results)
+        return format_search_results(topic, results)
     except Exception as e:
         return f"Errore durante la ricerca: {str(e)}"
     
     #Viene fatta una ricerca web sul topic fornito, usando Tavily, e restituisce i risultati formattati. Se qualcosa va storto, restituisce un messaggio di errore 
     #sia nel caso in cui non ci siano risultati che nel caso in cui ci sia un errore durante la ricerca. Per la ricerca abbiamo usato Tavily, che richiede una chiave API.
 
-@tool
-def evaluate_source(url: str) -> str:
-    """Valuta la qualità e affidabilità di una fonte fornita (URL)."""
-    messages = [
-        SystemMessage(content="Agisci come valutatore di fonti per un blog cinematografico."),
-        HumanMessage(content=f"Sto considerando questa fonte: {url}\nValuta questa fonte e rispondi in JSON:")
-    ]
-    return llm.invoke(messages).content
-
-#Questo tool si occupa di valutare la qualità e l'affidabilità di una fonte fornita (URL).
-#Viene creato un messaggio di sistema che indica che il tool deve agire come valutatore di fonti per un blog cinematografico e viene passato l'URL da valutare.
-#E stato pensato usando un messaggio di sistema e un messaggio umano per fornire il contesto necessario al modello.
-
-@tool
-def generate_article(prompt: str) -> str:
-    """Genera un articolo cinematografico a partire da un prompt fornito."""
-    messages = [
-        SystemMessage(content="""Agisci come esperto cinematografico e scrivi un articolo in base al prompt dato.
-                      Se non è specificato altrimenti scrivi articoli di massimo 250 parole. Devi essere creativo e usare tagli e parole diverse quando richiesto."""),
-        HumanMessage(content=f"Prompt dell'articolo: {prompt}")
-    ]
-    return llm.invoke(messages).content
-
-#Questo tool genera un articolo cinematografico a partire da un prompt fornito. Non da un riassunto ma un articolo completo.
-#Se viene chiesto di creare un articolo su una tematica diversa, il tool non lo fa.
-#Viene creato un messaggio di sistema che indica che il tool deve agire come esperto cinematografico e scrivere un articolo in base al prompt dato.
-#E' stato pensato usando un messaggio di sistema e un messaggio umano per fornire il contesto necessario al modello.
+# evaluate_source, generate_article, check_fact e generate_report sono condivisi con il blog sportivo: li crea
+# make_tools in domains.py, con le parole dei prompt del dominio cinema
+_shared_tools = make_tools(DOMAIN, get_llm)
+evaluate_source = _shared_tools["evaluate_source"]
+generate_article = _shared_tools["generate_article"]
+check_fact = _shared_tools["check_fact"]
+generate_report = _shared_tools["generate_report"]
 
-
-@tool
-def check_fact(content: str, url: str, evaluation: str) -> str:
-    """Confronta il contenuto dell'articolo con una fonte e ne valuta l'accuratezza."""
-    if not content or not evaluation or not url:
-        return "Errore: uno o più campi richiesti sono vuoti."
-    messages = [
-        SystemMessage(content="Sei un fact-checker per articoli cinematografici."),
-        HumanMessage(content=f"Sto scrivendo questo articolo:\n\n{content}\n\nLa fonte è: {url}\nValutazione della fonte: {evaluation}\nLa fonte conferma il contenuto?")
-    ]
-    return llm.invoke(messages).content
-
-#Questo tool confronta il contenuto dell'articolo con una fonte e ne valuta l'accuratezza.
-#Controlla se i campi richiesti sono vuoti e restituisce un messaggio di errore in caso affermativo.
-#Viene creato un messaggio di sistema che indica che il tool deve agire come fact-checker per articoli cinematografici e viene passato il contenuto dell'articolo, l'URL della fonte e la valutazione della fonte.
-#Nel caso di un checking il tool non da un errore ma fa una segnalazione
-
-
-@tool
-def generate_report(checked_sources: str) -> str:
-    """Genera un report sull'affidabilità complessiva dell'articolo."""
-    messages = [
-        SystemMessage(content="Agisci come editor e ottimizzatore di contenuti per blog cinematografici."),
-        HumanMessage(content="Ecco le fonti analizzate e i risultati del fact-checking:\n"
-                         f"{checked_sources}\n\n"
-                         "Sulla base di queste, genera un report che:\n"
-                         "- Valuta l'affidabilità generale del mio articolo\n"
-                         "- Indica se ci sono elementi da correggere\n"
-                         "- Suggerisce miglioramenti stilistici o di contenuto")
-    ]
-    return llm.invoke(messages).content
+def generate_variant(prompt, instructions):
+    # Variante con un taglio diverso, generata in background durante la revisione; passa dalla cache LLM
+    return invoke_cached(get_llm(), article_messages(DOMAIN, prompt, instructions))
 
 @tool
 def scrape_website(url: str) -> str:
     """Effettua scraping del contenuto principale di una pagina web utilizzando trafilatura."""
     try:
-        downloaded = trafilatura.fetch_url(url)
-        if downloaded is None:
-            return "Errore: impossibile scaricare il contenuto."
-
-        result = trafilatura.extract(downloaded, include_comments=False, include_tables=False)
-        if result is None:
-            return "Errore: impossibile estrarre il contenuto."
+        result = scrape(url)
+        if result["error"]:
+            return f"Errore: {result['error']}."
+        get_index().add_page(url, result["text"])
 
-        return f"Contenuto estratto dal sito {url}:\n\n{result[:3000]}"  # Limita a 3000 caratteri
+        return f"Contenuto estratto dal sito {url}:\n\n{result['text'][:3000]}"  # Limita a 3000 caratteri
     except Exception as e:
         return f"Errore scraping: {str(e)}"
     
 #Questo tool effettua scraping del contenuto principale di una pagina web utilizzando trafilatura.
 #Abbiamo scelto di fare scraping per estendere le capacità del tool di ricerca web, in modo da avere un contenuto più dettagliato e preciso.
+#Il download passa dal modulo scraper: connessioni riutilizzate, timeout, limiti per host e cache su disco del testo estratto.
+#Il testo estratto viene anche aggiunto all'indice locale, da cui il fact-checking prende i passaggi della fonte.
 
 @tool
 def suggest_articles() -> str:
@@ -134,62 +150,160 @@ def suggest_articles() -> str:
             HumanMessage(content="Suggeriscimi 5 idee originali per articoli brevi (<200 parole) a tema cinematografico. Scrivi solo i titoli in lista numerata. Suggerisci sempre cose diverse.")
         ]
         # Invoca il modello per generare i suggerimenti
-        response = llm.invoke(messages).content
+        response = invoke_llm(get_llm(), messages).content  # niente cache: ogni richiesta vuole idee nuove
         print("\n🎥 Ecco i suggerimenti per articoli:")
         print(response)
         return response
     except Exception as e:
         return f"Errore durante la generazione dei suggerimenti: {str(e)}"
 # Questo tool suggerisce 5 idee originali per articoli cinematografici.
+# I tool che interrogano l'LLM (tranne generate_article e suggest_articles, che devono restare creativi) passano
+# da invoke_cached: le stesse fonti e le stesse coppie articolo/fonte vengono valutate una volta sola, anche tra
+# riavvii diversi. Il parametro bypass_cache permette di forzare una nuova risposta per la singola chiamata.
 
 # === BINDING DEI TOOL CON L'LLM ===
-tools = [web_search, evaluate_source, generate_article, check_fact, generate_report, scrape_website, suggest_articles]
-llm_with_tools = llm.bind_tools(tools=tools, tool_choice="auto")
+tools = select_tools(DOMAIN, [web_search, scrape_website, suggest_articles, *_shared_tools.values()])
+# Il binding viene fatto al primo utilizzo, in get_llm_with_tools
 
 # === NODO ASSISTENTE CHE GESTISCE LE DECISIONI ===
-sys_msg = SystemMessage(content="""
-Sei un assistente per un blog cinematografico.
-🛑 Non puoi rispondere direttamente all'utente.  
-✅ Il tuo unico compito è scegliere quale tool usare.  
-🔧 Usa sempre e solo i tools disponibili, altrimenti restituisci un errore.
-    Prima di generare un articolo fai SEMPRE web search per avere informazioni aggiornate.
-    Dopo il web search fai Sempre scraping della fonte che ti sembra più pertinente. Poi genera l'articolo.
-🚫 Se nessun tool è adatto, non rispondere.
-🚫 MAI generare articoli a meno che non sia esplicitamente richiesto.
-📝 Per 'articolo' si intende solo contenuti <200 parole) strutturati.
-Parla solo di cinema, non di musica, religione, politica, etica o altro che non sia cinema.
-""")
+sys_msg = SystemMessage(content=DOMAIN["system_prompt"])  # prompt in domains.py
  
 # Questo messaggio di sistema definisce il comportamento dell'assistente, specificando che non può rispondere direttamente all'utente e che deve scegliere quale tool usare.
 # Tramite questo messaggio di sistema ci assicuriamo che l'assistente faccia esattamente ciò che noi desideriamo e ovviamente ne viene tenuto conto nel grafo e nei vari tools
 
 
-def assistant(state: MessagesState):
+# === STATO DEL GRAFO ===
+class BlogState(MessagesState):
+    summary: str  # Riassunto dei turni più vecchi della conversazione
+    summarized: int  # Numero di messaggi iniziali già inclusi nel riassunto
+    topic: str  # Topic dell'articolo se la richiesta segue il percorso veloce, altrimenti stringa vuota
+    candidates: list  # URL delle fonti trovate dal percorso veloce, dalla più promettente
+    review_again: bool  # True se human_review ha appena mostrato una variante e deve chiedere di nuovo
+
+
+def assistant(state: BlogState):
     # Usa il modello per decidere quale tool invocare in base alla conversazione
-   
-    return {"messages": [llm_with_tools.invoke([sys_msg] + state["messages"])]}
+    # Il contesto viene limitato a CONTEXT_TOKEN_BUDGET token: turni vecchi riassunti, output vecchi dei tool accorciati
+    prompt, summary_update = build_context(sys_msg, state["messages"], state.get("summary", ""),
+                                           state.get("summarized", 0), get_llm())
+    return {"messages": [invoke_llm(get_llm_with_tools(), prompt)], **summary_update}
+
+def latest_tool_output(msgs, tool_name):
+    return next(
+        (msg.content for msg in reversed(msgs) if isinstance(msg, ToolMessage) and msg.name == tool_name),
+        None
+    )
+
+REVIEW_PROMPT = "review"  # name dei prompt di rigenerazione scritti dall'editor durante la revisione
+
+def current_turn(msgs):
+    # Messaggi dopo l'ultima richiesta dell'utente: i tool dei turni precedenti non riguardano l'articolo corrente.
+    # I prompt di revisione non aprono un turno nuovo: la bozza rivista si verifica sulle fonti dello stesso articolo
+    last_human = next((i for i in range(len(msgs) - 1, -1, -1)
+                        if isinstance(msgs[i], HumanMessage) and msgs[i].name != REVIEW_PROMPT), -1)
+    return msgs[last_human + 1:]
+
+# === POLICY PER LA REVISIONE UMANA ===
+# Ogni policy riceve l'articolo (o i suggerimenti) e restituisce il nuovo prompt (o il topic scelto), oppure None
+# se non c'è niente da rigenerare. In questo modo lo human in the loop può essere da terminale, automatico
+# oppure sospeso con un interrupt di LangGraph e ripreso più tardi con Command(resume=...).
+# Una policy con la chiave "variants" riceve anche quante varianti dell'articolo restano da proporre e può
+# rispondere NEXT_VARIANT per vedere la prossima, già generata in background.
+NEXT_VARIANT = "next_variant"
+
+def interactive_review(article, variants_left=0):
+    print("\n📝 ARTICOLO GENERATO:\n")
+    print(article)
+    if variants_left:
+        feedback = input(f"\n🧑 Vuoi rigenerarlo? (v = prossima variante, ne restano {variants_left} / "
+                         "p = nuovo prompt / no): ").strip().lower()
+        if feedback in ["v", "variante"]:
+            return NEXT_VARIANT
+    else:
+        feedback = input("\n🧑 Vuoi rigenerarlo con un nuovo prompt? (sì/no): ").strip().lower()
+    if feedback in ["sì", "si", "y", "yes", "p", "prompt"]:
+        return input("Inserisci il nuovo prompt per l'articolo: ").strip()
+    return None
+
+def interactive_suggestion(suggestions):
+    feedback = input("\n🧑 Vuoi generare un articolo su uno di questi suggerimenti? (sì/no): ").strip().lower()
+    if feedback in ["sì", "si", "y", "yes"]:
+        return input("Inserisci il titolo o il numero del suggerimento scelto: ").strip()
+    print("\n👍 Va bene, torno al nodo assistant.")
+    return None
+
+def auto_review(article, variants_left=0):
+    return None  # L'articolo viene sempre accettato
+
+def auto_suggestion(suggestions):
+    # Si sceglie sempre il primo suggerimento, usando il suo titolo (il solo numero diventerebbe il topic "1")
+    lines = [line.strip() for line in (suggestions or "").splitlines() if line.strip()]
+    first = next((line for line in lines if re.match(r"\d+[.)]", line)), lines[0] if lines else "")
+    return re.sub(r"^\d+[.)]\s*", "", first).replace("**", "").strip() or None
+
+def interrupt_review(article, variants_left=0):
+    # Alla ripresa il valore di resume può essere "", un nuovo prompt, {"prompt": "..."} oppure {"next_variant": true}
+    from langgraph.types import interrupt
+    decision = interrupt({"type": "article_review", "article": article, "variants_left": variants_left})
+    if isinstance(decision, dict):
+        decision = NEXT_VARIANT if decision.get("next_variant") else decision.get("prompt")
+    return decision or None
+
+def interrupt_suggestion(suggestions):
+    # Alla ripresa il valore di resume può essere "", il topic scelto oppure {"topic": "..."}
+    from langgraph.types import interrupt
+    decision = interrupt({"type": "suggestion", "suggestions": suggestions})
+    if isinstance(decision, dict):
+        decision = decision.get("topic")
+    return decision or None
+
+REVIEW_POLICIES = {
+    "interactive": {"review": interactive_review, "suggestion": interactive_suggestion, "variants": ARTICLE_VARIANTS},
+    "auto": {"review": auto_review, "suggestion": auto_suggestion},
+    "interrupt": {"review": interrupt_review, "suggestion": interrupt_suggestion, "variants": ARTICLE_VARIANTS},
+}
+review_policy = REVIEW_POLICIES[REVIEW_POLICY]
+
+def set_review_policy(policy):
+    """Imposta la policy di revisione: il nome di una policy registrata o un dict con 'review', 'suggestion'
+    e facoltativamente 'variants' (quante varianti dell'articolo preparare durante la revisione)."""
+    global review_policy
+    review_policy = REVIEW_POLICIES[policy] if isinstance(policy, str) else policy
 
 # === NODO PER LA REVISIONE UMANA DOPO LA GENERAZIONE DELL'ARTICOLO ===
-def human_review_node(state: MessagesState):
+def human_review_node(state: BlogState):
     msgs = state["messages"]
     for i in range(len(msgs)-1, -1, -1):
         msg = msgs[i]
         if isinstance(msg, AIMessage) and msg.tool_calls:
-            if any(call["name"] == "generate_article" for call in msg.tool_calls):
+            call = next((call for call in msg.tool_calls if call["name"] == "generate_article"), None)
+            if call:
                 article_content = msgs[i+1].content if i + 1 < len(msgs) else ""
-                print("\n📝 ARTICOLO GENERATO:\n")
-                print(article_content)
-                feedback = input("\n🧑 Vuoi rigenerarlo con un nuovo prompt? (sì/no): ").strip().lower()
-                if feedback in ["sì", "si", "y", "yes"]:
-                    new_prompt = input("Inserisci il nuovo prompt per l'articolo: ").strip()
-                    return {"messages": [HumanMessage(content=new_prompt)]}
+                variants = review_policy.get("variants", 0)
+                if variants:
+                    # Le varianti partono ora, mentre l'editor legge la bozza
+                    prompt, shown = call["args"]["prompt"], call["args"].get("variant", 0)
+                    get_variants().prefetch(prompt, generate_variant, variants)
+                    new_prompt = review_policy["review"](article_content, max(0, variants - shown))
                 else:
-                    return {"messages": msgs}
-    return {"messages": msgs}
+                    new_prompt = review_policy["review"](article_content)
+                if new_prompt == NEXT_VARIANT and variants:
+                    variant = get_variants().get(prompt, shown, generate_variant)
+                    if variant:
+                        args = {"prompt": prompt, "variant": shown + 1, "angle": variant[0]}
+                        return {"messages": tool_exchange(generate_article, args, variant[1]), "review_again": True}
+                    new_prompt = None
+                if new_prompt:
+                    return {"messages": [HumanMessage(content=new_prompt, name=REVIEW_PROMPT)], "review_again": False}
+                else:
+                    return {"messages": msgs, "review_again": False}
+    return {"messages": msgs, "review_again": False}
 # Questo nodo si occupa della revisione umana, lo human in the loop,in particolare viene fatto un controllo per vedere se l'ultimo messaggio AI ha invocato il tool generate_article.
 # se avviene questa cosa, viene generato l'articolo richiesto da prompt e con esso si da all'utente la possibilità di rigenerarlo con un nuovo prompt.
 # la decisione di inserire un nuovo prompt è per dare più libertà all'utente che può decidere come farlo, dando delle specifiche e forzando il prompt. Nel caso in cui
 #l'utente decide di non rigenerarlo viene ripristinato il grafo e si torna al nodo dell'assistente tramite la condizione output router.
+# Se la policy prepara delle varianti, "prossima variante" aggiunge la variante come nuova uscita di generate_article
+# (con il numero e il taglio negli argomenti) e il nodo torna su se stesso per farla rivedere.
 
 # === NODO PER LA GESTIONE DEI SUGGERIMENTI ===
 def deal_with_suggestion(state: MessagesState):
@@ -202,15 +316,13 @@ def deal_with_suggestion(state: MessagesState):
 
     if last_ai_message:
         
-        # Chiedi all'utente se vuole generare un articolo
-        feedback = input("\n🧑 Vuoi generare un articolo su uno di questi suggerimenti? (sì/no): ").strip().lower()
-        if feedback in ["sì", "si", "y", "yes"]:
-            # Chiedi quale articolo generare
-            topic = input("Inserisci il titolo o il numero del suggerimento scelto: ").strip()
+        # Chiedi alla policy di revisione se generare un articolo e su quale suggerimento
+        suggestions = latest_tool_output(msgs, "suggest_articles") or ""
+        topic = review_policy["suggestion"](suggestions)
+        if topic:
             prompt = f"Genera un articolo sul topic: {topic}"
             return {"messages": [HumanMessage(content=prompt)]}
         else:
-            print("\n👍 Va bene, torno al nodo assistant.")
             return {"messages": msgs}
 
     # Se non ci sono suggerimenti validi, torna al nodo assistant
@@ -219,6 +331,58 @@ def deal_with_suggestion(state: MessagesState):
 #verrà aggiunto un nuovo messaggio umano con il prompt per generare l'articolo. In ogni caso si torna al nodo dell'assistente.
 #Ma se è stato aggiunto il messsaggio, il nodo assistant lo gestirà e lo passerà al tool generate_article.
 
+# === NODO PER LA VERIFICA PARALLELA DELLE FONTI ===
+async def averify_sources(state: MessagesState):
+    """Valuta e verifica in parallelo tutte le fonti dell'ultima web_search, poi genera un unico report."""
+    msgs = state["messages"]
+    search_output = latest_tool_output(current_turn(msgs), "web_search")
+    article = latest_tool_output(msgs, "generate_article")
+    sources = [{"url": url, "content": snippet} for url, snippet in
+               re.findall(r"^- (https?://\S+)\n  → (.*)$", search_output or "", re.MULTILINE)]
+    if not sources or not article:
+        return {"messages": []}
+    # Le fonti già scaricate si confrontano sul testo della pagina, le altre sullo snippet della ricerca
+    for source in sources:
+        source["content"] = get_index().page_text(source["url"]) or source["content"]
+    # Le copie si ricontrollano sul testo delle pagine, ma sono già state contate dalla ricerca
+    urls = [source["url"] for source in dedup(sources, record=False)]
+
+    semaphore = asyncio.Semaphore(VERIFY_CONCURRENCY)
+
+    async def call_llm(messages, stream_label=None):
+        async with semaphore:
+            return await ainvoke_cached(get_llm(), messages, stream_label=stream_label)
+
+    async def verify(url):
+        evaluation = await aevaluate_with_reputation(url, lambda: call_llm(evaluation_messages(DOMAIN, url)),
+                                                     blog=DOMAIN["name"])
+        verdicts = await acheck_claims(article, url, evaluation, call_llm,
+                                       passages_for=lambda text: source_passages(text, url))
+        return f"Fonte: {url}\nValutazione: {evaluation}\nFact-checking per affermazione:\n{format_verdicts(verdicts)}"
+
+    checked_sources = await asyncio.gather(*(verify(url) for url in urls))
+    report = await call_llm(report_messages(DOMAIN, "\n\n".join(checked_sources)), stream_label="report")
+    return {"messages": [AIMessage(content=report, name="verify_sources")]}
+
+def verify_sources(state: MessagesState):
+    return asyncio.run(averify_sources(state))
+# Questo nodo sostituisce la catena evaluate_source -> check_fact fatta una fonte alla volta dall'assistente.
+# Per ogni URL dell'ultima web_search la valutazione e il fact-checking partono insieme a quelli delle altre fonti
+# (al massimo VERIFY_CONCURRENCY chiamate contemporanee), e i risultati finiscono in un solo generate_report.
+# Così 5 fonti costano circa 2 round trip in sequenza invece di 10, e nessun turno di routing dell'LLM.
+# Il fact-checking è per affermazione: dopo una rigenerazione si riverificano solo le frasi nuove o modificate.
+
+# === ROUTER PER LA REVISIONE ===
+def review_router(state: BlogState) -> str:
+    # Se l'utente ha chiesto di rigenerare si torna all'assistente, altrimenti si verificano le fonti
+    if state.get("review_again"):
+        return "human_review"  # È stata mostrata una variante: la si rivede prima di andare avanti
+    if isinstance(state["messages"][-1], HumanMessage):
+        return "assistant"
+    if latest_tool_output(current_turn(state["messages"]), "web_search"):
+        return "verify_sources"  # solo se le fonti sono state cercate per questo articolo
+    return "assistant"
+
 # === ROUTER PER IL TOOL OUTPUT ===
 def tool_output_router(state: MessagesState) -> str:
     # Determina se deve andare a human_review, deal_with_suggestion o tornare all’assistente
@@ -235,70 +399,310 @@ def tool_output_router(state: MessagesState) -> str:
                 return "deal_with_suggestion"
     return "assistant"
 
-# === 
+# === CLASSIFICAZIONE DELLA RICHIESTA ===
+ARTICLE_REQUEST = re.compile(
+    r"\b(scriv\w*|genera\w*|crea\w*|prepara\w*|redig\w*|fammi)\b.*?\barticol[oi]\b"
+    r"(?:\s+(?:breve|corto|nuovo))?"
+    r"(?:\s+(?:di\s+)?(?:(?:al\s+)?massimo\s+|max\s+|circa\s+)?\d+\s+(?:parole|caratteri|righe))?"
+    r"(?:\s+(?:su|sul|sullo|sulla|sui|sugli|sulle|riguardo(?:\s+a)?|dedicato\s+a|che\s+parl[ia]\s+di|a\s+proposito\s+di)\s+(?P<topic>.+))?",
+    re.IGNORECASE | re.DOTALL
+)
+# Vincoli sull'articolo in coda al topic ("..., massimo 100 parole", "... in stile ironico"): non vanno nella ricerca.
+# Si taglia solo quando il vincolo è esplicito (un numero, una scadenza, un tono), perché i titoli contengono spesso
+# le stesse parole: "Mad Max: Fury Road", "Lunga vita alla signora", "Il buono, il brutto, il cattivo".
+_MONTHS = r"gennaio|febbraio|marzo|aprile|maggio|giugno|luglio|agosto|settembre|ottobre|novembre|dicembre"
+_WEEKDAYS = r"lunedì|martedì|mercoledì|giovedì|venerdì|sabato|domenica"
+_INLINE_CONSTRAINT = (
+    r"(?:\d+\s*(?:parole|caratteri|righe|battute)"
+    r"|(?:(?:al\s+)?massimo|max|non\s+più\s+di|circa|lung[oa])\s+(?:di\s+)?\d+"
+    rf"|entro\s+(?:(?:il|l')\s*\d{{1,2}}\s+(?:{_MONTHS})|\d{{1,2}}[/.-]\d{{1,2}}|le\s+\d{{1,2}}(?:[:.]\d{{2}})?"
+    rf"|oggi|domani|stasera|{_WEEKDAYS}|fine\s+(?:giornata|settimana|mese))"
+    r"|(?:in|con)\s+(?:(?:un|uno)\s+)?(?:stile|tono)\s|in\s+(?:meno\s+di\s+)?\d+|in\s+(?:lingua\s+)?(?:italiano|inglese)"
+    r"|con\s+(?:al\s+)?massimo\s+\d+)"
+)
+_AFTER_COMMA = (rf"(?:{_INLINE_CONSTRAINT}|(?:tono|stile|registro|senza|breve|brevissimo|usa|usando)\b"
+                r"|per\s+(?:instagram|facebook|i\s+social|il\s+blog|la\s+newsletter)\b)")
+TOPIC_CONSTRAINTS = re.compile(rf"\s*[,;]\s*(?={_AFTER_COMMA})|\s+(?={_INLINE_CONSTRAINT})", re.IGNORECASE)
+FREE_FORM_HINTS = re.compile(r"\b(suggeri\w*|idee|riformula\w*|verific\w*|valuta\w*|report|fonte|fonti)\b", re.IGNORECASE)
+
+def classify_intent(text):
+    """Restituisce il topic se la richiesta è 'scrivi un articolo su X', altrimenti None."""
+    if FREE_FORM_HINTS.search(text):
+        return None
+    match = ARTICLE_REQUEST.search(text)
+    if match is None:
+        return None  # Nessuna richiesta di articolo: basta la regola, niente chiamata al modello
+    topic = TOPIC_CONSTRAINTS.split(match.group("topic") or "", 1)[0].strip(" .?!")
+    if topic:
+        return topic
+    # Caso ambiguo (si parla di un articolo ma il topic non è chiaro): breve chiamata al modello, in cache
+    messages = [
+        SystemMessage(content="Classifica la richiesta di un utente di un blog cinematografico. "
+                              'Rispondi solo in JSON: {"articolo": true/false, "topic": "topic dell\'articolo o stringa vuota"}'),
+        HumanMessage(content=text)
+    ]
+    try:
+        verdict = json.loads(invoke_cached(get_llm(), messages))
+    except (json.JSONDecodeError, TypeError):
+        return None
+    if not isinstance(verdict, dict) or not verdict.get("articolo"):
+        return None
+    return str(verdict.get("topic") or "").strip() or None
+
+def classify_request(state: BlogState):
+    last_human = next((msg for msg in reversed(state["messages"]) if isinstance(msg, HumanMessage)), None)
+    topic = classify_intent(last_human.content) if last_human else None
+    return {"topic": topic or "", "candidates": []}
+
+def intent_router(state: BlogState) -> str:
+    return "research" if state.get("topic") else "assistant"
+# Le richieste del tipo "scrivi un articolo su X" seguono il percorso veloce, tutte le altre il ciclo ReAct.
+# La classificazione usa prima le regole (regex in italiano); solo quando la richiesta parla di un articolo
+# senza un topic riconoscibile si fa una breve chiamata al modello, che comunque passa dalla cache.
+
+# === PERCORSO VELOCE: RICERCA, SCELTA DELLA FONTE, SCRAPING E GENERAZIONE ===
+TRUSTED_DOMAINS = {"imdb.com", "variety.com", "hollywoodreporter.com", "deadline.com", "indiewire.com",
+                   "mymovies.it", "comingsoon.it", "cinematografo.it", "badtaste.it", "bfi.org.uk"}
+
+def rank_sources(topic, results):
+    """Ordina i risultati di Tavily: punteggio di Tavily, parole del topic presenti e domini affidabili."""
+    words = {w for w in re.findall(r"\w+", topic.lower()) if len(w) > 2}
+    def score(result):
+        text = f"{result.get('title', '')} {result['content']}".lower()
+        overlap = sum(w in text for w in words) / len(words) if words else 0
+        domain = urlsplit(result["url"]).netloc.lower().removeprefix("www.")
+        trusted = any(domain == d or domain.endswith("." + d) for d in TRUSTED_DOMAINS)
+        return result.get("score", 0) + 0.5 * overlap + (0.3 if trusted else 0)
+    return [r["url"] for r in sorted(results, key=score, reverse=True)]
+
+def tool_exchange(tool_fn, args, content):
+    # Coppia tool_call/ToolMessage, identica a quella prodotta da assistant + ToolNode,
+    # così human_review, verify_sources e il contesto dell'assistente funzionano allo stesso modo
+    call_id = f"call_{uuid.uuid4().hex[:24]}"
+    return [
+        AIMessage(content="", tool_calls=[{"name": tool_fn.name, "args": args, "id": call_id}], id=str(uuid.uuid4())),
+        ToolMessage(content=content, name=tool_fn.name, tool_call_id=call_id, id=str(uuid.uuid4()))
+    ]
 
+def research_search(state: BlogState):
+    topic = state["topic"]
+    try:
+        results = tavily_search(topic) or []
+    except Exception as e:
+        return {"messages": tool_exchange(web_search, {"topic": topic}, f"Errore durante la ricerca: {str(e)}")}
+    content = format_search_results(topic, results) if results else "Nessun risultato utile trovato."
+    return {"messages": tool_exchange(web_search, {"topic": topic}, content),
+            "candidates": rank_sources(topic, results)}
+
+def research_scrape(state: BlogState):
+    # Le prime tre fonti vengono scaricate in parallelo e si usa la migliore andata a buon fine;
+    # tutte quelle scaricate finiscono nell'indice, così il fact-checking ne trova i passaggi
+    results = scrape_many(state["candidates"][:3])
+    for result in results:
+        if not result["error"]:
+            get_index().add_page(result["url"], result["text"])
+    for result in results:
+        if not result["error"]:
+            content = f"Contenuto estratto dal sito {result['url']}:\n\n{result['text'][:3000]}"
+            return {"messages": tool_exchange(scrape_website, {"url": result["url"]}, content)}
+    return {"messages": tool_exchange(scrape_website, {"url": state["candidates"][0]},
+                                      "Errore: impossibile scaricare il contenuto.")}
+
+def research_generate(state: BlogState):
+    request = next(msg.content for msg in reversed(state["messages"]) if isinstance(msg, HumanMessage))
+    source = latest_tool_output(state["messages"], "scrape_website") or ""
+    if not source.startswith("Errore"):
+        request = f"{request}\n\nUsa queste informazioni aggiornate:\n{source}"
+    args = {"prompt": request}
+    return {"messages": tool_exchange(generate_article, args, generate_article.invoke(args))}
+
+def research_router(state: BlogState) -> str:
+    return "scrape" if state.get("candidates") else END
+
+def after_research(state: BlogState) -> str:
+    # Se il percorso veloce non è arrivato all'articolo (nessun risultato) si torna al ciclo ReAct
+    last = state["messages"][-1]
+    return "human_review" if isinstance(last, ToolMessage) and last.name == "generate_article" else "assistant"
+
+def build_research_graph():
+    research_builder = StateGraph(BlogState)
+    research_builder.add_node("search", research_search)
+    research_builder.add_node("scrape", research_scrape)
+    research_builder.add_node("generate", research_generate)
+    research_builder.add_edge(START, "search")
+    research_builder.add_conditional_edges("search", research_router)
+    research_builder.add_edge("scrape", "generate")
+    research_builder.add_edge("generate", END)
+    return research_builder.compile()
+# Il system prompt impone già la sequenza web_search -> scrape_website -> generate_article, quindi per queste
+# richieste non serve far decidere all'LLM ogni passaggio: il sottografo esegue la sequenza direttamente e
+# l'unica chiamata all'LLM è quella che scrive l'articolo. La fonte viene scelta con un'euristica (rank_sources).
+# I messaggi prodotti sono gli stessi del ciclo ReAct, quindi la revisione umana e la verifica non cambiano.
 
-    
 # === COSTRUZIONE DEL GRAFO CONVERSAZIONALE ===
-memory = MemorySaver()  # Memoria interna per salvataggio stato conversazione
-builder = StateGraph(MessagesState)
-
-# Aggiunta dei nodi
-builder.add_node("assistant", assistant)
-builder.add_node("tools", ToolNode(tools))
-builder.add_node("human_review", human_review_node)
-builder.add_node("deal_with_suggestion", deal_with_suggestion)
-
-# Connessioni fra nodi
-builder.add_edge(START, "assistant")
-builder.add_conditional_edges("assistant", tools_condition)
-builder.add_conditional_edges("tools", tool_output_router)
-builder.add_edge("human_review", "assistant")
-builder.add_edge("deal_with_suggestion", "assistant")  
-builder.add_edge("assistant", END)
-
-# Compilazione del grafo
-react_graph_memory = builder.compile(checkpointer=memory)
+@lru_cache(maxsize=None)
+def get_graph(checkpoint_path=None, fast_path=True):
+    """Compila il grafo una sola volta per ogni configurazione (database dei checkpoint, percorso veloce)."""
+    from langgraph.prebuilt import tools_condition, ToolNode
+    from checkpointer import get_checkpointer
+
+    # Memoria su disco per salvataggio stato conversazione, compattata per ogni thread e condivisa con gli altri grafi
+    memory = get_checkpointer(checkpoint_path) if checkpoint_path else get_checkpointer()
+    builder = StateGraph(BlogState)
+
+    # Aggiunta dei nodi
+    builder.add_node("assistant", assistant)
+    builder.add_node("tools", ToolNode(tools))
+    builder.add_node("human_review", human_review_node)
+    builder.add_node("deal_with_suggestion", deal_with_suggestion)
+    builder.add_node("verify_sources", RunnableLambda(verify_sources, afunc=averify_sources))
+
+    # Connessioni fra nodi
+    if fast_path:
+        builder.add_node("classify_request", classify_request)
+        builder.add_node("research", build_research_graph())
+        builder.add_edge(START, "classify_request")
+        builder.add_conditional_edges("classify_request", intent_router)
+        builder.add_conditional_edges("research", after_research)
+    else:
+        builder.add_edge(START, "assistant")
+    builder.add_conditional_edges("assistant", tools_condition)
+    builder.add_conditional_edges("tools", tool_output_router)
+    builder.add_conditional_edges("human_review", review_router)
+    builder.add_edge("verify_sources", END)
+    builder.add_edge("deal_with_suggestion", "assistant")  
+    builder.add_edge("assistant", END)
+
+    # Compilazione del grafo
+    return builder.compile(checkpointer=memory)
+
+# Compatibilità con il codice che usava gli oggetti globali del modulo (Agent_AI.llm, Agent_AI.react_graph_memory, ...):
+# vengono creati solo quando qualcuno li legge davvero.
+_LAZY_ATTRIBUTES = {
+    "llm": get_llm,
+    "client": get_client,
+    "llm_with_tools": get_llm_with_tools,
+    "react_graph_memory": get_graph,
+    "memory": lambda: get_graph().checkpointer,
+}
+
+def __getattr__(name):
+    if name in _LAZY_ATTRIBUTES:
+        return _LAZY_ATTRIBUTES[name]()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+# === STREAMING DEL FLUSSO SU CONSOLE ===
+STREAMED_OUTPUTS = {"generate_article", "generate_report", "verify_sources"}
+
+def stream_turn(graph, user_input, config):
+    """Esegue un turno mostrando nodi e token man mano che arrivano; restituisce i tool invocati nel turno."""
+    user_msg = HumanMessage(content=user_input, id=str(uuid.uuid4()))
+    seen = {msg.id for msg in graph.get_state(config).values.get("messages", [])} | {user_msg.id}
+    tool_calls = []
+    streamed = False
+    # subgraphs=True serve a vedere anche i nodi e i token del sottografo del percorso veloce
+    for _, mode, chunk in graph.stream({"messages": [user_msg]}, config,
+                                       stream_mode=["debug", "messages", "updates"], subgraphs=True):
+        if mode == "debug" and chunk["type"] == "task":
+            print(f"\n⏳ In esecuzione: {chunk['payload']['name']}", flush=True)
+        elif mode == "messages":
+            token, metadata = chunk
+            label = metadata.get("stream_label")
+            if label and token.content:
+                if not streamed:
+                    print(f"\n✍️ {label.upper()}:\n", flush=True)
+                    streamed = True
+                print(token.content, end="", flush=True)
+        elif mode == "updates":
+            for node, update in chunk.items():
+                if not isinstance(update, dict):
+                    continue  # Ad esempio gli interrupt, che non contengono messaggi
+                for msg in update.get("messages", []):
+                    if msg.id is not None and msg.id in seen:
+                        continue  # Messaggio già mostrato in un turno precedente
+                    seen.add(msg.id)
+                    if isinstance(msg, AIMessage) and msg.tool_calls:
+                        for call in msg.tool_calls:
+                            print(f"\n🔧 Tool: {call['name']}  Args: {call['args']}", flush=True)
+                            tool_calls.append(call)
+                    elif streamed and msg.name in STREAMED_OUTPUTS:
+                        print(f"\n{'-'*50}")  # Contenuto già mostrato token per token
+                    else:
+                        print(f"\n🤖 {msg.type.upper()}:\n{msg.content}\n{'-'*50}")
+            streamed = False
+    return tool_calls
+# Invece di aspettare la fine del grafo e ristampare tutta la storia del thread, il turno viene eseguito in streaming:
+# si vede quale nodo è in esecuzione, i token di articolo e report compaiono appena generati (le chiamate LLM
+# marcate con stream_label) e dei messaggi si stampano solo quelli nuovi, riconosciuti tramite il loro id.
 
 # === CONFIGURAZIONE E LOOP INTERATTIVO ===
-config = {
-    "configurable": {
-        "thread_id": str(uuid.uuid4()), # Genera un ID unico per il thread, l'implementazione che specificava un intero come id sembrava non funzionare correttamente
-        "checkpoint_ns": "article_checkpoints",
-        "checkpoint_id": "article_1"
+def main():
+    # Passando un thread_id da riga di comando si riprende una conversazione salvata, anche dopo un riavvio
+    thread_id = sys.argv[1] if len(sys.argv) > 1 else str(uuid.uuid4()) # Genera un ID unico per il thread, l'implementazione che specificava un intero come id sembrava non funzionare correttamente
+    config = {
+        "configurable": {
+            # checkpoint_ns e checkpoint_id non vanno fissati: con un checkpoint_id inesistente ogni turno ripartiva da zero
+            "thread_id": thread_id
+        },
+        "callbacks": [get_telemetry()]  # Span di nodi, tool e chiamate LLM in telemetry/
     }
-}
 
-print("\nBenvenuto! Scrivi una richiesta legata al blog di cinema. Scrivi 'no', 'basta' o 'esci' per terminare.\n")
+    react_graph_memory = get_graph()
+    if react_graph_memory.checkpointer.thread_exists(thread_id):
+        print(f"\n🔁 Riprendo la conversazione {thread_id}.")
+    else:
+        print(f"\n🆕 Nuova conversazione {thread_id} (usa questo id per riprenderla).")
+    print("\nBenvenuto! Scrivi una richiesta legata al blog di cinema. Scrivi 'no', 'basta' o 'esci' per terminare.\n")
 
-while True:
-    user_input = input("Tu: ").strip()
-    if re.search(r"\b(no|basta|esci|niente|stop)\b", user_input.lower()):
-        print("Va bene! Alla prossima.")
-        break
+    while True:
+        user_input = input("Tu: ").strip()
+        if re.search(r"\b(no|basta|esci|niente|stop)\b", user_input.lower()):
+            print("Va bene! Alla prossima.")
+            break
 
     
-    output = react_graph_memory.invoke({"messages": [HumanMessage(content=user_input)]}, config)
-    
- # Stampa messaggi generati
-    for msg in output["messages"]:
-        print(f"\n🤖 {msg.type.upper()}:\n{msg.content}\n{'-'*50}")
-
-    # Tracciamento dei tool invocati
-    tool_invoked = False
-    print("\n🔧 TOOL INVOCATI DURANTE IL FLUSSO:")
-    for msg in output["messages"]:
-        if isinstance(msg, AIMessage) and msg.tool_calls:
+        # Esecuzione in streaming: i messaggi nuovi vengono stampati man mano
+        turn_tool_calls = stream_turn(react_graph_memory, user_input, config)
+
+        # Tracciamento dei tool invocati in questo turno
+        tool_invoked = False
+        print("\n🔧 TOOL INVOCATI DURANTE IL FLUSSO:")
+        for call in turn_tool_calls:
             tool_invoked = True
-            for call in msg.tool_calls:
-                print(f"- Tool: {call['name']}")
-                print(f"  Args: {call['args']}")
-                print("-" * 40)
-
-    if not tool_invoked:
-        print("Nessun tool è stato invocato.")
-
-    follow_up = input("\n🤖 Posso aiutarti con qualcos'altro? (sì / no): ").strip().lower()
-    if follow_up not in ["sì", "si", "y", "yes"]:
-        print("Ok! Alla prossima.")
-        break
\ No newline at end of file
+            print(f"- Tool: {call['name']}")
+            print(f"  Args: {call['args']}")
+            print("-" * 40)
+
+        if not tool_invoked:
+            print("Nessun tool è stato invocato.")
+
+        stats = get_cache().stats()
+        print(f"\n💾 Cache LLM: {stats['hits']} hit, {stats['misses']} miss, {stats['entries']} voci salvate")
+        stats = dedup_stats.stats()
+        if stats["removed"]:
+            print(f"🧹 Copie scartate: {stats['removed']} risultati su {stats['seen']} ({stats['reduction']:.0%} di verifiche in meno)")
+        for backend in ("openai", "tavily"):
+            stats = get_backend(backend).stats()
+            if stats["retries"]:
+                print(f"🚦 {backend}: {stats['retries']} retry, {stats['throttled']} risposte 429, concorrenza {stats['concurrency']}")
+        stats = get_reputation(DOMAIN["name"]).stats()
+        if stats["hits"]:
+            print(f"🏷️  Reputazione fonti: {stats['hits']} valutazioni senza LLM, {stats['misses']} con LLM")
+        stats = get_claim_store().stats()
+        if stats["checked"] or stats["reused"]:
+            print(f"🔎 Affermazioni: {stats['checked']} verificate con l'LLM, {stats['reused']} riusate da verifiche precedenti")
+        stats = get_variants().stats()
+        if stats["served"]:
+            print(f"🔀 Varianti: {stats['served']} proposte su {stats['started']} preparate, {stats['waited_s']} s di attesa")
+        stats = get_index().stats()
+        print(f"📚 Indice locale: {stats['hits']} ricerche servite, {stats['misses']} su Tavily, {stats['documents']} documenti")
+        get_telemetry().export_metrics()
+
+        follow_up = input("\n🤖 Posso aiutarti con qualcos'altro? (sì / no): ").strip().lower()
+        if follow_up not in ["sì", "si", "y", "yes"]:
+            print("Ok! Alla prossima.")
+            break
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+import sys
+import json
+import time
+import uuid
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+
+from langchain_core.messages import HumanMessage, AIMessage
+from langgraph.types import Command
+
+import Agent_AI
+from Agent_AI import get_graph, latest_tool_output, set_review_policy
+from telemetry import get_telemetry
+
+# === ESECUZIONE HEADLESS DI UNA SINGOLA RICHIESTA ===
+def run_request(request):
+    """Esegue una richiesta di articolo sul grafo e restituisce il risultato da scrivere nel JSONL di output."""
+    result = {"id": None, "thread_id": None, "status": "done", "error": None}
+    try:
+        result["id"] = request.get("id")
+        thread_id = result["thread_id"] = request.get("thread_id") or str(uuid.uuid4())
+        if "resume" in request:
+            graph_input = Command(resume=request["resume"])  # Ripresa di un thread fermo su un interrupt
+        else:
+            graph_input = {"messages": [HumanMessage(content=request["prompt"])]}
+    except (AttributeError, KeyError, TypeError, ValueError) as e:
+        # Una riga sbagliata produce solo il suo errore: il resto del batch prosegue
+        result.update(status="error", error=f"richiesta non valida ({type(e).__name__}: {e}): {str(request)[:200]}",
+                      timings={"total_s": 0.0, "nodes_s": {}})
+        return result
+    config = {"configurable": {"thread_id": thread_id}, "callbacks": [get_telemetry()]}
+
+    node_timings = {}
+    paused = None
+    react_graph_memory = get_graph()
+    start = last = time.perf_counter()
+    try:
+        for update in react_graph_memory.stream(graph_input, config, stream_mode="updates"):
+            now = time.perf_counter()
+            for node in update:
+                if node == "__interrupt__":
+                    paused = [item.value for item in update[node]]
+                else:
+                    node_timings[node] = node_timings.get(node, 0.0) + (now - last)
+            last = now
+    except Exception as e:
+        result["status"] = "error"
+        result["error"] = str(e)
+
+    msgs = react_graph_memory.get_state(config).values.get("messages", [])
+    result["article"] = latest_tool_output(msgs, "generate_article")
+    result["report"] = next((msg.content for msg in reversed(msgs)
+                             if isinstance(msg, AIMessage) and msg.name == "verify_sources"), None)
+    result["tools"] = [{"name": call["name"], "args": call["args"]}
+                       for msg in msgs if isinstance(msg, AIMessage) and msg.tool_calls
+                       for call in msg.tool_calls]
+    result["timings"] = {"total_s": round(time.perf_counter() - start, 3),
+                         "nodes_s": {node: round(t, 3) for node, t in node_timings.items()}}
+    if paused and result["status"] == "done":
+        result["status"] = "paused"
+        result["interrupt"] = paused
+    return result
+
+# Ogni richiesta ha il suo thread_id, quindi più articoli possono essere prodotti in parallelo sullo stesso grafo
+# senza che le conversazioni si mescolino. Con la policy "interrupt" la richiesta si ferma alla revisione con
+# status "paused": per riprenderla basta una riga {"thread_id": ..., "resume": ...} nel file di input.
+
+
+# === ESECUZIONE DEL BATCH ===
+def run_batch(input_path, output_path, workers=4):
+    requests = []
+    with open(input_path, encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                try:
+                    requests.append(json.loads(line))
+                except ValueError:
+                    requests.append(line.strip())  # JSON non valido: run_request lo segnala come errore
+
+    with ThreadPoolExecutor(max_workers=workers) as pool, open(output_path, "a", encoding="utf-8") as out:
+        for result in pool.map(run_request, requests):
+            out.write(json.dumps(result, ensure_ascii=False) + "\n")
+            out.flush()
+            get_telemetry().export_metrics()
+            print(f"[{result['status']}] {result['id'] or result['thread_id']} ({result['timings']['total_s']}s)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Produce articoli in batch da un file JSONL di richieste, senza input da terminale.")
+    parser.add_argument("input", help="JSONL con righe {\"id\": ..., \"prompt\": ...} oppure {\"thread_id\": ..., \"resume\": ...}")
+    parser.add_argument("output", help="JSONL in cui aggiungere i risultati")
+    parser.add_argument("--workers", type=int, default=4, help="numero di richieste eseguite in parallelo")
+    parser.add_argument("--policy", choices=sorted(Agent_AI.REVIEW_POLICIES), default="auto",
+                        help="policy di revisione umana (auto accetta sempre, interrupt mette in pausa)")
+    args = parser.parse_args()
+    if args.policy == "interactive":
+        sys.exit("La policy interactive richiede un terminale: usa auto oppure interrupt.")
+
+    set_review_policy(args.policy)
+    run_batch(args.input, args.output, workers=args.workers)
+
+
+if __name__ == "__main__":
+    main()
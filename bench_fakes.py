@@ -0,0 +1,250 @@
+import os
+import re
+import json
+import time
+import asyncio
+import hashlib
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, HumanMessage, ToolMessage
+from langchain_core.outputs import ChatGeneration, ChatResult
+
+FIXTURES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures")
+
+
+def estimate_tokens(text):
+    return len(text) // 4 + 1
+
+
+# === LLM FINTO ===
+class FakeChatModel(BaseChatModel):
+    """Sostituto deterministico di ChatOpenAI: risposte scriptate, latenza e token configurabili."""
+
+    model_name: str = "fake-gpt-4o-mini"
+    temperature: float = 0.0
+    latency: float = 0.05  # secondi per chiamata
+    completion_tokens: int = 180  # lunghezza indicativa di articoli e report
+    bound_tools: list = []
+    stats: dict = {}
+    server_url: str = ""  # se impostato, ogni chiamata passa dal FixtureServer, che può rispondere 429
+
+    @property
+    def _llm_type(self):
+        return "fake-chat"
+
+    def bind_tools(self, tools, **kwargs):
+        # La copia condivide il dict stats, così le chiamate di routing e quelle dei tool vengono contate insieme
+        return self.model_copy(update={"bound_tools": [t.name for t in tools]})
+
+    def _respond(self, messages):
+        if self.bound_tools:
+            return self._route(messages)
+        system = " ".join(m.content for m in messages if m.type == "system").lower()
+        words = self.completion_tokens * 3 // 4
+        if "valutatore" in system:
+            content = '{"score": 8, "comment": "Fonte specializzata e aggiornata."}'
+        elif "affermazioni" in system:
+            # Un verdetto per ogni affermazione numerata del messaggio
+            ids = re.findall(r"^(\d+)\. ", messages[-1].content, re.MULTILINE)
+            content = json.dumps({"verdicts": [{"id": int(i), "verdict": "confermata",
+                                                "explanation": "La fonte riporta lo stesso fatto."} for i in ids]})
+        elif "fact-checker" in system:
+            content = "La fonte conferma i fatti principali dell'articolo, senza discrepanze rilevanti."
+        elif "classifica" in system:
+            content = '{"articolo": false, "topic": ""}'
+        elif "riassumi" in system:
+            content = "L'utente ha chiesto articoli di cinema; sono state usate fonti web e generati articoli."
+        elif "editor creativo" in system:
+            content = "\n".join(f"{i}. Idea di articolo numero {i}" for i in range(1, 6))
+        elif "editor" in system:
+            content = "Report: l'articolo è affidabile. " + " ".join(["Suggerimento"] * words)
+        else:
+            content = "Articolo: " + " ".join(["cinema"] * words)
+        return AIMessage(content=content)
+
+    def _route(self, messages):
+        # Routing scriptato dell'assistente, che segue la sequenza imposta dal system prompt
+        self.stats["route_calls"] = self.stats.get("route_calls", 0) + 1
+        last = messages[-1]
+        call_id = f"call_{self.stats['route_calls']}"
+        if isinstance(last, HumanMessage):
+            previous = messages[-2] if len(messages) > 1 else None
+            if isinstance(previous, ToolMessage) and previous.name == "generate_article":
+                call = {"name": "generate_article", "args": {"prompt": last.content}}  # rigenerazione
+            elif "suggeri" in last.content.lower():
+                call = {"name": "suggest_articles", "args": {}}
+            else:
+                call = {"name": "web_search", "args": {"topic": last.content}}
+        elif isinstance(last, ToolMessage) and last.name == "web_search":
+            urls = re.findall(r"^- (\S+)", last.content, re.MULTILINE)
+            call = {"name": "scrape_website", "args": {"url": urls[0] if urls else ""}}
+        elif isinstance(last, ToolMessage) and last.name == "scrape_website":
+            prompt = next(m.content for m in reversed(messages) if isinstance(m, HumanMessage))
+            call = {"name": "generate_article", "args": {"prompt": prompt}}
+        else:
+            return AIMessage(content="")
+        return AIMessage(content="", tool_calls=[{**call, "id": call_id}])
+
+    def _result(self, messages):
+        message = self._respond(messages)
+        prompt_tokens = sum(estimate_tokens(str(m.content)) for m in messages)
+        completion_tokens = estimate_tokens(message.content) + 10 * len(message.tool_calls)
+        message.usage_metadata = {"input_tokens": prompt_tokens, "output_tokens": completion_tokens,
+                                  "total_tokens": prompt_tokens + completion_tokens}
+        self.stats["calls"] = self.stats.get("calls", 0) + 1
+        self.stats["prompt_tokens"] = self.stats.get("prompt_tokens", 0) + prompt_tokens
+        return ChatResult(
+            generations=[ChatGeneration(message=message)],
+            llm_output={"model_name": self.model_name,
+                        "token_usage": {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens,
+                                        "total_tokens": prompt_tokens + completion_tokens}},
+        )
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+        if self.server_url:
+            import httpx
+            httpx.post(f"{self.server_url}/v1/chat/completions").raise_for_status()
+        time.sleep(self.latency)
+        return self._result(messages)
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs):
+        if self.server_url:
+            import httpx
+            async with httpx.AsyncClient() as client:
+                (await client.post(f"{self.server_url}/v1/chat/completions")).raise_for_status()
+        await asyncio.sleep(self.latency)
+        return self._result(messages)
+
+
+# === TAVILY FINTO ===
+# Snippet diversi per ogni fonte: snippet quasi identici verrebbero giustamente scartati come copie
+SNIPPET_ANGLES = (
+    "trama, cast e personaggi principali del film",
+    "la regia, la fotografia e le scelte di montaggio",
+    "come la critica internazionale ha accolto l'uscita",
+    "incassi al botteghino in Italia e nel mondo",
+    "premi vinti, candidature e riconoscimenti ai festival",
+)
+class FakeTavilyClient:
+    """Sostituto di TavilyClient.search che restituisce pagine servite dal FixtureServer."""
+
+    def __init__(self, base_url, latency=0.2, n_results=5, via_server=False):
+        self.base_url = base_url
+        self.latency = latency
+        self.n_results = n_results
+        self.via_server = via_server  # come per l'LLM finto, la richiesta passa dal server che può rispondere 429
+        self.calls = 0
+
+    def search(self, query, max_results=5, **kwargs):
+        if self.via_server:
+            # Stessi errori di tavily-python: il 429 diventa UsageLimitExceededError, senza codice HTTP
+            import httpx
+            from tavily.errors import UsageLimitExceededError
+            response = httpx.post(f"{self.base_url}/search")
+            if response.status_code == 429:
+                raise UsageLimitExceededError("rate limit exceeded")
+            response.raise_for_status()
+        time.sleep(self.latency)
+        self.calls += 1
+        return {"query": query, "results": [
+            {"url": f"{self.base_url}/article/{i}", "title": f"{query} - recensione {i}",
+             "content": f"{query}: {SNIPPET_ANGLES[i % len(SNIPPET_ANGLES)]} (fonte {i}).",
+             "score": round(0.9 - 0.1 * i, 2)}
+            for i in range(min(max_results, self.n_results))
+        ]}
+
+
+# === SERVER HTTP LOCALE CON LE PAGINE DI PROVA ===
+class FixtureServer:
+    """Server HTTP locale: /article/<n> serve le pagine in fixtures/pages, /html/ la pagina di DuckDuckGo salvata.
+
+    Le POST a /search e /v1/chat/completions simulano le API di Tavily e OpenAI: con throttle_every=N una
+    richiesta ogni N riceve 429 con Retry-After, come quando si supera il limite del fornitore.
+    """
+
+    def __init__(self, latency=0.0, api_latency=0.0, throttle_every=0, retry_after=0.05):
+        self.latency = latency
+        self.api_latency = api_latency
+        self.throttle_every = throttle_every
+        self.retry_after = retry_after
+        self.requests = 0
+        self.api_requests = 0
+        self.throttled = 0
+        self.connections = 0
+        self._lock = threading.Lock()
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"  # keep-alive, come i server veri: si vede se i client riusano le connessioni
+
+            def setup(self):
+                super().setup()
+                with server._lock:
+                    server.connections += 1
+
+            def do_POST(self):
+                with server._lock:
+                    server.api_requests += 1
+                    throttle = server.throttle_every and server.api_requests % server.throttle_every == 0
+                    server.throttled += bool(throttle)
+                time.sleep(server.api_latency)
+                if throttle:
+                    self.send_response(429)
+                    self.send_header("Retry-After", str(server.retry_after))
+                    self.send_header("Content-Length", "0")
+                    self.end_headers()
+                    return
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", "2")
+                self.end_headers()
+                self.wfile.write(b"{}")
+
+            def do_GET(self):
+                server.requests += 1
+                time.sleep(server.latency)
+                path = server.resolve(self.path)
+                if path is None:
+                    self.send_error(404)
+                    return
+                with open(path, "rb") as f:
+                    body = f.read()
+                etag = '"' + hashlib.md5(body).hexdigest() + '"'
+                if self.headers.get("If-None-Match") == etag:
+                    self.send_response(304)
+                    self.send_header("ETag", etag)
+                    self.send_header("Content-Length", "0")
+                    self.end_headers()
+                    return
+                self.send_response(200)
+                self.send_header("Content-Type", "text/html; charset=utf-8")
+                self.send_header("Content-Length", str(len(body)))
+                self.send_header("ETag", etag)
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self._httpd = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.base_url = f"http://127.0.0.1:{self._httpd.server_address[1]}"
+
+    def resolve(self, path):
+        path = path.split("?")[0]
+        if path.startswith("/html"):
+            return os.path.join(FIXTURES_DIR, "duckduckgo.html")
+        match = re.fullmatch(r"/article/(\d+)(?:/amp)?", path)
+        if match:
+            pages = sorted(os.listdir(os.path.join(FIXTURES_DIR, "pages")))
+            return os.path.join(FIXTURES_DIR, "pages", pages[int(match.group(1)) % len(pages)])
+        return None
+
+    def __enter__(self):
+        threading.Thread(target=self._httpd.serve_forever, daemon=True).start()
+        return self
+
+    def __exit__(self, *exc):
+        self._httpd.shutdown()
+        self._httpd.server_close()
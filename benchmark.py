@@ -0,0 +1,499 @@
+import os
+import sys
+import json
+import time
+import uuid
+import argparse
+import tempfile
+import threading
+import subprocess
+import tracemalloc
+from datetime import datetime
+
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.messages import HumanMessage, AIMessage, ToolMessage
+from langchain_core.runnables import RunnableLambda
+
+from bench_fakes import FakeChatModel, FakeTavilyClient, FixtureServer, FIXTURES_DIR
+from dedup import dedup, dedup_stats
+from governor import get_backend
+
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "bench_results")
+
+
+# === RACCOLTA DELLE METRICHE ===
+class BenchCollector(BaseCallbackHandler):
+    """Callback che misura la durata di nodi e tool e conta chiamate LLM e token di prompt."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._starts = {}
+        self.nodes = {}
+        self.tools = {}
+        self.llm_calls = 0
+        self.prompt_tokens = 0
+
+    def on_chain_start(self, serialized, inputs, *, run_id, parent_run_id=None, metadata=None, **kwargs):
+        node = (metadata or {}).get("langgraph_node")
+        parent = self._starts.get(parent_run_id)
+        # Un nodo può essere avvolto in un altro runnable con lo stesso nome: si conta solo il più esterno
+        if node and kwargs.get("name") == node and not (parent and parent[1] == node):
+            self._starts[run_id] = (self.nodes, node, time.perf_counter())
+
+    def on_tool_start(self, serialized, input_str, *, run_id, **kwargs):
+        name = kwargs.get("name") or (serialized or {}).get("name", "tool")
+        self._starts[run_id] = (self.tools, name, time.perf_counter())
+
+    def on_chat_model_start(self, serialized, messages, *, run_id, **kwargs):
+        pass
+
+    def on_llm_end(self, response, *, run_id, **kwargs):
+        usage = (response.llm_output or {}).get("token_usage", {})
+        with self._lock:
+            self.llm_calls += 1
+            self.prompt_tokens += usage.get("prompt_tokens", 0)
+
+    def _finish(self, run_id):
+        start = self._starts.pop(run_id, None)
+        if start is not None:
+            target, name, t0 = start
+            with self._lock:
+                target.setdefault(name, []).append(time.perf_counter() - t0)
+
+    def on_chain_end(self, outputs, *, run_id, **kwargs):
+        self._finish(run_id)
+
+    def on_chain_error(self, error, *, run_id, **kwargs):
+        self._finish(run_id)
+
+    def on_tool_end(self, output, *, run_id, **kwargs):
+        self._finish(run_id)
+
+    def on_tool_error(self, error, *, run_id, **kwargs):
+        self._finish(run_id)
+
+
+def percentile(values, p):
+    if not values:
+        return None
+    ordered = sorted(values)
+    index = max(0, min(len(ordered) - 1, round(p / 100 * len(ordered) + 0.5) - 1))
+    return round(ordered[index], 4)
+
+
+def summarize_timings(samples):
+    return {name: {"p50": percentile(values, 50), "p95": percentile(values, 95), "count": len(values)}
+            for name, values in sorted(samples.items())}
+
+
+# === PREPARAZIONE DELL'AMBIENTE FINTO ===
+def setup_agent(server, llm_latency, search_latency, completion_tokens, via_server=False):
+    # Cache e checkpoint in una cartella temporanea, e chiavi finte: nessuna chiamata esterna
+    workdir = tempfile.mkdtemp(prefix="miniprojectai-bench-")
+    os.environ["LLM_CACHE_PATH"] = os.path.join(workdir, "llm_cache.sqlite")
+    os.environ["SCRAPE_CACHE_PATH"] = os.path.join(workdir, "scrape_cache.sqlite")
+    os.environ["CHECKPOINT_PATH"] = os.path.join(workdir, "checkpoints.sqlite")
+    os.environ["RETRIEVAL_INDEX_PATH"] = os.path.join(workdir, "retrieval.sqlite")
+    os.environ["REPUTATION_PATH"] = os.path.join(workdir, "reputation.sqlite")
+    os.environ["CLAIMS_PATH"] = os.path.join(workdir, "claims.sqlite")
+    os.environ["OPENAI_API_KEY"] = "bench-fake-key"
+    os.environ["TAVILY_API_KEY"] = "bench-fake-key"
+
+    import Agent_AI
+    # Con via_server le chiamate finte a OpenAI e Tavily passano dal server locale, che può rispondere 429
+    fake_llm = FakeChatModel(latency=llm_latency, completion_tokens=completion_tokens,
+                             server_url=server.base_url if via_server else "")
+    Agent_AI.configure_clients(llm=fake_llm, client=FakeTavilyClient(server.base_url, latency=search_latency,
+                                                                     via_server=via_server))
+    return Agent_AI
+
+
+def reset_caches(agent):
+    from llm_cache import get_cache
+    from scraper import get_scraper
+    from retrieval import get_index
+    from reputation import get_reputation
+    from claims import get_claim_store
+    get_cache().clear()
+    get_scraper().cache.clear()
+    get_index().clear()
+    get_reputation().clear()
+    get_claim_store().clear()
+
+
+# === SCENARI ===
+def run_graph(agent, prompt, policy, collector):
+    agent.set_review_policy(policy)
+    config = {"configurable": {"thread_id": str(uuid.uuid4())}, "callbacks": [collector]}
+    agent.get_graph().invoke({"messages": [HumanMessage(content=prompt)]}, config)
+
+
+def repeat_topic(agent, collector):
+    # Lo stesso film richiesto due volte con prompt diversi: la seconda ricerca deve arrivare dall'indice locale
+    run_graph(agent, "Scrivi un articolo su Oppenheimer", "auto", collector)
+    run_graph(agent, "Genera un articolo breve su Oppenheimer", "auto", collector)
+
+
+def run_fact_check_seeded(agent, collector):
+    # Il dominio delle fonti è già noto (come le testate di reputation_seed.csv): nessuna valutazione chiede all'LLM
+    from reputation import get_reputation
+    get_reputation().seed("127.0.0.1", 8, "Sito di prova con le pagine del benchmark.")
+    run_fact_check(agent, collector)
+
+
+def regenerate_once():
+    # Policy di revisione che chiede una rigenerazione e poi accetta
+    state = {"regenerated": False}
+    def review(article):
+        if state["regenerated"]:
+            return None
+        state["regenerated"] = True
+        return "Riscrivi l'articolo con un tono più ironico"
+    return review
+
+
+def next_variant_once(agent):
+    # Come regenerate_once, ma invece di un nuovo prompt chiede la prossima variante preparata in background
+    state = {"asked": False}
+    def review(article, variants_left=0):
+        if state["asked"] or not variants_left:
+            return None
+        state["asked"] = True
+        return agent.NEXT_VARIANT
+    return review
+
+
+FACT_CHECK_ARTICLE = (
+    "Oppenheimer è il film di Christopher Nolan uscito nel 2023. Cillian Murphy interpreta il fisico J. Robert "
+    "Oppenheimer, a capo del Progetto Manhattan. Il film ha vinto sette premi Oscar, tra cui miglior film e miglior "
+    "regia. La colonna sonora è firmata da Ludwig Göransson. Nel cast ci sono anche Emily Blunt, Matt Damon e "
+    "Robert Downey Jr.\nLe riprese sono state fatte in pellicola IMAX, anche in bianco e nero. Il film dura tre ore "
+    "e ha incassato oltre 950 milioni di dollari nel mondo."
+)
+# La revisione cambia una sola frase: il fact-checking deve riverificare solo quella
+FACT_CHECK_REVISION = FACT_CHECK_ARTICLE.replace("Il film dura tre ore", "Il film dura circa 180 minuti")
+
+
+def fact_check_revision(agent, collector):
+    run_fact_check(agent, collector, article=FACT_CHECK_ARTICLE)
+    run_fact_check(agent, collector, article=FACT_CHECK_REVISION)
+
+
+COPY_SUFFIXES = ("?utm_source=newsletter&utm_medium=email", "/amp", "?fbclid=bench#commenti")
+
+
+def run_fact_check(agent, collector, n_sources=5, copies=0, article="Oppenheimer di Christopher Nolan ha vinto sette premi Oscar."):
+    urls = [f"{agent.get_client().base_url}/article/{i}" for i in range(n_sources)]
+    # Copie della stessa fonte con parametri di tracciamento o in versione AMP, come capita con le notizie ripubblicate
+    urls += [urls[i % n_sources] + COPY_SUFFIXES[i % len(COPY_SUFFIXES)] for i in range(copies)]
+    # I risultati passano dalla stessa deduplica di web_search, che è anche il punto in cui le copie vengono contate
+    results = dedup([{"url": u, "content": "Oppenheimer..."} for u in urls])
+    call_id = "call_bench"
+    state = {"messages": [
+        HumanMessage(content="Scrivi un articolo su Oppenheimer"),
+        AIMessage(content="", tool_calls=[{"name": "web_search", "args": {"topic": "Oppenheimer"}, "id": call_id}]),
+        ToolMessage(content=agent.format_search_results("Oppenheimer", results), name="web_search", tool_call_id=call_id),
+        AIMessage(content="", tool_calls=[{"name": "generate_article", "args": {"prompt": "Oppenheimer"}, "id": call_id + "_2"}]),
+        ToolMessage(content=article, name="generate_article", tool_call_id=call_id + "_2"),
+    ]}
+    node = RunnableLambda(agent.verify_sources, afunc=agent.averify_sources, name="verify_sources")
+    node.invoke(state, config={"callbacks": [collector], "metadata": {"langgraph_node": "verify_sources"}})
+
+
+SCENARIOS = {
+    "single_article": lambda agent, c: run_graph(agent, "Scrivi un articolo su Dune parte due", "auto", c),
+    "react_article": lambda agent, c: run_graph(agent, "Mi serve un pezzo su Oppenheimer, usa le fonti più affidabili", "auto", c),
+    "suggestion_to_article": lambda agent, c: run_graph(agent, "Suggeriscimi qualche idea", "auto", c),
+    "regenerate_loop": lambda agent, c: run_graph(
+        agent, "Scrivi un articolo su Oppenheimer",
+        {"review": regenerate_once(), "suggestion": agent.auto_suggestion}, c),
+    "variant_loop": lambda agent, c: run_graph(
+        agent, "Scrivi un articolo su Oppenheimer",
+        {"review": next_variant_once(agent), "suggestion": agent.auto_suggestion, "variants": 2}, c),
+    "fact_check_5": run_fact_check,
+    "fact_check_copies": lambda agent, c: run_fact_check(agent, c, n_sources=5, copies=3),
+    "fact_check_seeded": run_fact_check_seeded,
+    "fact_check_revision": fact_check_revision,
+    "repeat_topic": repeat_topic,
+}
+# Ogni scenario riproduce un flusso reale del blog con LLM, Tavily e siti web finti: le latenze misurate
+# dipendono quindi solo dal codice del grafo e dalle latenze configurate, e sono confrontabili tra commit diversi.
+
+
+def governor_counters():
+    # Retry e risposte 429 gestiti dal governatore, sommati sui backend usati dal grafo
+    counters = [get_backend(name).stats() for name in ("openai", "tavily")]
+    return {key: sum(c[key] for c in counters) for key in ("retries", "throttled")}
+
+
+def run_scenario(agent, name, runs, warm):
+    from claims import get_claim_store
+    totals, nodes, tools, llm_calls, prompt_tokens, peaks, searches, duplicates = [], {}, {}, [], [], [], [], []
+    retries, claims = {}, []
+    for _ in range(runs):
+        if not warm:
+            reset_caches(agent)
+        collector = BenchCollector()
+        tracemalloc.reset_peak()
+        search_calls = agent.get_client().calls
+        dedup_stats.reset()
+        governed = governor_counters()
+        checked = get_claim_store().stats()["checked"]
+        start = time.perf_counter()
+        SCENARIOS[name](agent, collector)
+        totals.append(time.perf_counter() - start)
+        peaks.append(tracemalloc.get_traced_memory()[1])
+        for target, samples in ((nodes, collector.nodes), (tools, collector.tools)):
+            for key, values in samples.items():
+                target.setdefault(key, []).extend(values)
+        llm_calls.append(collector.llm_calls)
+        prompt_tokens.append(collector.prompt_tokens)
+        searches.append(agent.get_client().calls - search_calls)
+        duplicates.append(dedup_stats.stats()["removed"])
+        claims.append(get_claim_store().stats()["checked"] - checked)
+        for key, value in governor_counters().items():
+            retries[key] = retries.get(key, 0) + value - governed[key]
+    return {
+        "runs": runs,
+        "latency_s": {"p50": percentile(totals, 50), "p95": percentile(totals, 95)},
+        "nodes": summarize_timings(nodes),
+        "tools": summarize_timings(tools),
+        "llm_calls": sum(llm_calls) / runs,
+        "prompt_tokens": sum(prompt_tokens) / runs,
+        "search_calls": sum(searches) / runs,
+        "duplicates_removed": sum(duplicates) / runs,
+        "claims_checked": sum(claims) / runs,
+        "governor": {key: value / runs for key, value in retries.items()},
+        "peak_memory_kb": round(max(peaks) / 1024, 1),
+    }
+
+
+# === TEMPO DI IMPORT ===
+HEAVY_MODULES = ("langchain_openai", "openai", "tavily", "bs4", "requests", "langgraph.prebuilt",
+                 "langgraph.checkpoint.sqlite")
+
+def measure_import(module, repeats=3):
+    """Importa il modulo in un interprete nuovo e restituisce il tempo migliore e i moduli pesanti già caricati."""
+    code = (f"import sys, time; t0 = time.perf_counter(); import {module}; t = time.perf_counter() - t0; "
+            f"print(t); print(','.join(m for m in {HEAVY_MODULES!r} if m in sys.modules))")
+    env = {**os.environ, "OPENAI_API_KEY": "bench-fake-key", "TAVILY_API_KEY": "bench-fake-key"}
+    best, loaded = None, []
+    for _ in range(repeats):
+        out = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True, env=env,
+                             cwd=os.path.dirname(os.path.abspath(__file__))).stdout.splitlines()
+        best = min(best or float("inf"), float(out[0]))
+        loaded = [m for m in out[1].split(",") if m]
+    return {"seconds": round(best, 4), "heavy_modules": loaded}
+
+# Il tempo di import è quello pagato da ogni worker, test o server che usa il modulo: i client e il grafo vengono
+# creati solo al primo utilizzo, quindi qui non devono comparire langchain_openai, tavily o bs4.
+
+
+# === RICERCA SU DUCKDUCKGO (versione1) ===
+def bench_search(server, runs):
+    """Latenza e CPU per query del backend DuckDuckGo, sulla pagina salvata in fixtures/duckduckgo.html."""
+    from ddg_search import DuckDuckGoSearch, parse_results, _parse_with_bs4
+    with open(os.path.join(FIXTURES_DIR, "duckduckgo.html"), "rb") as f:
+        html = f.read()
+    chunks = [html[i:i + 8192] for i in range(0, len(html), 8192)]
+
+    def cpu_per_call(fn, repeats=200):
+        start = time.process_time()
+        for _ in range(repeats):
+            fn()
+        return round((time.process_time() - start) / repeats * 1000, 3)
+
+    # Il server è locale: il limite di richieste al minuto pensato per DuckDuckGo falserebbe le misure
+    from governor import TokenBucket
+    get_backend("duckduckgo").requests = TokenBucket(60000)
+    search = DuckDuckGoSearch(base_url=f"{server.base_url}/html/")
+    cold, warm, cpu = [], [], []
+    connections = server.connections
+    for i in range(runs):
+        search.clear()
+        start, cpu_start = time.perf_counter(), time.process_time()
+        search.search(f"tadej pogacar {i}")
+        cold.append(time.perf_counter() - start)
+        cpu.append(time.process_time() - cpu_start)
+        start = time.perf_counter()
+        search.search(f"Tadej  Pogacar {i}")  # stessa query normalizzata: dalla cache
+        warm.append(time.perf_counter() - start)
+    connections = server.connections - connections
+    search.clear()
+    start = time.perf_counter()
+    search.search_many([f"ciclismo {i}" for i in range(8)])
+    search_many_s = time.perf_counter() - start
+    return {
+        "parse_ms": {"lxml_first_5": cpu_per_call(lambda: parse_results(chunks, 5)),
+                     "bs4_full_page": cpu_per_call(lambda: _parse_with_bs4(html, 5), repeats=50)},
+        "cold_s": {"p50": percentile(cold, 50), "p95": percentile(cold, 95)},
+        "warm_s": {"p50": percentile(warm, 50), "p95": percentile(warm, 95)},
+        "cpu_ms_per_query": round(sum(cpu) / len(cpu) * 1000, 3),
+        "connections": connections,  # aperte per le ricerche cold: 1 se la sessione riusa la connessione
+        "search_many_8_s": round(search_many_s, 4),
+    }
+
+# Il parsing viene misurato sia con lxml (che si ferma ai primi risultati) sia con BeautifulSoup sull'intera
+# pagina, come faceva la versione precedente; cold_s passa dal server locale, warm_s dalla cache delle query.
+
+
+# === SERVER MULTI-DOMINIO (server.py) ===
+def bench_server(agent, sessions=8):
+    """Conversazioni sul dominio cinema via HTTP: prima una alla volta, poi tutte insieme sullo stesso processo."""
+    import asyncio
+    import http.client
+    from concurrent.futures import ThreadPoolExecutor
+    from server import BlogServer
+    blog = BlogServer(domains=["cinema"])
+    blog.load()
+    loop = asyncio.new_event_loop()
+    threading.Thread(target=loop.run_forever, daemon=True).start()
+    listener = asyncio.run_coroutine_threadsafe(
+        asyncio.start_server(blog.handle_connection, "127.0.0.1", 0), loop).result()
+    port = listener.sockets[0].getsockname()[1]
+
+    def conversation(topic):
+        conn = http.client.HTTPConnection("127.0.0.1", port, timeout=120)
+
+        def post(path, body):
+            conn.request("POST", path, json.dumps(body), {"Content-Type": "application/json"})
+            response = conn.getresponse()
+            return response.status, json.loads(response.read())
+
+        _, created = post("/sessions", {"domain": "cinema"})
+        status, result = post(f"/sessions/{created['session_id']}/messages",
+                              {"message": f"Scrivi un articolo su {topic}"})
+        while status == 200 and result["status"] == "paused":
+            status, result = post(f"/sessions/{created['session_id']}/resume", {"resume": ""})  # approva
+        conn.close()
+        return status == 200
+
+    # Argomenti diversi nelle due fasi, così la seconda non trova tutto nella cache LLM
+    start = time.perf_counter()
+    sequential = [conversation(f"Oppenheimer parte {i}") for i in range(sessions)]
+    sequential_s = time.perf_counter() - start
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=sessions) as pool:
+        concurrent = list(pool.map(conversation, [f"Dune parte {i}" for i in range(sessions)]))
+    concurrent_s = time.perf_counter() - start
+
+    async def shutdown():
+        listener.close()
+        await asyncio.sleep(0.1)  # le connessioni chiuse dai client terminano prima che il loop si fermi
+
+    asyncio.run_coroutine_threadsafe(shutdown(), loop).result()
+    loop.call_soon_threadsafe(loop.stop)
+    return {"sessions": sessions, "ok": all(sequential + concurrent), "sequential_s": round(sequential_s, 4),
+            "concurrent_s": round(concurrent_s, 4), "sessions_per_s": round(sessions / concurrent_s, 2)}
+
+# Le sessioni passano dall'API HTTP con la policy di revisione "interrupt", come in produzione: ogni articolo
+# viene approvato con /resume. Il server imposta la policy sul modulo, quindi va misurato dopo gli scenari.
+
+
+# === SALVATAGGIO E CONFRONTO ===
+def current_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def save_results(results):
+    os.makedirs(RESULTS_DIR, exist_ok=True)
+    path = os.path.join(RESULTS_DIR, f"{datetime.now():%Y%m%d-%H%M%S}_{results['commit']}.json")
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(results, f, indent=2)
+    return path
+
+
+def print_results(results, baseline=None):
+    search = results.get("search")
+    if search:
+        old = (baseline or {}).get("search")
+        print(f"\n🔎 DuckDuckGo: parsing {search['parse_ms']['lxml_first_5']} ms (bs4 {search['parse_ms']['bs4_full_page']} ms)  "
+              f"cold p50 {search['cold_s']['p50']}s  warm p50 {search['warm_s']['p50']}s  "
+              f"CPU {search['cpu_ms_per_query']} ms/query  connessioni {search.get('connections', '?')} per {results['config']['runs']} query  "
+              f"8 query in parallelo {search['search_many_8_s']}s"
+              + (f"  (prima cold p50 {old['cold_s']['p50']}s)" if old else ""))
+    served = results.get("server")
+    if served:
+        old = (baseline or {}).get("server")
+        print(f"\n🌐 Server: {served['sessions']} sessioni una alla volta {served['sequential_s']}s, "
+              f"contemporanee {served['concurrent_s']}s ({served['sessions_per_s']} sessioni/s)"
+              + ("" if served["ok"] else "  ⚠️ alcune sessioni non sono andate a buon fine")
+              + (f"  (prima {old['sessions_per_s']} sessioni/s)" if old else ""))
+    for module, info in results.get("import_time", {}).items():
+        old = (baseline or {}).get("import_time", {}).get(module)
+        line = f"\n⏱️  import {module}: {info['seconds']}s"
+        if old:
+            line += f"  (prima {old['seconds']}s)"
+        print(line + (f"  moduli pesanti: {', '.join(info['heavy_modules'])}" if info["heavy_modules"] else ""))
+    for name, scenario in results["scenarios"].items():
+        line = (f"\n📊 {name}: p50 {scenario['latency_s']['p50']}s  p95 {scenario['latency_s']['p95']}s  "
+                f"LLM {scenario['llm_calls']:.1f}  ricerche {scenario.get('search_calls', 0):.1f}  token prompt {scenario['prompt_tokens']:.0f}  "
+                f"memoria {scenario['peak_memory_kb']} KB  copie scartate {scenario.get('duplicates_removed', 0):.1f}  "
+                f"affermazioni verificate {scenario.get('claims_checked', 0):.1f}")
+        old = (baseline or {}).get("scenarios", {}).get(name)
+        if old and old["latency_s"]["p50"]:
+            delta = (scenario["latency_s"]["p50"] - old["latency_s"]["p50"]) / old["latency_s"]["p50"] * 100
+            line += f"  ({delta:+.1f}% p50 rispetto a {baseline['commit']}, LLM {old['llm_calls']:.1f})"
+        print(line)
+        if scenario.get("governor", {}).get("throttled"):
+            print(f"   429 gestiti {scenario['governor']['throttled']:.1f}  retry {scenario['governor']['retries']:.1f}")
+        for kind in ("nodes", "tools"):
+            for key, stats in scenario[kind].items():
+                print(f"   {kind[:-1]:5} {key:22} p50 {stats['p50']}s  p95 {stats['p95']}s  (x{stats['count']})")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark offline del grafo con LLM, Tavily e siti web finti.")
+    parser.add_argument("scenarios", nargs="*", default=list(SCENARIOS), help="scenari da eseguire")
+    parser.add_argument("-n", "--runs", type=int, default=5)
+    parser.add_argument("--llm-latency", type=float, default=0.05, help="secondi per chiamata LLM finta")
+    parser.add_argument("--search-latency", type=float, default=0.05, help="secondi per ricerca Tavily finta")
+    parser.add_argument("--page-latency", type=float, default=0.01, help="secondi per pagina servita")
+    parser.add_argument("--completion-tokens", type=int, default=180)
+    parser.add_argument("--api-latency", type=float, default=0.0, help="latenza aggiunta dal server alle API finte")
+    parser.add_argument("--throttle-every", type=int, default=0,
+                        help="le API finte rispondono 429 a una richiesta ogni N (0 = mai)")
+    parser.add_argument("--warm", action="store_true", help="non svuotare le cache tra un'esecuzione e l'altra")
+    parser.add_argument("--no-search-bench", action="store_true", help="non misurare il backend DuckDuckGo")
+    parser.add_argument("--no-server-bench", action="store_true", help="non misurare le sessioni contemporanee del server")
+    parser.add_argument("--no-import-time", action="store_true", help="non misurare il tempo di import dei moduli")
+    parser.add_argument("--compare", help="file di risultati di un commit precedente da confrontare")
+    args = parser.parse_args()
+
+    unknown = set(args.scenarios) - set(SCENARIOS)
+    if unknown:
+        sys.exit(f"Scenari sconosciuti: {', '.join(sorted(unknown))}")
+
+    tracemalloc.start()
+    with FixtureServer(latency=args.page_latency, api_latency=args.api_latency,
+                       throttle_every=args.throttle_every) as server:
+        agent = setup_agent(server, args.llm_latency, args.search_latency, args.completion_tokens,
+                            via_server=bool(args.throttle_every or args.api_latency))
+        results = {
+            "commit": current_commit(),
+            "timestamp": datetime.now().isoformat(timespec="seconds"),
+            "config": {key: value for key, value in vars(args).items() if key not in ("scenarios", "compare")},
+            "scenarios": {name: run_scenario(agent, name, args.runs, args.warm) for name in args.scenarios},
+        }
+        if not args.no_search_bench:
+            results["search"] = bench_search(server, args.runs)
+        if not args.no_server_bench:
+            results["server"] = bench_server(agent)
+    tracemalloc.stop()
+    if not args.no_import_time:
+        results["import_time"] = {module: measure_import(module) for module in ("Agent_AI", "versione1")}
+
+    baseline = None
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            baseline = json.load(f)
+    print_results(results, baseline)
+    print(f"\n💾 Risultati salvati in {save_results(results)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,133 @@
+import os
+import time
+import sqlite3
+import threading
+
+from langgraph.checkpoint.sqlite import SqliteSaver
+
+# === CONFIGURAZIONE DEL CHECKPOINTER ===
+CHECKPOINT_PATH = os.getenv("CHECKPOINT_PATH", os.path.join(".cache", "checkpoints.sqlite"))
+CHECKPOINT_MAX_HISTORY = int(os.getenv("CHECKPOINT_MAX_HISTORY", "20"))  # checkpoint tenuti per ogni thread
+CHECKPOINT_RETENTION = float(os.getenv("CHECKPOINT_RETENTION", str(30 * 24 * 3600)))  # thread inattivi da eliminare
+CHECKPOINT_PURGE_EVERY = int(os.getenv("CHECKPOINT_PURGE_EVERY", "200"))  # ogni quanti salvataggi si puliscono i thread vecchi
+
+
+class CompactingSqliteSaver(SqliteSaver):
+    """Checkpointer su SQLite che tiene solo gli ultimi checkpoint di ogni thread ed elimina i thread inattivi."""
+
+    def __init__(self, conn, *, max_history=CHECKPOINT_MAX_HISTORY, retention=CHECKPOINT_RETENTION,
+                 purge_every=CHECKPOINT_PURGE_EVERY, serde=None):
+        super().__init__(conn, serde=serde)
+        self.max_history = max_history
+        self.retention = retention
+        self.purge_every = purge_every
+        self._puts = 0
+
+    def setup(self):
+        if self.is_setup:
+            return
+        super().setup()
+        self.conn.execute(
+            """CREATE TABLE IF NOT EXISTS thread_activity (
+                   thread_id TEXT NOT NULL,
+                   checkpoint_ns TEXT NOT NULL DEFAULT '',
+                   updated REAL NOT NULL,
+                   PRIMARY KEY (thread_id, checkpoint_ns)
+               )"""
+        )
+        self.conn.commit()
+
+    def put(self, config, checkpoint, metadata, new_versions):
+        next_config = super().put(config, checkpoint, metadata, new_versions)
+        self.compact_thread(next_config["configurable"]["thread_id"])
+        self._puts += 1
+        if self.retention and self._puts % self.purge_every == 0:
+            self.purge_inactive_threads()
+        return next_config
+
+    def compact_thread(self, thread_id):
+        """Tiene gli ultimi max_history checkpoint (con le relative writes) di ogni namespace del thread.
+
+        I namespace dei sottografi (ad esempio "research:<task_id>", uno nuovo per ogni esecuzione) più vecchi del
+        più vecchio checkpoint tenuto del grafo principale vengono eliminati del tutto.
+        """
+        with self.cursor() as cur:
+            cur.execute(
+                "INSERT OR REPLACE INTO thread_activity (thread_id, checkpoint_ns, updated) VALUES (?, '', ?)",
+                (thread_id, time.time()),
+            )
+            cur.execute("SELECT DISTINCT checkpoint_ns FROM checkpoints WHERE thread_id = ?", (thread_id,))
+            namespaces = sorted(row[0] for row in cur.fetchall())  # '' (il grafo principale) per primo
+            root_cutoff = None
+            for checkpoint_ns in namespaces:
+                cur.execute(
+                    """SELECT checkpoint_id FROM checkpoints WHERE thread_id = ? AND checkpoint_ns = ?
+                       ORDER BY checkpoint_id DESC LIMIT 1 OFFSET ?""",
+                    (thread_id, checkpoint_ns, self.max_history - 1),
+                )
+                row = cur.fetchone()
+                if row is None:
+                    continue
+                if checkpoint_ns == "":
+                    root_cutoff = row[0]
+                # Gli id dei checkpoint sono uuid6, quindi l'ordine alfabetico è anche quello temporale
+                for table in ("checkpoints", "writes"):
+                    cur.execute(
+                        f"DELETE FROM {table} WHERE thread_id = ? AND checkpoint_ns = ? AND checkpoint_id < ?",
+                        (thread_id, checkpoint_ns, row[0]),
+                    )
+            if root_cutoff is not None:
+                for table in ("checkpoints", "writes"):
+                    cur.execute(
+                        f"DELETE FROM {table} WHERE thread_id = ? AND checkpoint_ns != '' AND checkpoint_id < ?",
+                        (thread_id, root_cutoff),
+                    )
+
+    def purge_inactive_threads(self, older_than=None):
+        """Elimina tutti i checkpoint, di tutti i namespace, dei thread non aggiornati da più di older_than secondi."""
+        cutoff = time.time() - (older_than if older_than is not None else self.retention)
+        with self.cursor() as cur:
+            cur.execute("SELECT thread_id FROM thread_activity GROUP BY thread_id HAVING MAX(updated) < ?", (cutoff,))
+            stale = [row[0] for row in cur.fetchall()]
+            for thread_id in stale:
+                for table in ("checkpoints", "writes", "thread_activity"):
+                    cur.execute(f"DELETE FROM {table} WHERE thread_id = ?", (thread_id,))
+        # Il WAL viene riportato a zero, così anche il file su disco non cresce senza limite; la connessione è
+        # condivisa con i thread dei grafi, quindi anche questo passa dal lock di SqliteSaver
+        with self.cursor(transaction=False) as cur:
+            cur.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+        return len(stale)
+
+    def thread_exists(self, thread_id):
+        with self.cursor(transaction=False) as cur:
+            cur.execute("SELECT 1 FROM checkpoints WHERE thread_id = ? LIMIT 1", (thread_id,))
+            return cur.fetchone() is not None
+
+# Con MemorySaver ogni checkpoint di ogni thread restava in RAM fino alla chiusura del programma e poi andava perso.
+# Qui i checkpoint sono salvati su SQLite (in modalità WAL) e dopo ogni salvataggio il thread viene compattato agli
+# ultimi max_history checkpoint, in ogni namespace (anche quelli dei sottografi); ogni purge_every salvataggi vengono
+# eliminati i thread inattivi da più di retention secondi.
+# Per riprendere una conversazione basta rieseguire il grafo con lo stesso thread_id, anche dopo un riavvio.
+
+
+def open_checkpointer(path=CHECKPOINT_PATH, **kwargs):
+    """Apre (o crea) il database dei checkpoint e restituisce il checkpointer da passare a builder.compile."""
+    if os.path.dirname(path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+    conn = sqlite3.connect(path, check_same_thread=False)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    return CompactingSqliteSaver(conn, **kwargs)
+
+
+_shared = {}
+_shared_lock = threading.Lock()
+
+
+def get_checkpointer(path=CHECKPOINT_PATH):
+    """Checkpointer condiviso per database: i grafi dello stesso processo (ad esempio cinema e sport nel server)
+    usano una sola connessione, protetta dal lock di SqliteSaver."""
+    with _shared_lock:
+        if path not in _shared:
+            _shared[path] = open_checkpointer(path)
+        return _shared[path]
@@ -0,0 +1,206 @@
+import os
+import re
+import json
+import time
+import asyncio
+import sqlite3
+import hashlib
+import threading
+from typing import Literal
+
+from pydantic import BaseModel, ValidationError, field_validator
+
+# === CONFIGURAZIONE DEL FACT-CHECKING PER AFFERMAZIONI ===
+CLAIMS_PATH = os.getenv("CLAIMS_PATH", os.path.join(".cache", "claims.sqlite"))
+CLAIM_VERDICT_TTL = float(os.getenv("CLAIM_VERDICT_TTL", str(7 * 24 * 3600)))  # una settimana, come la cache LLM
+CLAIMS_PER_CALL = int(os.getenv("CLAIMS_PER_CALL", "6"))  # affermazioni verificate in una sola chiamata all'LLM
+MIN_CLAIM_WORDS = 4  # frasi più corte (titoli, saluti) non contengono fatti da verificare
+UNCHECKED = "non verificabile"
+
+
+def claim_hash(text):
+    # Maiuscole, punteggiatura e spazi non contano: una correzione di forma non fa riverificare l'affermazione
+    normalized = " ".join(re.findall(r"\w+", text.lower()))
+    return hashlib.sha1(normalized.encode("utf-8")).hexdigest()[:16]
+
+
+def split_claims(article):
+    """Divide l'articolo in affermazioni (frasi e proposizioni separate da ';'), ognuna con il suo hash."""
+    claims = {}
+    for paragraph in article.split("\n"):
+        paragraph = re.sub(r"^\s*(#+|[-*•]|\d+[.)])\s*", "", paragraph).replace("**", "").strip()
+        for sentence in re.split(r"(?<=[.!?])(?<!\b[A-Z]\.)\s+(?=[\"«(\w])|;\s+", paragraph):
+            sentence = sentence.strip()
+            if len(sentence.split()) >= MIN_CLAIM_WORDS:
+                claims.setdefault(claim_hash(sentence), sentence)
+    return [{"hash": h, "text": text} for h, text in claims.items()]
+
+
+MAX_EXPLANATION_CHARS = 500
+
+
+class ClaimVerdict(BaseModel):
+    id: int
+    verdict: Literal["confermata", "smentita", "non verificabile"]
+    explanation: str = ""
+
+    @field_validator("explanation", mode="before")
+    @classmethod
+    def truncate(cls, value):
+        # Una motivazione troppo lunga si accorcia: il verdetto resta valido
+        return value[:MAX_EXPLANATION_CHARS] if isinstance(value, str) else value
+
+
+def claim_check_messages(claims, url, evaluation, passages="", subject="cinematografici"):
+    from langchain_core.messages import HumanMessage, SystemMessage
+    source = f"La fonte è: {url}\nValutazione della fonte: {evaluation}\n"
+    if passages:
+        source += f"Passaggi rilevanti della fonte:\n{passages}\n"
+    numbered = "\n".join(f"{i}. {claim['text']}" for i, claim in enumerate(claims, 1))
+    return [
+        SystemMessage(content=f"Sei un fact-checker per articoli {subject}: verifichi una per una le affermazioni "
+                              "di un articolo confrontandole con la fonte."),
+        HumanMessage(content=f"{source}\nAffermazioni da verificare:\n{numbered}\n\n"
+                             'Rispondi solo con un JSON: {"verdicts": [{"id": <numero>, "verdict": "confermata" | '
+                             '"smentita" | "non verificabile", "explanation": "<breve motivazione>"}]}')
+    ]
+
+
+def parse_verdicts(text, claims):
+    """Verdetti validi della risposta, come dict hash -> verdetto; le affermazioni senza risposta restano fuori."""
+    match = re.search(r"\{.*\}", text or "", re.DOTALL)
+    if not match:
+        return {}
+    try:
+        items = json.loads(match.group(0)).get("verdicts")
+    except (ValueError, AttributeError):
+        return {}
+    # Ogni verdetto è validato da solo: un elemento sbagliato non fa perdere gli altri del gruppo
+    verdicts = {}
+    for item in items if isinstance(items, list) else []:
+        try:
+            v = ClaimVerdict.model_validate(item)
+        except ValidationError:
+            continue
+        if 1 <= v.id <= len(claims):
+            verdicts[claims[v.id - 1]["hash"]] = {"verdict": v.verdict, "explanation": v.explanation}
+    return verdicts
+
+
+class ClaimStore:
+    """Verdetti per affermazione e fonte su SQLite, chiave (hash dell'affermazione, URL della fonte)."""
+
+    def __init__(self, path=CLAIMS_PATH, ttl=CLAIM_VERDICT_TTL):
+        self.ttl = ttl
+        self.reused = 0
+        self.checked = 0
+        self._lock = threading.Lock()
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            """CREATE TABLE IF NOT EXISTS verdicts (
+                   claim_hash TEXT NOT NULL,
+                   url TEXT NOT NULL,
+                   claim TEXT NOT NULL,
+                   verdict TEXT NOT NULL,
+                   explanation TEXT NOT NULL,
+                   checked REAL NOT NULL,
+                   PRIMARY KEY (claim_hash, url)
+               )"""
+        )
+        self._conn.commit()
+
+    def lookup(self, url, hashes):
+        """Verdetti ancora validi per le affermazioni indicate, come dict hash -> verdetto."""
+        if not hashes:
+            return {}
+        with self._lock:
+            rows = self._conn.execute(
+                f"""SELECT claim_hash, verdict, explanation FROM verdicts
+                    WHERE url = ? AND checked >= ? AND claim_hash IN ({','.join('?' * len(hashes))})""",
+                (url, time.time() - self.ttl, *hashes)).fetchall()
+        return {h: {"verdict": verdict, "explanation": explanation} for h, verdict, explanation in rows}
+
+    def record(self, url, claims, verdicts):
+        now = time.time()
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO verdicts (claim_hash, url, claim, verdict, explanation, checked) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                [(c["hash"], url, c["text"], verdicts[c["hash"]]["verdict"], verdicts[c["hash"]]["explanation"], now)
+                 for c in claims if c["hash"] in verdicts])
+            self._conn.commit()
+
+    def count(self, reused, checked):
+        with self._lock:
+            self.reused += reused
+            self.checked += checked
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute("DELETE FROM verdicts")
+            self._conn.commit()
+
+    def stats(self):
+        with self._lock:
+            verdicts = self._conn.execute("SELECT COUNT(*) FROM verdicts").fetchone()[0]
+        return {"reused": self.reused, "checked": self.checked, "verdicts": verdicts}
+
+# L'articolo viene diviso in frasi, e ogni frase è un'affermazione identificata dall'hash del suo testo normalizzato.
+# Per ogni fonte si cercano i verdetti già salvati; solo le affermazioni nuove o modificate vanno all'LLM, a gruppi
+# di CLAIMS_PER_CALL verificati in parallelo, ognuno con i passaggi della fonte più vicini a quelle affermazioni.
+# Dopo una rigenerazione le frasi rimaste uguali non costano nulla: il costo cresce con la modifica, non con l'articolo.
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_claim_store():
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = ClaimStore()
+    return _store
+
+
+# === VERIFICA DELLE AFFERMAZIONI ===
+async def acheck_claims(article, url, evaluation, ask_llm, passages_for=None, bypass=False, subject="cinematografici"):
+    """Verdetto di ogni affermazione dell'articolo rispetto alla fonte; all'LLM (ask_llm asincrona) vanno solo
+    le affermazioni senza un verdetto salvato. passages_for(testo) restituisce i passaggi della fonte da usare."""
+    store = get_claim_store()
+    claims = split_claims(article)
+    known = {} if bypass else store.lookup(url, [c["hash"] for c in claims])
+    pending = [c for c in claims if c["hash"] not in known]
+    store.count(len(claims) - len(pending), len(pending))
+
+    async def check(batch):
+        passages = ""
+        if passages_for is not None:
+            passages = await asyncio.to_thread(passages_for, " ".join(c["text"] for c in batch))
+        verdicts = parse_verdicts(await ask_llm(claim_check_messages(batch, url, evaluation, passages, subject)), batch)
+        store.record(url, batch, verdicts)  # le affermazioni senza un verdetto valido verranno riverificate
+        return verdicts
+
+    batches = [pending[i:i + CLAIMS_PER_CALL] for i in range(0, len(pending), CLAIMS_PER_CALL)]
+    for verdicts in await asyncio.gather(*(check(batch) for batch in batches)):
+        known.update(verdicts)
+    return [{**c, **known.get(c["hash"], {"verdict": UNCHECKED, "explanation": "nessun verdetto valido"})}
+            for c in claims]
+
+
+def check_claims(article, url, evaluation, ask_llm, passages_for=None, bypass=False, subject="cinematografici"):
+    """Come acheck_claims, da codice sincrono (ad esempio un tool eseguito da ToolNode)."""
+    return asyncio.run(acheck_claims(article, url, evaluation, ask_llm, passages_for, bypass, subject))
+
+
+def format_verdicts(verdicts):
+    """Verdetti come testo per il report: conteggio per esito e una riga per affermazione."""
+    counts = {label: sum(v["verdict"] == label for v in verdicts)
+              for label in ("confermata", "smentita", "non verificabile")}
+    lines = [", ".join(f"{n} {label}" for label, n in counts.items())]
+    for v in verdicts:
+        lines.append(f"- [{v['verdict']}] {v['text']}" + (f" — {v['explanation']}" if v["explanation"] else ""))
+    return "\n".join(lines)
@@ -0,0 +1,95 @@
+import os
+from functools import lru_cache
+
+from langchain_core.messages import SystemMessage, HumanMessage, ToolMessage
+
+from llm_cache import invoke_cached
+
+# === CONFIGURAZIONE DEL CONTESTO ===
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "6000"))  # token massimi inviati all'assistente
+ELIDED_PREVIEW_CHARS = 200  # caratteri tenuti degli output dei tool dei turni precedenti
+ELIDED_TOOLS = {"web_search", "scrape_website", "generate_article", "evaluate_source",
+                "check_fact", "generate_report", "suggest_articles"}
+
+
+@lru_cache(maxsize=8)
+def _encoding(model):
+    try:
+        import tiktoken
+        try:
+            return tiktoken.encoding_for_model(model)
+        except KeyError:
+            return tiktoken.get_encoding("o200k_base")
+    except Exception:
+        return None  # tiktoken non installato o encoding non scaricabile
+
+
+@lru_cache(maxsize=4096)
+def count_tokens(text, model="gpt-4o-mini"):
+    encoding = _encoding(model)
+    if encoding is None:
+        return len(text) // 4 + 1  # stima approssimativa senza tiktoken
+    return len(encoding.encode(text))
+
+
+def message_tokens(msg, model="gpt-4o-mini"):
+    # 4 token di overhead per messaggio, come nel formato chat di OpenAI
+    tokens = 4 + count_tokens(msg.content if isinstance(msg.content, str) else str(msg.content), model)
+    for call in getattr(msg, "tool_calls", None) or []:
+        tokens += count_tokens(f"{call['name']}{call['args']}", model)
+    return tokens
+
+
+def elide_old_tool_outputs(messages):
+    """Accorcia gli output dei tool dei turni precedenti all'ultimo messaggio dell'utente."""
+    last_human = max((i for i, msg in enumerate(messages) if isinstance(msg, HumanMessage)), default=0)
+    elided = []
+    for i, msg in enumerate(messages):
+        if (i < last_human and isinstance(msg, ToolMessage) and msg.name in ELIDED_TOOLS
+                and len(msg.content) > ELIDED_PREVIEW_CHARS):
+            msg = msg.model_copy(update={
+                "content": f"[output di {msg.name} dei turni precedenti, accorciato] {msg.content[:ELIDED_PREVIEW_CHARS]}..."
+            })
+        elided.append(msg)
+    return elided
+
+
+def summarize(llm, previous_summary, messages):
+    transcript = "\n".join(f"{msg.type.upper()}: {msg.content}" for msg in messages if msg.content)
+    prompt = [
+        SystemMessage(content="Riassumi in modo conciso una conversazione tra un utente e un assistente per un blog. "
+                              "Conserva richieste dell'utente, topic, fonti usate e decisioni prese."),
+        HumanMessage(content=f"Riassunto finora:\n{previous_summary or '(vuoto)'}\n\n"
+                             f"Nuovi messaggi da aggiungere al riassunto:\n{transcript}")
+    ]
+    return invoke_cached(llm, prompt)
+
+
+def build_context(sys_msg, messages, summary, summarized, llm, budget=CONTEXT_TOKEN_BUDGET):
+    """Restituisce i messaggi da inviare all'LLM e l'eventuale aggiornamento di summary/summarized per lo stato."""
+    model = getattr(llm, "model_name", "gpt-4o-mini")
+    window = elide_old_tool_outputs(messages[summarized:])
+    fixed = message_tokens(sys_msg, model) + (count_tokens(summary, model) if summary else 0)
+    sizes = [message_tokens(msg, model) for msg in window]
+    updates = {}
+
+    if fixed + sum(sizes) > budget:
+        # Si taglia sempre all'inizio di un turno dell'utente, così le coppie tool_call/ToolMessage restano intere
+        starts = [i for i, msg in enumerate(window) if isinstance(msg, HumanMessage) and i > 0]
+        cut = next((i for i in starts if fixed + sum(sizes[i:]) <= budget), starts[-1] if starts else 0)
+        if cut:
+            summary = summarize(llm, summary, window[:cut])
+            summarized += cut
+            window = window[cut:]
+            updates = {"summary": summary, "summarized": summarized}
+
+    prompt = [sys_msg]
+    if summary:
+        prompt.append(SystemMessage(content=f"Riassunto della conversazione precedente:\n{summary}"))
+    return prompt + window, updates
+
+# Il contesto dell'assistente è formato da: messaggio di sistema, riassunto dei turni vecchi e messaggi recenti.
+# Gli output lunghi dei tool (pagine estratte, articoli, report) dei turni precedenti vengono accorciati, perché
+# l'assistente deve solo scegliere il prossimo tool. Se il totale supera CONTEXT_TOKEN_BUDGET i turni più vecchi
+# vengono aggiunti al riassunto, che è salvato nello stato insieme all'indice dei messaggi già riassunti:
+# ogni riassunto costa solo i messaggi nuovi, quindi la latenza per turno resta circa costante.
@@ -0,0 +1,170 @@
+import os
+import time
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from dedup import dedup, unwrap_redirect
+from governor import get_backend
+
+# === CONFIGURAZIONE DELLA RICERCA SU DUCKDUCKGO ===
+DDG_URL = os.getenv("DDG_URL", "https://html.duckduckgo.com/html/")
+DDG_CONNECT_TIMEOUT = float(os.getenv("DDG_CONNECT_TIMEOUT", "3"))
+DDG_READ_TIMEOUT = float(os.getenv("DDG_READ_TIMEOUT", "10"))
+DDG_CACHE_TTL = float(os.getenv("DDG_CACHE_TTL", "300"))  # cinque minuti: i risultati cambiano spesso
+DDG_CACHE_MAX_ENTRIES = 256
+DDG_POOL_SIZE = 8
+USER_AGENT = "Mozilla/5.0"
+CHUNK_SIZE = 8192
+
+
+def normalize_query(query):
+    return " ".join(query.lower().split())
+
+
+def _classes(element):
+    return (element.get("class") or "").split()
+
+
+def parse_results(chunks, max_results=5):
+    """Legge i risultati dall'HTML di DuckDuckGo man mano che arriva e si ferma dopo max_results.
+
+    chunks è un iterabile di bytes (ad esempio response.iter_content). Usa il parser incrementale di lxml;
+    se lxml non è installato l'HTML viene letto tutto e analizzato con BeautifulSoup.
+    """
+    try:
+        from lxml import etree
+    except ImportError:
+        return _parse_with_bs4(b"".join(chunks), max_results)
+
+    parser = etree.HTMLPullParser(events=("end",), encoding="utf-8")
+    results, current = [], {}
+    for chunk in chunks:
+        parser.feed(chunk)
+        for _, element in parser.read_events():
+            classes = _classes(element)
+            if "result__a" in classes:
+                current["url"] = unwrap_redirect(element.get("href") or "")
+                current["title"] = "".join(element.itertext()).strip()
+            elif "result__snippet" in classes:
+                current["content"] = " ".join("".join(element.itertext()).split())
+            elif "result" in classes:
+                if current.get("url"):
+                    results.append({"url": current["url"], "title": current.get("title", ""),
+                                    "content": current.get("content", "")})
+                current = {}
+                element.clear()  # i risultati già letti non servono più: la memoria resta costante
+                if len(results) >= max_results:
+                    return results  # il resto della pagina non viene analizzato
+    return results
+
+
+def _parse_with_bs4(html, max_results):
+    from bs4 import BeautifulSoup
+    results = []
+    for result in BeautifulSoup(html, "html.parser").select(".result")[:max_results]:
+        link = result.select_one(".result__a")
+        snippet = result.select_one(".result__snippet")
+        if link and link.get("href"):
+            results.append({"url": unwrap_redirect(link["href"]), "title": link.get_text(strip=True),
+                            "content": snippet.get_text(" ", strip=True) if snippet else ""})
+    return results
+
+
+class DuckDuckGoSearch:
+    """Ricerca sulla versione HTML di DuckDuckGo, con sessione condivisa, parsing incrementale e cache a breve termine."""
+
+    def __init__(self, base_url=DDG_URL, timeout=(DDG_CONNECT_TIMEOUT, DDG_READ_TIMEOUT), ttl=DDG_CACHE_TTL,
+                 max_entries=DDG_CACHE_MAX_ENTRIES, pool_size=DDG_POOL_SIZE):
+        self.base_url = base_url
+        self.timeout = timeout
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.pool_size = pool_size
+        self.hits = 0
+        self.misses = 0
+        self._session = None
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _get_session(self):
+        with self._lock:
+            if self._session is None:
+                import requests
+                from requests.adapters import HTTPAdapter
+                session = requests.Session()
+                adapter = HTTPAdapter(pool_connections=self.pool_size, pool_maxsize=self.pool_size)
+                session.mount("https://", adapter)
+                session.mount("http://", adapter)
+                session.headers["User-Agent"] = USER_AGENT
+                self._session = session
+            return self._session
+
+    def _fetch(self, query, max_results):
+        # La risposta è letta a blocchi e il parsing si ferma appena ci sono abbastanza risultati; il resto del
+        # corpo (pochi KB) viene comunque letto, così la connessione torna nel pool invece di essere chiusa
+        with self._get_session().get(self.base_url, params={"q": query}, timeout=self.timeout, stream=True) as response:
+            response.raise_for_status()  # 429 e 5xx diventano eccezioni, che il governatore riprova
+            chunks = response.iter_content(CHUNK_SIZE)
+            results = parse_results(chunks, max_results)
+            for _ in chunks:
+                pass
+            return results
+
+    def _cached(self, key):
+        with self._lock:
+            entry = self._cache.get(key)
+            if entry is None or time.monotonic() - entry[0] > self.ttl:
+                return None
+            self._cache.move_to_end(key)
+            return entry[1]
+
+    def _store(self, key, results):
+        with self._lock:
+            self._cache[key] = (time.monotonic(), results)
+            self._cache.move_to_end(key)
+            while len(self._cache) > self.max_entries:
+                self._cache.popitem(last=False)
+
+    def search(self, query, max_results=5):
+        """I primi max_results risultati (url, title, content), senza copie della stessa notizia."""
+        key = (normalize_query(query), max_results)
+        cached = self._cached(key)
+        if cached is not None:
+            self.hits += 1
+            return cached
+        self.misses += 1
+        # Si leggono un po' più risultati del necessario, perché alcuni possono essere scartati come copie
+        results = dedup(get_backend("duckduckgo").call(self._fetch, query, max_results * 2))[:max_results]
+        self._store(key, results)
+        return results
+
+    def search_many(self, queries, max_results=5):
+        """Più ricerche in parallelo sulla stessa sessione; restituisce un dict query -> risultati."""
+        queries = list(dict.fromkeys(queries))
+        with ThreadPoolExecutor(max_workers=min(len(queries), self.pool_size) or 1) as pool:
+            return dict(zip(queries, pool.map(lambda q: self.search(q, max_results), queries)))
+
+    def clear(self):
+        with self._lock:
+            self._cache.clear()
+
+    def stats(self):
+        return {"hits": self.hits, "misses": self.misses, "entries": len(self._cache)}
+
+# Prima ogni ricerca apriva una nuova connessione senza timeout e analizzava l'intera pagina con html.parser di
+# BeautifulSoup (puro Python). Ora la sessione tiene aperte le connessioni, la pagina viene letta a blocchi con
+# il parser incrementale di lxml fermandosi ai primi risultati, e la stessa query (normalizzata) ripetuta entro
+# DDG_CACHE_TTL secondi non contatta DuckDuckGo. La concorrenza verso DuckDuckGo la limita il governatore.
+
+
+_search = None
+_search_lock = threading.Lock()
+
+
+def get_search():
+    global _search
+    with _search_lock:
+        if _search is None:
+            _search = DuckDuckGoSearch()
+    return _search
@@ -0,0 +1,135 @@
+import re
+import hashlib
+import threading
+from urllib.parse import urlsplit, urlunsplit, parse_qsl, urlencode, unquote
+
+# === CONFIGURAZIONE DELLA DEDUPLICAZIONE ===
+SIMHASH_BITS = 64
+SIMHASH_MAX_DISTANCE = 3  # bit diversi al massimo perché due testi siano considerati copie
+SIMHASH_MIN_WORDS = 60  # sotto questa lunghezza (snippet) il SimHash è troppo rumoroso e si usa la Jaccard
+SNIPPET_MIN_JACCARD = 0.7  # triple di parole in comune perché due snippet siano considerati copie
+MIN_WORDS = 8  # sotto questa lunghezza il testo non basta a dire che due pagine sono copie
+TRACKING_PARAMS = {"fbclid", "gclid", "dclid", "msclkid", "igshid", "mc_cid", "mc_eid", "ref", "ref_src", "rut",
+                   "cmpid", "ncid", "ocid", "amp", "output", "outputtype"}
+HOST_PREFIXES = ("www.", "m.", "mobile.", "amp.")
+
+
+def unwrap_redirect(url):
+    """URL vero di un link di DuckDuckGo (//duckduckgo.com/l/?uddg=<url codificato>); gli altri restano invariati."""
+    url = url.strip()
+    if url.startswith("//"):
+        url = "https:" + url
+    parts = urlsplit(url)
+    if parts.netloc.endswith("duckduckgo.com") and parts.path.startswith("/l/"):
+        target = dict(parse_qsl(parts.query)).get("uddg")
+        if target:
+            return unwrap_redirect(unquote(target))
+    return url
+
+
+def normalize_url(url):
+    """Forma canonica di un URL: niente redirect di DuckDuckGo, AMP, versioni mobile e parametri di tracciamento."""
+    parts = urlsplit(unwrap_redirect(url))
+    host = parts.netloc.lower()
+    for prefix in HOST_PREFIXES:
+        host = host.removeprefix(prefix)
+    path = re.sub(r"/amp(?=/|$)|\.amp(?=\.html?$)", "", parts.path) or "/"
+    if len(path) > 1:
+        path = path.rstrip("/")
+    query = urlencode(sorted((k, v) for k, v in parse_qsl(parts.query)
+                             if not k.lower().startswith("utm_") and k.lower() not in TRACKING_PARAMS))
+    return urlunsplit(("https", host, path, query, ""))
+
+
+def shingles(text):
+    words = re.findall(r"\w+", text.lower())
+    return {" ".join(words[i:i + 3]) for i in range(max(1, len(words) - 2))}
+
+
+def simhash(text, bits=SIMHASH_BITS):
+    """SimHash sulle triple di parole consecutive del testo."""
+    weights = [0] * bits
+    for shingle in shingles(text):
+        h = int.from_bytes(hashlib.blake2b(shingle.encode("utf-8"), digest_size=bits // 8).digest(), "big")
+        for i in range(bits):
+            weights[i] += 1 if h >> i & 1 else -1
+    return sum(1 << i for i in range(bits) if weights[i] > 0)
+
+
+def hamming(a, b):
+    return bin(a ^ b).count("1")
+
+
+class Fingerprint:
+    """Impronta di un testo: SimHash per i testi lunghi, insieme delle triple di parole per gli snippet."""
+
+    def __init__(self, text):
+        self.long = len(text.split()) >= SIMHASH_MIN_WORDS
+        self.value = simhash(text) if self.long else shingles(text)
+
+    def similar(self, other, max_distance=SIMHASH_MAX_DISTANCE):
+        if self.long != other.long:
+            return False
+        if self.long:
+            return hamming(self.value, other.value) <= max_distance
+        return len(self.value & other.value) / len(self.value | other.value) >= SNIPPET_MIN_JACCARD
+
+
+class DedupStats:
+    """Conta quanti risultati sono arrivati e quanti sono stati scartati come copie, per riportare il risparmio."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.seen = 0
+        self.removed = 0
+
+    def add(self, seen, removed):
+        with self._lock:
+            self.seen += seen
+            self.removed += removed
+
+    def reset(self):
+        with self._lock:
+            self.seen = self.removed = 0
+
+    def stats(self):
+        with self._lock:
+            return {"seen": self.seen, "removed": self.removed,
+                    "reduction": round(self.removed / self.seen, 3) if self.seen else 0.0}
+
+
+dedup_stats = DedupStats()
+
+
+def dedup(items, url_key="url", text_key="content", max_distance=SIMHASH_MAX_DISTANCE, record=True):
+    """Tiene un rappresentante per ogni gruppo di copie (stesso URL canonico o testo quasi identico).
+
+    Gli elementi sono dict; l'ordine viene mantenuto, quindi resta il primo di ogni gruppo (il più rilevante).
+    Al rappresentante viene aggiunta la lista "duplicates" con gli URL delle copie scartate.
+    Con record=False (risultati già deduplicati dalla ricerca) dedup_stats non viene aggiornato.
+    """
+    kept, urls, fingerprints = [], {}, []
+    for item in items:
+        canonical = normalize_url(item[url_key])
+        text = item.get(text_key) or ""
+        fingerprint = Fingerprint(text) if len(text.split()) >= MIN_WORDS else None
+        original = urls.get(canonical)
+        if original is None and fingerprint is not None:
+            original = next((rep for rep, f in fingerprints if f.similar(fingerprint, max_distance)), None)
+        if original is not None:
+            original.setdefault("duplicates", []).append(item[url_key])
+            continue
+        representative = dict(item)
+        kept.append(representative)
+        urls[canonical] = representative
+        if fingerprint is not None:
+            fingerprints.append((representative, fingerprint))
+    if record:
+        dedup_stats.add(len(items), len(items) - len(kept))
+    return kept
+
+# Le copie della stessa notizia (agenzie ripubblicate, versioni AMP o mobile, link con parametri utm_*) vengono
+# riconosciute prima dall'URL canonico e poi dal testo: per le pagine estratte si confronta il SimHash (al massimo
+# SIMHASH_MAX_DISTANCE bit diversi), per gli snippet, troppo corti per il SimHash, la percentuale di triple di
+# parole in comune (gli snippet di un sito condividono spesso una coda fissa). Ogni copia scartata è una
+# valutazione e un fact-checking in meno; dedup_stats tiene il conto per la console e il benchmark.
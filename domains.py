@@ -0,0 +1,229 @@
+import os
+import threading
+from langchain_core.tools import tool
+from langchain_core.messages import HumanMessage, SystemMessage
+from claims import check_claims, format_verdicts
+from governor import invoke_llm
+from llm_cache import invoke_cached, ainvoke_cached, llm_config
+from reputation import evaluate_with_reputation
+from retrieval import get_index
+
+# === CONFIGURAZIONE DEI DOMINI ===
+OPENAI_POOL_SIZE = int(os.getenv("OPENAI_POOL_SIZE", "32"))  # connessioni verso OpenAI condivise da tutti i domini
+
+# Ogni blog è descritto da un dominio: modulo che ne costruisce il grafo, modello, prompt di sistema
+# dell'assistente, parole usate nei prompt dei tool e lista dei tool esposti all'LLM. Il backend di ricerca
+# resta legato al modulo (Tavily con l'indice locale in Agent_AI, DuckDuckGo sui "sites" in versione1). Il server
+# (server.py) li ospita tutti nello stesso processo; Agent_AI e versione1 restano eseguibili da soli.
+CINEMA_PROMPT = """
+Sei un assistente per un blog cinematografico.
+🛑 Non puoi rispondere direttamente all'utente.  
+✅ Il tuo unico compito è scegliere quale tool usare.  
+🔧 Usa sempre e solo i tools disponibili, altrimenti restituisci un errore.
+    Prima di generare un articolo fai SEMPRE web search per avere informazioni aggiornate.
+    Dopo il web search fai Sempre scraping della fonte che ti sembra più pertinente. Poi genera l'articolo.
+🚫 Se nessun tool è adatto, non rispondere.
+🚫 MAI generare articoli a meno che non sia esplicitamente richiesto.
+📝 Per 'articolo' si intende solo contenuti <200 parole) strutturati.
+Parla solo di cinema, non di musica, religione, politica, etica o altro che non sia cinema.
+"""
+
+SPORT_PROMPT = """
+Sei un assistente per un blog sportivo.
+
+🛑 Non puoi rispondere direttamente all'utente.  
+✅ Il tuo unico compito è scegliere quale tool usare.  
+🔧 Usa sempre e solo i tools disponibili, altrimenti restituisci un errore (via tool_call fittizia se necessario).  
+🚫 Se nessun tool è adatto, **non rispondere**.
+
+Tools disponibili:
+- `search_web`: cerca articoli sportivi recenti
+- `evaluate_source`: valuta l'affidabilità di una fonte
+- `generate_article`: genera articoli sportivi da un prompt
+- `check_fact`: verifica fatti basandosi su una fonte e valutazione
+- `generate_report`: crea un report editoriale sulle fonti
+
+Parla solo di sport.
+"""
+
+# Testi dei prompt dei tool, ognuno com'era nello script del suo blog: {url}, {checked_sources} vengono sostituiti
+EVALUATION_FORMAT = '{"score": int (1-10), "comment": "breve motivazione"}'
+
+CINEMA_TOOL_PROMPTS = {
+    "evaluation": ("Agisci come valutatore di fonti per un blog cinematografico.",
+                   "Sto considerando questa fonte: {url}\nValuta questa fonte e rispondi solo in JSON:\n"),
+    "article": """Agisci come esperto cinematografico e scrivi un articolo in base al prompt dato.
+                      Se non è specificato altrimenti scrivi articoli di massimo 250 parole. Devi essere creativo e usare tagli e parole diverse quando richiesto.""",
+    "report": ("Agisci come editor e ottimizzatore di contenuti per blog cinematografici.",
+               "Ecco le fonti analizzate e i risultati del fact-checking:\n"
+               "{checked_sources}\n\n"
+               "Sulla base di queste, genera un report che:\n"
+               "- Valuta l'affidabilità generale del mio articolo\n"
+               "- Indica se ci sono elementi da correggere, a partire dalle affermazioni smentite o non verificabili\n"
+               "- Suggerisce miglioramenti stilistici o di contenuto"),
+}
+
+SPORT_TOOL_PROMPTS = {
+    "evaluation": ("Agisci come valutatore di fonti per un blog sportivo.",
+                   "Sono un blogger e sto scrivendo un articolo sportivo.\n"
+                   "Sto considerando questa fonte: {url}\n"
+                   "Valuta questa fonte e rispondi in JSON:\n"),
+    "article": "Agisci come esperto sportivo e scrivi un articolo in base al prompt dato.",
+    "report": ("Agisci come editor e ottimizzatore di contenuti per blog sportivi.",
+               "Ecco le fonti analizzate e i risultati del fact-checking:\n"
+               "{checked_sources}\n\n"
+               "Sulla base di queste, genera un report che:\n"
+               "- Valuta l'affidabilità generale del mio articolo\n"
+               "- Indica se ci sono elementi da correggere\n"
+               "- Suggerisce miglioramenti stilistici o di contenuto"),
+}
+
+DOMAINS = {
+    "cinema": {
+        "name": "cinema",  # anche il blog della reputazione delle fonti (reputation.py)
+        "module": "Agent_AI",
+        "model": "gpt-4o-mini",
+        "temperature": 0.7,
+        "subject": "cinematografici",  # "articoli cinematografici", nel fact-checking per affermazione
+        "system_prompt": CINEMA_PROMPT,
+        "tool_prompts": CINEMA_TOOL_PROMPTS,
+        "descriptions": {
+            "evaluate_source": "Valuta la qualità e affidabilità di una fonte fornita (URL). Usa bypass_cache=True solo se l'utente chiede una nuova valutazione.",
+            "generate_article": "Genera un articolo cinematografico a partire da un prompt fornito.",
+            "check_fact": "Confronta il contenuto dell'articolo con una fonte e ne valuta l'accuratezza. Usa bypass_cache=True solo se l'utente chiede un nuovo controllo.",
+            "generate_report": "Genera un report sull'affidabilità complessiva dell'articolo. Usa bypass_cache=True solo se l'utente chiede un nuovo report.",
+        },
+        "tools": ["web_search", "evaluate_source", "generate_article", "check_fact", "generate_report",
+                  "scrape_website", "suggest_articles"],
+    },
+    "sport": {
+        "name": "sport",
+        "module": "versione1",
+        "model": "gpt-3.5-turbo-16k",
+        "temperature": 0,
+        "sites": "site:gazzetta.it OR site:espn.com",
+        "subject": "sportivi",
+        "system_prompt": SPORT_PROMPT,
+        "tool_prompts": SPORT_TOOL_PROMPTS,
+        "descriptions": {
+            "evaluate_source": "Valuta l'affidabilità di una fonte per un blog sportivo.",
+            "generate_article": "Genera un articolo sportivo basato su un prompt dell'utente.",
+            "check_fact": "Conferma o smentisce il contenuto di un articolo usando una fonte e la sua valutazione.",
+            "generate_report": "Genera un report sull'affidabilità dell'articolo e suggerisce miglioramenti.",
+        },
+        "tools": ["search_web", "evaluate_source", "generate_article", "check_fact", "generate_report"],
+    },
+}
+
+
+# === CLIENT CONDIVISI ===
+_llms = {}
+_llms_lock = threading.Lock()
+
+
+def shared_llm(model, temperature):
+    """ChatOpenAI per (modello, temperatura), creato una volta; tutti i client usano lo stesso pool di connessioni."""
+    with _llms_lock:
+        if "http" not in _llms:
+            import httpx
+            _llms["http"] = httpx.Client(limits=httpx.Limits(max_connections=OPENAI_POOL_SIZE,
+                                                             max_keepalive_connections=OPENAI_POOL_SIZE))
+        if (model, temperature) not in _llms:
+            from langchain_openai import ChatOpenAI
+            # I retry li gestisce il governatore (governor.py), che conosce anche i limiti condivisi con le altre chiamate
+            _llms[model, temperature] = ChatOpenAI(model=model, temperature=temperature, max_retries=0,
+                                                   http_client=_llms["http"])
+        return _llms[model, temperature]
+
+# Cache LLM, indice locale, reputazione delle fonti, verdetti per affermazione, scraper e governatore sono già
+# singoli per processo; qui si condivide anche il pool HTTP dei client OpenAI, così due domini con modelli diversi
+# non tengono aperte connessioni separate e i limiti del governatore valgono per tutto il traffico del processo.
+
+
+# === PROMPT DEI TOOL CONDIVISI ===
+def evaluation_messages(domain, url):
+    system, request = domain["tool_prompts"]["evaluation"]
+    return [SystemMessage(content=system), HumanMessage(content=request.replace("{url}", url) + EVALUATION_FORMAT)]
+
+def article_messages(domain, prompt, instructions=None):
+    messages = [
+        SystemMessage(content=domain["tool_prompts"]["article"]),
+        HumanMessage(content=f"Prompt dell'articolo: {prompt}")
+    ]
+    if instructions:
+        messages.append(HumanMessage(content=f"Taglio richiesto per questa versione: {instructions}"))
+    return messages
+
+def report_messages(domain, checked_sources):
+    system, request = domain["tool_prompts"]["report"]
+    return [SystemMessage(content=system), HumanMessage(content=request.replace("{checked_sources}", checked_sources))]
+
+def source_passages(content, url):
+    # Passaggi della fonte più pertinenti all'articolo, presi dall'indice locale (snippet di ricerca e pagine scaricate)
+    passages = get_index().passages(content, url=url)
+    return "\n\n".join(f"[{i}] {p}" for i, p in enumerate(passages, 1))
+
+
+# === TOOL CONDIVISI DAI DOMINI ===
+def make_tools(domain, get_llm):
+    """evaluate_source, generate_article, check_fact e generate_report del dominio, come dict nome -> tool.
+
+    get_llm restituisce il client del dominio al momento della chiamata, così può essere sostituito (ad esempio
+    dal benchmark con configure_clients) dopo la creazione dei tool.
+    """
+
+    @tool
+    def evaluate_source(url: str, bypass_cache: bool = False) -> str:
+        """Valuta la qualità e affidabilità di una fonte fornita (URL). Usa bypass_cache=True solo se l'utente chiede una nuova valutazione."""
+        # Per i domini già valutati molte volte in modo concorde risponde la reputazione salvata, senza chiamare l'LLM
+        return evaluate_with_reputation(
+            url, lambda: invoke_cached(get_llm(), evaluation_messages(domain, url), bypass=bypass_cache),
+            bypass=bypass_cache, blog=domain["name"])
+
+    #Questo tool si occupa di valutare la qualità e l'affidabilità di una fonte fornita (URL).
+    #La risposta viene validata (score 1-10 e commento) e aggiunta alla reputazione del dominio nel blog, vedi reputation.py.
+
+    @tool
+    def generate_article(prompt: str) -> str:
+        """Genera un articolo a partire da un prompt fornito."""
+        return invoke_llm(get_llm(), article_messages(domain, prompt), config=llm_config("articolo")).content
+
+    #Questo tool genera un articolo completo (non un riassunto) a partire dal prompt, agendo come esperto del dominio.
+    #Non passa dalla cache: deve restare creativo, e ogni rigenerazione deve dare un testo nuovo.
+
+    @tool
+    def check_fact(content: str, url: str, evaluation: str, bypass_cache: bool = False) -> str:
+        """Confronta il contenuto dell'articolo con una fonte e ne valuta l'accuratezza. Usa bypass_cache=True solo se l'utente chiede un nuovo controllo."""
+        if not content or not evaluation or not url:
+            return "Errore: uno o più campi richiesti sono vuoti."
+        verdicts = check_claims(content, url, evaluation,
+                                lambda messages: ainvoke_cached(get_llm(), messages, bypass=bypass_cache),
+                                passages_for=lambda text: source_passages(text, url), bypass=bypass_cache,
+                                subject=domain["subject"])
+        return f"Fact-checking per affermazione ({url}):\n{format_verdicts(verdicts)}"
+
+    #Questo tool confronta il contenuto dell'articolo con una fonte e ne valuta l'accuratezza.
+    #L'articolo viene verificato frase per frase (vedi claims.py): le frasi già verificate su questa fonte riusano il verdetto salvato.
+
+    @tool
+    def generate_report(checked_sources: str, bypass_cache: bool = False) -> str:
+        """Genera un report sull'affidabilità complessiva dell'articolo. Usa bypass_cache=True solo se l'utente chiede un nuovo report."""
+        return invoke_cached(get_llm(), report_messages(domain, checked_sources), bypass=bypass_cache,
+                             stream_label="report")
+
+    shared = {t.name: t for t in (evaluate_source, generate_article, check_fact, generate_report)}
+    for name, description in domain["descriptions"].items():
+        shared[name].description = description  # la descrizione che l'LLM del blog ha sempre visto
+    return shared
+
+# Prima Agent_AI e versione1 avevano ognuno la sua copia di questi quattro tool, con prompt quasi uguali e
+# comportamenti diversi (solo il cinema usava cache e passaggi della fonte). Ora i tool sono creati per dominio da
+# make_tools con lo stesso codice, ma ogni blog tiene i testi dei suoi prompt e delle descrizioni (tool_prompts e
+# descriptions in DOMAINS) e la sua reputazione delle fonti; gli altri tool (ricerca, scraping, suggerimenti)
+# restano nel modulo del dominio e la lista esposta all'LLM è quella di DOMAINS[...]["tools"].
+
+
+def select_tools(domain, available):
+    """I tool elencati nella configurazione del dominio, nell'ordine della configurazione."""
+    by_name = {t.name: t for t in available}
+    return [by_name[name] for name in domain["tools"]]
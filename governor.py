@@ -0,0 +1,328 @@
+import os
+import time
+import random
+import asyncio
+import threading
+from collections import deque
+from email.utils import parsedate_to_datetime
+
+# === CONFIGURAZIONE DEI LIMITI PER BACKEND ===
+# Per ogni servizio esterno: richieste e token al minuto, concorrenza iniziale e massima, tentativi
+BACKENDS = {
+    "openai": {"rpm": float(os.getenv("OPENAI_RPM", "500")), "tpm": float(os.getenv("OPENAI_TPM", "200000")),
+               "concurrency": int(os.getenv("OPENAI_CONCURRENCY", "8")),
+               "max_concurrency": int(os.getenv("OPENAI_MAX_CONCURRENCY", "32"))},
+    "tavily": {"rpm": float(os.getenv("TAVILY_RPM", "100")), "tpm": None,
+               "concurrency": int(os.getenv("TAVILY_CONCURRENCY", "4")),
+               "max_concurrency": int(os.getenv("TAVILY_MAX_CONCURRENCY", "8"))},
+    "duckduckgo": {"rpm": float(os.getenv("DUCKDUCKGO_RPM", "30")), "tpm": None,
+                   "concurrency": 2, "max_concurrency": 4},
+}
+MAX_RETRIES = int(os.getenv("GOVERNOR_MAX_RETRIES", "5"))
+BASE_DELAY = float(os.getenv("GOVERNOR_BASE_DELAY", "0.5"))  # secondi, raddoppiati a ogni tentativo
+MAX_DELAY = float(os.getenv("GOVERNOR_MAX_DELAY", "30"))
+BREAKER_FAILURES = int(os.getenv("GOVERNOR_BREAKER_FAILURES", "5"))  # errori consecutivi che aprono il circuito
+BREAKER_COOLDOWN = float(os.getenv("GOVERNOR_BREAKER_COOLDOWN", "30"))  # secondi prima di riprovare
+RETRYABLE_STATUS = {408, 409, 429, 500, 502, 503, 504}
+# Eccezioni dei client che non conservano il codice HTTP (tavily-python), per nome della classe
+ERROR_STATUS = {"UsageLimitExceededError": 429, "ForbiddenError": 403, "InvalidAPIKeyError": 401,
+                "BadRequestError": 400}
+
+
+class CircuitOpenError(RuntimeError):
+    """Il servizio è considerato fuori uso: la chiamata non viene neanche tentata."""
+
+
+# === ANALISI DEGLI ERRORI ===
+def status_code(error):
+    # openai e httpx espongono status_code o response.status_code, urllib usa code
+    for obj in (error, getattr(error, "response", None)):
+        code = getattr(obj, "status_code", None) or getattr(obj, "code", None)
+        if isinstance(code, int):
+            return code
+    # tavily-python solleva UsageLimitExceededError per i 429, senza status_code né response
+    for cls in type(error).__mro__:
+        if cls.__name__ in ERROR_STATUS:
+            return ERROR_STATUS[cls.__name__]
+    return None
+
+
+def retry_after(error):
+    """Secondi indicati dal server in Retry-After (o retry-after-ms di OpenAI), se presenti."""
+    headers = getattr(getattr(error, "response", None), "headers", None) or getattr(error, "headers", None) or {}
+    if isinstance(getattr(error, "retry_after_seconds", None), (int, float)):
+        return float(error.retry_after_seconds)  # TavilyKeylessLimitError
+    try:
+        if headers.get("retry-after-ms"):
+            return float(headers["retry-after-ms"]) / 1000
+        value = headers.get("Retry-After") or headers.get("retry-after")
+        if not value:
+            return None
+        try:
+            return float(value)
+        except ValueError:
+            return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError, AttributeError):
+        return None
+
+
+def is_transient(error):
+    # Timeout e connessioni cadute, per nome così non serve importare openai, httpx, requests o tavily
+    # (tavily.errors.TimeoutError non deriva da quello built-in)
+    name = type(error).__name__
+    return isinstance(error, (TimeoutError, ConnectionError)) or "Timeout" in name or "Connection" in name
+
+
+# === TOKEN BUCKET ===
+class TokenBucket:
+    """Limite di velocità: rate unità al minuto, con una riserva pari a un minuto di traffico."""
+
+    def __init__(self, per_minute):
+        self.rate = per_minute / 60.0
+        self.capacity = per_minute
+        self.tokens = per_minute
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def reserve(self, amount=1):
+        """Prenota amount unità e restituisce quanti secondi aspettare prima di usarle."""
+        with self._lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            self.tokens -= min(amount, self.capacity)  # il saldo può andare in negativo: è l'attesa dei prossimi
+            return max(0.0, -self.tokens / self.rate)
+
+    def adjust(self, amount):
+        # Correzione a posteriori, quando i token effettivi sono diversi dalla stima
+        with self._lock:
+            self.tokens = min(self.capacity, self.tokens - amount)
+
+
+# === CONCORRENZA ADATTIVA (AIMD) ===
+class AdaptiveConcurrency:
+    """Limite di chiamate contemporanee che cresce di 1 ogni limit successi e si dimezza quando il servizio rallenta."""
+
+    def __init__(self, initial, maximum, minimum=1):
+        self.limit = float(initial)
+        self.minimum = minimum
+        self.maximum = maximum
+        self.in_flight = 0
+        self._cond = threading.Condition()
+        self._async_waiters = deque()
+
+    def _try_acquire(self):
+        if self.in_flight < int(self.limit):
+            self.in_flight += 1
+            return True
+        return False
+
+    def acquire(self):
+        with self._cond:
+            while not self._try_acquire():
+                self._cond.wait()
+
+    async def aacquire(self):
+        # I chiamanti asincroni aspettano un future, svegliato da release anche se arriva da un altro thread
+        while True:
+            with self._cond:
+                if self._try_acquire():
+                    return
+                loop = asyncio.get_running_loop()
+                waiter = loop.create_future()
+                self._async_waiters.append((loop, waiter))
+            await waiter
+
+    def release(self):
+        with self._cond:
+            self.in_flight -= 1
+            self._wake()
+
+    def _wake(self):
+        self._cond.notify_all()
+        while self._async_waiters:
+            loop, waiter = self._async_waiters.popleft()
+            loop.call_soon_threadsafe(lambda w=waiter: w.done() or w.set_result(None))
+
+    def on_success(self):
+        with self._cond:
+            self.limit = min(self.maximum, self.limit + 1 / self.limit)
+            self._wake()
+
+    def on_throttle(self):
+        with self._cond:
+            self.limit = max(self.minimum, self.limit / 2)
+
+
+# === CIRCUIT BREAKER ===
+class CircuitBreaker:
+    """Dopo failures errori consecutivi blocca le chiamate per cooldown secondi, poi lascia passare un tentativo."""
+
+    def __init__(self, failures=BREAKER_FAILURES, cooldown=BREAKER_COOLDOWN):
+        self.failures = failures
+        self.cooldown = cooldown
+        self.consecutive = 0
+        self.opened_at = None
+        self.trial = False
+        self._lock = threading.Lock()
+
+    def check(self, name):
+        with self._lock:
+            if self.opened_at is None:
+                return
+            remaining = self.opened_at + self.cooldown - time.monotonic()
+            if remaining > 0 or self.trial:
+                raise CircuitOpenError(f"servizio {name} non disponibile, riprova tra {max(remaining, 1):.0f} s")
+            self.trial = True  # semiaperto: passa solo questa chiamata di prova
+
+    def record_success(self):
+        with self._lock:
+            self.consecutive = 0
+            self.opened_at = None
+            self.trial = False
+
+    def record_failure(self):
+        with self._lock:
+            self.consecutive += 1
+            if self.trial or self.consecutive >= self.failures:
+                self.opened_at = time.monotonic()
+            self.trial = False
+
+# Il circuito si apre solo per errori del servizio (5xx, timeout, connessione), non per i 429: quelli vengono
+# gestiti rallentando (AIMD e Retry-After), perché il servizio è vivo ma chiede di andare più piano.
+
+
+# === GOVERNATORE DI UN BACKEND ===
+class Backend:
+    """Tutte le chiamate verso un servizio esterno: limiti di velocità, concorrenza, retry e circuit breaker."""
+
+    def __init__(self, name, rpm, tpm=None, concurrency=4, max_concurrency=16, max_retries=MAX_RETRIES,
+                 base_delay=BASE_DELAY, max_delay=MAX_DELAY):
+        self.name = name
+        self.requests = TokenBucket(rpm)
+        self.tokens = TokenBucket(tpm) if tpm else None
+        self.concurrency = AdaptiveConcurrency(concurrency, max_concurrency)
+        self.breaker = CircuitBreaker()
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self._lock = threading.Lock()
+        self.counters = {"calls": 0, "retries": 0, "throttled": 0, "failures": 0}
+
+    def _count(self, key):
+        with self._lock:
+            self.counters[key] += 1
+
+    def _admission_delay(self, tokens):
+        self.breaker.check(self.name)
+        delay = self.requests.reserve(1)
+        if self.tokens and tokens:
+            delay = max(delay, self.tokens.reserve(tokens))
+        return delay
+
+    def _after_error(self, error, attempt):
+        """Aggiorna AIMD e circuit breaker; restituisce l'attesa prima del prossimo tentativo, o None se non si riprova."""
+        status = status_code(error)
+        if status == 429:
+            self._count("throttled")
+            self.concurrency.on_throttle()
+        if (status is not None and status >= 500) or (status is None and is_transient(error)):
+            self._count("failures")
+            self.breaker.record_failure()
+        else:
+            self.breaker.record_success()  # il servizio ha risposto, quindi è vivo
+        if not (status in RETRYABLE_STATUS or (status is None and is_transient(error))) or attempt >= self.max_retries:
+            return None
+        self._count("retries")
+        # Backoff esponenziale con jitter completo; Retry-After del server ha la precedenza
+        wait = retry_after(error)
+        return wait if wait is not None else random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+
+    def _after_success(self, result, tokens, usage):
+        self.breaker.record_success()
+        self.concurrency.on_success()
+        if self.tokens and usage is not None:
+            actual = usage(result)
+            if actual:
+                self.tokens.adjust(actual - tokens)
+
+    def call(self, fn, *args, tokens=0, usage=None, **kwargs):
+        """Esegue fn(*args, **kwargs) rispettando i limiti del backend e riprovando gli errori temporanei."""
+        self._count("calls")
+        for attempt in range(self.max_retries + 1):
+            time.sleep(self._admission_delay(tokens))
+            self.concurrency.acquire()
+            try:
+                result = fn(*args, **kwargs)
+            except Exception as e:
+                wait = self._after_error(e, attempt)
+                if wait is None:
+                    raise
+            else:
+                self._after_success(result, tokens, usage)
+                return result
+            finally:
+                self.concurrency.release()
+            time.sleep(wait)
+
+    async def acall(self, fn, *args, tokens=0, usage=None, **kwargs):
+        """Come call, per funzioni asincrone."""
+        self._count("calls")
+        for attempt in range(self.max_retries + 1):
+            await asyncio.sleep(self._admission_delay(tokens))
+            await self.concurrency.aacquire()
+            try:
+                result = await fn(*args, **kwargs)
+            except Exception as e:
+                wait = self._after_error(e, attempt)
+                if wait is None:
+                    raise
+            else:
+                self._after_success(result, tokens, usage)
+                return result
+            finally:
+                self.concurrency.release()
+            await asyncio.sleep(wait)
+
+    def stats(self):
+        with self._lock:
+            return {**self.counters, "concurrency": round(self.concurrency.limit, 2),
+                    "circuit_open": self.breaker.opened_at is not None}
+
+# Ogni chiamata prenota una richiesta e i token stimati dai token bucket (se il budget al minuto è finito aspetta),
+# poi entra nel limite di concorrenza. I 429 dimezzano la concorrenza e i successi la fanno risalire di poco
+# (AIMD), così sotto carico il batch si assesta da solo appena sotto il limite del fornitore. Gli errori temporanei
+# vengono riprovati fino a MAX_RETRIES volte con backoff esponenziale e jitter, rispettando Retry-After.
+
+
+_backends = {}
+_backends_lock = threading.Lock()
+
+
+def get_backend(name):
+    with _backends_lock:
+        if name not in _backends:
+            _backends[name] = Backend(name, **BACKENDS.get(name, {"rpm": 60}))
+        return _backends[name]
+
+
+# === CHIAMATE LLM GOVERNATE ===
+def estimate_tokens(messages):
+    # Stima grossolana (prompt + risposta tipica), corretta dopo la chiamata con i token effettivi
+    return sum(len(str(m.content)) for m in messages) // 4 + 500
+
+
+def response_tokens(message):
+    usage = getattr(message, "usage_metadata", None) or {}
+    return usage.get("total_tokens")
+
+
+def invoke_llm(llm, messages, config=None):
+    """llm.invoke passando dal governatore di OpenAI."""
+    return get_backend("openai").call(llm.invoke, messages, config=config,
+                                      tokens=estimate_tokens(messages), usage=response_tokens)
+
+
+async def ainvoke_llm(llm, messages, config=None):
+    return await get_backend("openai").acall(llm.ainvoke, messages, config=config,
+                                             tokens=estimate_tokens(messages), usage=response_tokens)
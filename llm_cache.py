@@ -0,0 +1,167 @@
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+
+from langchain_core.callbacks.manager import dispatch_custom_event, adispatch_custom_event
+
+from governor import invoke_llm, ainvoke_llm
+
+# === CONFIGURAZIONE DELLA CACHE ===
+CACHE_PATH = os.getenv("LLM_CACHE_PATH", os.path.join(".cache", "llm_cache.sqlite"))
+CACHE_TTL = float(os.getenv("LLM_CACHE_TTL", str(7 * 24 * 3600)))  # una settimana
+CACHE_MAX_ENTRIES = int(os.getenv("LLM_CACHE_MAX_ENTRIES", "5000"))
+
+
+class LLMCache:
+    """Cache persistente su SQLite per le risposte dell'LLM, con TTL ed eviction LRU."""
+
+    def __init__(self, path=CACHE_PATH, ttl=CACHE_TTL, max_entries=CACHE_MAX_ENTRIES):
+        self.path = path
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            """CREATE TABLE IF NOT EXISTS responses (
+                   key TEXT PRIMARY KEY,
+                   value TEXT NOT NULL,
+                   created REAL NOT NULL,
+                   last_access REAL NOT NULL
+               )"""
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_last_access ON responses(last_access)")
+        self._conn.commit()
+
+    @staticmethod
+    def make_key(model, temperature, system_prompt, human_prompt):
+        payload = json.dumps([model, temperature, system_prompt, human_prompt], ensure_ascii=False)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def get(self, key):
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute("SELECT value, created FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is None or (self.ttl and now - row[1] > self.ttl):
+                if row is not None:
+                    self._conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+                    self._conn.commit()
+                self.misses += 1
+                return None
+            self._conn.execute("UPDATE responses SET last_access = ? WHERE key = ?", (now, key))
+            self._conn.commit()
+            self.hits += 1
+            return row[0]
+
+    def set(self, key, value):
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO responses (key, value, created, last_access) VALUES (?, ?, ?, ?)",
+                (key, value, now, now),
+            )
+            self._evict()
+            self._conn.commit()
+
+    def _evict(self):
+        # Prima si eliminano le voci scadute, poi le meno usate di recente oltre il limite
+        if self.ttl:
+            self._conn.execute("DELETE FROM responses WHERE created < ?", (time.time() - self.ttl,))
+        count = self._conn.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+        if count > self.max_entries:
+            self._conn.execute(
+                "DELETE FROM responses WHERE key IN (SELECT key FROM responses ORDER BY last_access ASC LIMIT ?)",
+                (count - self.max_entries,),
+            )
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute("DELETE FROM responses")
+            self._conn.commit()
+
+    def stats(self):
+        with self._lock:
+            size = self._conn.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+        return {"hits": self.hits, "misses": self.misses, "entries": size}
+
+# La chiave è un hash di modello, temperatura, prompt di sistema e prompt umano: se uno solo di questi cambia
+# la risposta viene richiesta di nuovo all'LLM. Le voci scadono dopo CACHE_TTL secondi e, superato CACHE_MAX_ENTRIES,
+# vengono eliminate quelle usate meno di recente. La cache sopravvive ai riavvii perché è salvata su disco.
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_cache():
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = LLMCache()
+        return _cache
+
+
+def cache_key_for(llm, messages):
+    model = getattr(llm, "model_name", None) or getattr(llm, "model", "")
+    temperature = getattr(llm, "temperature", None)
+    system_prompt = "\n".join(m.content for m in messages if m.type == "system")
+    human_prompt = "\n".join(m.content for m in messages if m.type != "system")
+    return LLMCache.make_key(model, temperature, system_prompt, human_prompt)
+
+
+def llm_config(stream_label):
+    # stream_label finisce nei metadata della chiamata e permette alla console di mostrarne i token in streaming
+    return {"metadata": {"stream_label": stream_label}} if stream_label else None
+
+
+def _cache_event(hit):
+    # Segnala hit/miss ai callback (telemetria); fuori da un runnable non c'è nessuno a cui segnalarlo
+    try:
+        dispatch_custom_event("llm_cache", {"hit": hit})
+    except Exception:
+        pass
+
+
+async def _acache_event(hit):
+    try:
+        await adispatch_custom_event("llm_cache", {"hit": hit})
+    except Exception:
+        pass
+
+
+def invoke_cached(llm, messages, bypass=False, stream_label=None):
+    """Invoca l'LLM passando dalla cache; con bypass=True la risposta viene sempre rigenerata."""
+    cache = get_cache()
+    key = cache_key_for(llm, messages)
+    if not bypass:
+        cached = cache.get(key)
+        _cache_event(cached is not None)
+        if cached is not None:
+            return cached
+    content = invoke_llm(llm, messages, config=llm_config(stream_label)).content
+    cache.set(key, content)
+    return content
+
+# Con bypass=True la chiamata all'LLM viene fatta comunque, ma il risultato aggiorna la cache,
+# così le richieste successive ottengono la risposta più recente.
+
+
+async def ainvoke_cached(llm, messages, bypass=False, stream_label=None):
+    """Versione asincrona di invoke_cached, basata su llm.ainvoke."""
+    cache = get_cache()
+    key = cache_key_for(llm, messages)
+    if not bypass:
+        cached = cache.get(key)
+        await _acache_event(cached is not None)
+        if cached is not None:
+            return cached
+    content = (await ainvoke_llm(llm, messages, config=llm_config(stream_label))).content
+    cache.set(key, content)
+    return content
@@ -0,0 +1,259 @@
+import os
+import re
+import csv
+import sys
+import json
+import math
+import time
+import sqlite3
+import argparse
+import threading
+from urllib.parse import urlsplit
+
+from pydantic import BaseModel, Field, ValidationError, field_validator
+
+# === CONFIGURAZIONE DELLA REPUTAZIONE DELLE FONTI ===
+REPUTATION_PATH = os.getenv("REPUTATION_PATH", os.path.join(".cache", "reputation.sqlite"))
+MIN_CONFIDENCE = float(os.getenv("REPUTATION_MIN_CONFIDENCE", "0.75"))  # sopra questa soglia non si chiama l'LLM
+REEVALUATE_AFTER = float(os.getenv("REPUTATION_REEVALUATE_AFTER", str(14 * 24 * 3600)))  # età massima del giudizio
+SEED_WEIGHT = 10.0  # una riga del CSV vale come 10 valutazioni concordi
+SEED_CSV = os.path.join(os.path.dirname(os.path.abspath(__file__)), "reputation_seed.csv")
+DEFAULT_BLOG = "cinema"  # blog delle valutazioni salvate prima che la reputazione fosse separata per blog
+MAX_COMMENT_CHARS = 500
+
+# Suffissi pubblici di secondo livello più comuni; con tldextract installato si usa la lista completa
+TWO_LEVEL_SUFFIXES = {"co.uk", "org.uk", "ac.uk", "gov.uk", "com.au", "net.au", "co.jp", "com.br", "co.nz",
+                      "co.in", "com.mx", "com.ar", "co.za", "com.tr", "com.cn"}
+
+
+class SourceEvaluation(BaseModel):
+    """Valutazione di una fonte, nel formato chiesto all'LLM."""
+
+    score: int = Field(ge=1, le=10)
+    comment: str = Field(min_length=1)
+
+    @field_validator("comment", mode="before")
+    @classmethod
+    def truncate(cls, value):
+        # Un commento troppo lungo si accorcia: il punteggio resta valido
+        return value[:MAX_COMMENT_CHARS] if isinstance(value, str) else value
+
+
+def parse_evaluation(text):
+    """Estrae e valida il JSON della valutazione dalla risposta dell'LLM; None se non è valido."""
+    match = re.search(r"\{.*\}", text or "", re.DOTALL)
+    if not match:
+        return None
+    try:
+        return SourceEvaluation.model_validate_json(match.group(0))
+    except ValidationError:
+        return None
+
+
+def registrable_domain(url):
+    """Dominio registrabile dell'URL (www.gazzetta.it/... -> gazzetta.it, news.bbc.co.uk -> bbc.co.uk)."""
+    host = (urlsplit(url if "//" in url else f"//{url}").hostname or "").lower().rstrip(".")
+    try:
+        import tldextract
+        extracted = tldextract.extract(host)
+        if extracted.domain and extracted.suffix:
+            return f"{extracted.domain}.{extracted.suffix}"
+    except ImportError:
+        pass
+    labels = host.split(".")
+    if re.fullmatch(r"[\d.]+", host) or len(labels) <= 2:
+        return host
+    return ".".join(labels[-3:] if ".".join(labels[-2:]) in TWO_LEVEL_SUFFIXES else labels[-2:])
+
+
+def confidence(weight, variance):
+    # Cresce con il numero di valutazioni e cala se i punteggi sono discordi (deviazione standard su scala 1-10)
+    return round(weight / (weight + 2) * max(0.0, 1 - math.sqrt(max(variance, 0.0)) / 5), 3)
+
+
+class ReputationStore:
+    """Reputazione delle fonti per dominio: valutazioni per URL su SQLite, aggregate in punteggio medio e confidenza.
+
+    Ogni blog ha la sua reputazione (colonna blog): i criteri di valutazione di un blog di cinema e di uno sportivo
+    sono diversi, quindi il giudizio dato da uno non vale per l'altro.
+    """
+
+    def __init__(self, path=REPUTATION_PATH, blog=DEFAULT_BLOG, min_confidence=MIN_CONFIDENCE,
+                 reevaluate_after=REEVALUATE_AFTER):
+        self.blog = blog
+        self.min_confidence = min_confidence
+        self.reevaluate_after = reevaluate_after
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            """CREATE TABLE IF NOT EXISTS source_evaluations (
+                   blog TEXT NOT NULL,
+                   url TEXT NOT NULL,
+                   domain TEXT NOT NULL,
+                   score REAL NOT NULL,
+                   comment TEXT NOT NULL,
+                   weight REAL NOT NULL DEFAULT 1,
+                   source TEXT NOT NULL,
+                   evaluated REAL NOT NULL,
+                   PRIMARY KEY (blog, url)
+               )"""
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_source_evaluations_domain ON source_evaluations(blog, domain)")
+        # Tabella della versione senza blog: le sue valutazioni erano tutte del blog di cinema
+        if self._conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'evaluations'").fetchone():
+            self._conn.execute(
+                """INSERT OR IGNORE INTO source_evaluations
+                   SELECT ?, url, domain, score, comment, weight, source, evaluated FROM evaluations""", (DEFAULT_BLOG,))
+            self._conn.execute("DROP TABLE evaluations")
+        self._conn.commit()
+
+    def record(self, url, evaluation, source="llm", weight=1.0, domain=None):
+        # Una valutazione per URL: rivalutare lo stesso URL (o rileggerlo dalla cache LLM) non la conta due volte
+        with self._lock:
+            self._conn.execute(
+                """INSERT OR REPLACE INTO source_evaluations
+                   (blog, url, domain, score, comment, weight, source, evaluated) VALUES (?, ?, ?, ?, ?, ?, ?, ?)""",
+                (self.blog, url, domain or registrable_domain(url), evaluation.score, evaluation.comment, weight, source,
+                 time.time()),
+            )
+            self._conn.commit()
+
+    def seed(self, domain, score, comment, weight=SEED_WEIGHT):
+        self.record(f"seed:{domain}", SourceEvaluation(score=score, comment=comment), source="seed", weight=weight,
+                    domain=domain)
+
+    def reputation(self, domain):
+        """Punteggio medio, peso totale, confidenza e commento più recente del dominio, oppure None."""
+        with self._lock:
+            row = self._conn.execute(
+                """SELECT SUM(weight), SUM(weight * score), SUM(weight * score * score), MAX(evaluated)
+                   FROM source_evaluations WHERE blog = ? AND domain = ?""", (self.blog, domain)).fetchone()
+            if not row[0]:
+                return None
+            comment = self._conn.execute(
+                """SELECT comment FROM source_evaluations WHERE blog = ? AND domain = ?
+                   ORDER BY evaluated DESC LIMIT 1""", (self.blog, domain)).fetchone()[0]
+        weight, total, squares, evaluated = row
+        mean = total / weight
+        return {"domain": domain, "score": round(mean, 2), "weight": weight,
+                "confidence": confidence(weight, squares / weight - mean * mean),
+                "comment": comment, "evaluated": evaluated}
+
+    def verdict(self, url):
+        """Valutazione salvata da usare al posto dell'LLM, se la confidenza è alta e il giudizio non è vecchio."""
+        rep = self.reputation(registrable_domain(url))
+        if (rep is None or rep["confidence"] < self.min_confidence
+                or time.time() - rep["evaluated"] > self.reevaluate_after):
+            self.misses += 1
+            return None
+        self.hits += 1
+        return json.dumps({"score": round(rep["score"]), "comment": rep["comment"], "domain": rep["domain"],
+                           "confidence": rep["confidence"]}, ensure_ascii=False)
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute("DELETE FROM source_evaluations WHERE blog = ?", (self.blog,))
+            self._conn.commit()
+
+    def stats(self):
+        with self._lock:
+            domains = self._conn.execute("SELECT COUNT(DISTINCT domain) FROM source_evaluations WHERE blog = ?",
+                                         (self.blog,)).fetchone()[0]
+        return {"hits": self.hits, "misses": self.misses, "domains": domains}
+
+# Ogni valutazione dell'LLM viene validata (score intero 1-10 e commento) e salvata per URL; la reputazione di un
+# dominio è la media pesata delle sue valutazioni, con una confidenza che cresce con il loro numero e cala se sono
+# discordi. Sopra MIN_CONFIDENCE evaluate_source risponde dal database senza chiamare l'LLM, finché l'ultima
+# valutazione del dominio non è più vecchia di REEVALUATE_AFTER: a quel punto l'LLM viene interpellato di nuovo e
+# il suo giudizio aggiorna la media. Le testate note si possono precaricare da un CSV (domain,score,comment,blog).
+
+
+_stores = {}
+_stores_lock = threading.Lock()
+
+
+def get_reputation(blog=DEFAULT_BLOG):
+    with _stores_lock:
+        if blog not in _stores:
+            _stores[blog] = ReputationStore(blog=blog)
+        return _stores[blog]
+
+
+def _store_evaluation(url, text, blog):
+    evaluation = parse_evaluation(text)
+    if evaluation is None:
+        return text  # risposta non valida: la si restituisce così com'è, senza sporcare la reputazione
+    get_reputation(blog).record(url, evaluation)
+    return evaluation.model_dump_json()
+
+
+def evaluate_with_reputation(url, ask_llm, bypass=False, blog=DEFAULT_BLOG):
+    """Valutazione della fonte: dalla reputazione del dominio nel blog se affidabile, altrimenti ask_llm() e poi
+    salvataggio."""
+    if not bypass:
+        verdict = get_reputation(blog).verdict(url)
+        if verdict is not None:
+            return verdict
+    return _store_evaluation(url, ask_llm(), blog)
+
+
+async def aevaluate_with_reputation(url, ask_llm, bypass=False, blog=DEFAULT_BLOG):
+    """Come evaluate_with_reputation, con ask_llm asincrona."""
+    if not bypass:
+        verdict = get_reputation(blog).verdict(url)
+        if verdict is not None:
+            return verdict
+    return _store_evaluation(url, await ask_llm(), blog)
+
+
+# === PRECARICAMENTO DA CSV ===
+def seed_from_csv(path, blogs=None):
+    """Carica le testate note da un CSV con colonne domain, score, comment (weight e blog facoltativi).
+
+    Una riga con blog vuoto vale per tutti i blog; blogs limita il caricamento ad alcuni blog (predefinito: tutti
+    quelli nominati nel CSV, più DEFAULT_BLOG).
+    """
+    with open(path, newline="", encoding="utf-8") as f:
+        rows = list(csv.DictReader(f))
+    blogs = blogs or sorted({row.get("blog") or DEFAULT_BLOG for row in rows} | {DEFAULT_BLOG})
+    count = 0
+    for row in rows:
+        for blog in [row["blog"]] if row.get("blog") else blogs:
+            if blog not in blogs:
+                continue
+            get_reputation(blog).seed(registrable_domain(row["domain"]), int(row["score"]), row["comment"],
+                                      float(row.get("weight") or SEED_WEIGHT))
+            count += 1
+    return count
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Gestione della reputazione delle fonti per dominio.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    seed_parser = commands.add_parser("seed", help="precarica le testate da un CSV (domain,score,comment[,weight])")
+    seed_parser.add_argument("csv", nargs="?", default=SEED_CSV)
+    seed_parser.add_argument("--blog", action="append", help="carica solo le righe di questo blog (ripetibile)")
+    show_parser = commands.add_parser("show", help="mostra la reputazione di uno o più domini")
+    show_parser.add_argument("domains", nargs="+")
+    show_parser.add_argument("--blog", default=DEFAULT_BLOG)
+    args = parser.parse_args()
+
+    if args.command == "seed":
+        print(f"✅ {seed_from_csv(args.csv, args.blog)} valutazioni di testate caricate in {REPUTATION_PATH}")
+    else:
+        for domain in args.domains:
+            rep = get_reputation(args.blog).reputation(registrable_domain(domain))
+            if rep is None:
+                print(f"{domain}: nessuna valutazione")
+            else:
+                print(f"{rep['domain']}: punteggio {rep['score']}  confidenza {rep['confidence']}  "
+                      f"peso {rep['weight']:g}  — {rep['comment']}")
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,250 @@
+import os
+import re
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+from array import array
+from functools import lru_cache
+
+# === CONFIGURAZIONE DELL'INDICE ===
+INDEX_PATH = os.getenv("RETRIEVAL_INDEX_PATH", os.path.join(".cache", "retrieval.sqlite"))
+SEARCH_TTL = float(os.getenv("RETRIEVAL_SEARCH_TTL", str(7 * 24 * 3600)))  # oltre questa età i risultati sono vecchi
+MIN_INDEX_HITS = int(os.getenv("RETRIEVAL_MIN_HITS", "3"))  # fonti diverse necessarie per evitare la ricerca web
+PASSAGE_CHARS = 600  # lunghezza indicativa dei passaggi in cui vengono divise le pagine
+EMBED_MODEL = os.getenv("RETRIEVAL_EMBED_MODEL")  # modello locale di sentence-transformers, facoltativo
+
+STOPWORDS = {
+    "che", "con", "del", "della", "dei", "delle", "degli", "dal", "dalla", "nel", "nella", "per", "una", "uno",
+    "sul", "sulla", "sui", "gli", "le", "lo", "il", "di", "da", "in", "su", "tra", "fra", "non", "come", "anche",
+    "più", "sono", "era", "alla", "allo", "agli", "alle", "questo", "questa", "the", "and", "for", "with", "from",
+}
+
+
+def terms(text, limit=None):
+    """Parole significative del testo, senza duplicati e nell'ordine in cui compaiono."""
+    words = [w for w in re.findall(r"\w+", text.lower()) if len(w) > 2 and w not in STOPWORDS]
+    return list(dict.fromkeys(words))[:limit]
+
+
+def normalize_query(topic):
+    # "Oppenheimer film" e "film oppenheimer" sono la stessa ricerca
+    return " ".join(sorted(terms(topic)))
+
+
+def split_passages(text, size=PASSAGE_CHARS):
+    """Divide un testo in passaggi di circa size caratteri, senza spezzare i paragrafi."""
+    passages, current = [], ""
+    for paragraph in (p.strip() for p in text.split("\n")):
+        if not paragraph:
+            continue
+        if current and len(current) + len(paragraph) > size:
+            passages.append(current)
+            current = ""
+        current = f"{current}\n{paragraph}" if current else paragraph
+    if current:
+        passages.append(current)
+    return passages
+
+
+@lru_cache(maxsize=1)
+def _embedder(model_name):
+    if not model_name:
+        return None
+    try:
+        from sentence_transformers import SentenceTransformer
+        return SentenceTransformer(model_name)
+    except Exception:
+        return None  # sentence-transformers non installato o modello non disponibile: si usa solo BM25
+
+
+def embed(texts):
+    model = _embedder(EMBED_MODEL)
+    if model is None:
+        return None
+    return [array("f", vector).tobytes() for vector in model.encode(texts, normalize_embeddings=True)]
+
+
+def _cosine(a, b):
+    # I vettori sono già normalizzati, quindi basta il prodotto scalare
+    return sum(x * y for x, y in zip(array("f", a), array("f", b)))
+
+
+class RetrievalIndex:
+    """Indice locale (SQLite FTS5 con BM25) dei risultati di ricerca e dei testi delle pagine già scaricate."""
+
+    def __init__(self, path=INDEX_PATH, search_ttl=SEARCH_TTL, min_hits=MIN_INDEX_HITS):
+        self.search_ttl = search_ttl
+        self.min_hits = min_hits
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(
+            """CREATE TABLE IF NOT EXISTS documents (
+                   url TEXT NOT NULL,
+                   kind TEXT NOT NULL,
+                   title TEXT,
+                   score REAL,
+                   digest TEXT NOT NULL,
+                   updated REAL NOT NULL,
+                   PRIMARY KEY (url, kind)
+               );
+               CREATE TABLE IF NOT EXISTS queries (
+                   query TEXT PRIMARY KEY,
+                   urls TEXT NOT NULL,
+                   fetched REAL NOT NULL
+               );
+               CREATE VIRTUAL TABLE IF NOT EXISTS passages USING fts5(
+                   text, url UNINDEXED, kind UNINDEXED, tokenize = 'unicode61 remove_diacritics 2'
+               );
+               CREATE TABLE IF NOT EXISTS embeddings (
+                   passage_id INTEGER PRIMARY KEY,
+                   vector BLOB NOT NULL
+               );"""
+        )
+        self._conn.commit()
+
+    # --- aggiornamento incrementale ---
+    def _put_document(self, url, kind, text, title=None, score=None):
+        # Se il testo non è cambiato si aggiorna solo la data, senza reindicizzare i passaggi
+        digest = hashlib.sha1(text.encode("utf-8")).hexdigest()
+        row = self._conn.execute("SELECT digest FROM documents WHERE url = ? AND kind = ?", (url, kind)).fetchone()
+        if row is None or row[0] != digest:
+            old_ids = [r[0] for r in self._conn.execute(
+                "SELECT rowid FROM passages WHERE url = ? AND kind = ?", (url, kind))]
+            self._conn.executemany("DELETE FROM embeddings WHERE passage_id = ?", [(i,) for i in old_ids])
+            self._conn.execute("DELETE FROM passages WHERE url = ? AND kind = ?", (url, kind))
+            chunks = split_passages(text) if kind == "page" else [text]
+            vectors = embed(chunks)
+            for i, chunk in enumerate(chunks):
+                cur = self._conn.execute("INSERT INTO passages (text, url, kind) VALUES (?, ?, ?)", (chunk, url, kind))
+                if vectors:
+                    self._conn.execute("INSERT INTO embeddings (passage_id, vector) VALUES (?, ?)",
+                                       (cur.lastrowid, vectors[i]))
+        self._conn.execute(
+            "INSERT OR REPLACE INTO documents (url, kind, title, score, digest, updated) VALUES (?, ?, ?, ?, ?, ?)",
+            (url, kind, title, score, digest, time.time()),
+        )
+
+    def add_search(self, topic, results):
+        """Salva i risultati di una ricerca web (nel formato di Tavily) e il topic che li ha prodotti."""
+        with self._lock:
+            for r in results:
+                self._put_document(r["url"], "search", r["content"].strip(), r.get("title"), r.get("score"))
+            self._conn.execute("INSERT OR REPLACE INTO queries (query, urls, fetched) VALUES (?, ?, ?)",
+                               (normalize_query(topic), json.dumps([r["url"] for r in results]), time.time()))
+            self._conn.commit()
+
+    def add_page(self, url, text, title=None):
+        """Indicizza il testo estratto da una pagina, diviso in passaggi."""
+        if not text:
+            return
+        with self._lock:
+            self._put_document(url, "page", text, title)
+            self._conn.commit()
+
+    # --- interrogazione ---
+    def _search_results(self, urls, cutoff):
+        placeholders = ",".join("?" * len(urls))
+        rows = self._conn.execute(
+            f"""SELECT d.url, d.title, d.score, p.text FROM documents d JOIN passages p
+                ON p.url = d.url AND p.kind = d.kind
+                WHERE d.kind = 'search' AND d.updated >= ? AND d.url IN ({placeholders})""",
+            (cutoff, *urls),
+        ).fetchall()
+        by_url = {url: {"url": url, "title": title or "", "content": text, "score": score or 0}
+                  for url, title, score, text in rows}
+        return [by_url[url] for url in urls if url in by_url]
+
+    def search(self, topic, max_results=5):
+        """Risultati già noti per il topic, se ce ne sono abbastanza e non sono vecchi; altrimenti None."""
+        words = terms(topic)
+        if not words:
+            return None
+        cutoff = time.time() - self.search_ttl
+        with self._lock:
+            # Stessa ricerca già fatta di recente
+            row = self._conn.execute("SELECT urls, fetched FROM queries WHERE query = ?",
+                                     (normalize_query(topic),)).fetchone()
+            if row and row[1] >= cutoff:
+                results = self._search_results(json.loads(row[0]), cutoff)
+                if results:
+                    self.hits += 1
+                    return results[:max_results]
+            # Altrimenti: risultati di altre ricerche che contengono tutte le parole del topic
+            urls = [r[0] for r in self._conn.execute(
+                """SELECT p.url FROM passages p JOIN documents d ON d.url = p.url AND d.kind = p.kind
+                   WHERE passages MATCH ? AND p.kind = 'search' AND d.updated >= ?
+                   ORDER BY bm25(passages) LIMIT ?""",
+                (" ".join(f'"{w}"' for w in words), cutoff, max_results),
+            )]
+            if len(set(urls)) >= min(self.min_hits, max_results):
+                self.hits += 1
+                return self._search_results(list(dict.fromkeys(urls)), cutoff)
+        self.misses += 1
+        return None
+
+    def passages(self, text, url=None, k=3):
+        """I k passaggi più pertinenti al testo (ad esempio un articolo), eventualmente solo di una fonte."""
+        words = terms(text, limit=40)
+        if not words:
+            return []
+        query = " OR ".join(f'"{w}"' for w in words)
+        sql = "SELECT rowid, text FROM passages WHERE passages MATCH ?"
+        params = [query]
+        if url:
+            sql += " AND url = ?"
+            params.append(url)
+        vectors = embed([text])
+        sql += " ORDER BY bm25(passages) LIMIT ?"
+        params.append(k * 4 if vectors else k)
+        with self._lock:
+            rows = self._conn.execute(sql, params).fetchall()
+            if vectors and rows:
+                # Con gli embedding i candidati di BM25 vengono riordinati per similarità semantica
+                stored = dict(self._conn.execute(
+                    f"SELECT passage_id, vector FROM embeddings WHERE passage_id IN ({','.join('?' * len(rows))})",
+                    [r[0] for r in rows]).fetchall())
+                rows.sort(key=lambda r: _cosine(vectors[0], stored[r[0]]) if r[0] in stored else -1, reverse=True)
+        return [r[1] for r in rows[:k]]
+
+    def page_text(self, url):
+        """Testo di una pagina già indicizzata (ricomposto dai passaggi), oppure None."""
+        with self._lock:
+            rows = self._conn.execute("SELECT text FROM passages WHERE url = ? AND kind = 'page' ORDER BY rowid",
+                                      (url,)).fetchall()
+        return "\n".join(r[0] for r in rows) or None
+
+    def clear(self):
+        with self._lock:
+            for table in ("documents", "queries", "passages", "embeddings"):
+                self._conn.execute(f"DELETE FROM {table}")
+            self._conn.commit()
+
+    def stats(self):
+        with self._lock:
+            documents = self._conn.execute("SELECT COUNT(*) FROM documents").fetchone()[0]
+        return {"hits": self.hits, "misses": self.misses, "documents": documents}
+
+# L'indice contiene gli snippet restituiti dalle ricerche web e il testo delle pagine scaricate, diviso in passaggi.
+# Una ricerca viene servita dall'indice se lo stesso topic è stato cercato entro SEARCH_TTL, oppure se almeno
+# MIN_INDEX_HITS fonti recenti contengono tutte le parole del topic; altrimenti si va su Tavily e i risultati
+# vengono aggiunti all'indice. Il fact-checking riceve i passaggi della fonte più vicini all'articolo (BM25, e se
+# RETRIEVAL_EMBED_MODEL è impostato anche la similarità degli embedding), invece del solo URL.
+
+
+_index = None
+_index_lock = threading.Lock()
+
+
+def get_index():
+    global _index
+    with _index_lock:
+        if _index is None:
+            _index = RetrievalIndex()
+    return _index
@@ -0,0 +1,190 @@
+import os
+import time
+import sqlite3
+import asyncio
+import threading
+from urllib.parse import urlsplit
+
+# === CONFIGURAZIONE DELLO SCRAPING ===
+SCRAPE_CACHE_PATH = os.getenv("SCRAPE_CACHE_PATH", os.path.join(".cache", "scrape_cache.sqlite"))
+SCRAPE_TIMEOUT = float(os.getenv("SCRAPE_TIMEOUT", "15"))
+SCRAPE_FRESH_TTL = float(os.getenv("SCRAPE_FRESH_TTL", "3600"))  # entro questo tempo non si contatta neanche il server
+SCRAPE_MAX_CONNECTIONS = int(os.getenv("SCRAPE_MAX_CONNECTIONS", "20"))
+SCRAPE_PER_HOST = int(os.getenv("SCRAPE_PER_HOST", "4"))
+USER_AGENT = "Mozilla/5.0 (compatible; MiniProjectAI/1.0)"
+
+
+class ScrapeCache:
+    """Cache su disco del testo estratto, con ETag e Last-Modified per le richieste condizionali."""
+
+    def __init__(self, path=SCRAPE_CACHE_PATH):
+        self._lock = threading.Lock()
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            """CREATE TABLE IF NOT EXISTS pages (
+                   url TEXT PRIMARY KEY,
+                   etag TEXT,
+                   last_modified TEXT,
+                   text TEXT NOT NULL,
+                   fetched REAL NOT NULL
+               )"""
+        )
+        self._conn.commit()
+
+    def get(self, url):
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT etag, last_modified, text, fetched FROM pages WHERE url = ?", (url,)
+            ).fetchone()
+        if row is None:
+            return None
+        return {"etag": row[0], "last_modified": row[1], "text": row[2], "fetched": row[3]}
+
+    def set(self, url, etag, last_modified, text):
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO pages (url, etag, last_modified, text, fetched) VALUES (?, ?, ?, ?, ?)",
+                (url, etag, last_modified, text, time.time()),
+            )
+            self._conn.commit()
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute("DELETE FROM pages")
+            self._conn.commit()
+
+    def touch(self, url):
+        with self._lock:
+            self._conn.execute("UPDATE pages SET fetched = ? WHERE url = ?", (time.time(), url))
+            self._conn.commit()
+
+
+def extract_main_text(html):
+    import trafilatura
+    return trafilatura.extract(html, include_comments=False, include_tables=False)
+
+
+class Scraper:
+    """Scarica pagine in modo asincrono con un pool di connessioni condiviso e limiti per host."""
+
+    def __init__(self, cache=None, timeout=SCRAPE_TIMEOUT, max_connections=SCRAPE_MAX_CONNECTIONS,
+                 per_host=SCRAPE_PER_HOST, fresh_ttl=SCRAPE_FRESH_TTL):
+        self.cache = cache if cache is not None else ScrapeCache()
+        self.timeout = timeout
+        self.max_connections = max_connections
+        self.per_host = per_host
+        self.fresh_ttl = fresh_ttl
+        self._client = None
+        self._host_limits = {}
+
+    def _get_client(self):
+        # Il client va creato dentro l'event loop che lo userà
+        if self._client is None:
+            import httpx
+            self._client = httpx.AsyncClient(
+                timeout=httpx.Timeout(self.timeout, connect=min(self.timeout, 5.0)),
+                limits=httpx.Limits(max_connections=self.max_connections,
+                                    max_keepalive_connections=self.max_connections),
+                headers={"User-Agent": USER_AGENT},
+                follow_redirects=True,
+            )
+        return self._client
+
+    def _host_limit(self, url):
+        host = urlsplit(url).netloc.lower()
+        if host not in self._host_limits:
+            self._host_limits[host] = asyncio.Semaphore(self.per_host)
+        return self._host_limits[host]
+
+    async def afetch(self, url):
+        cached = self.cache.get(url)
+        if cached and time.time() - cached["fetched"] < self.fresh_ttl:
+            return {"url": url, "text": cached["text"], "from_cache": True, "error": None}
+
+        headers = {}
+        if cached and cached["etag"]:
+            headers["If-None-Match"] = cached["etag"]
+        if cached and cached["last_modified"]:
+            headers["If-Modified-Since"] = cached["last_modified"]
+
+        try:
+            async with self._host_limit(url):
+                response = await self._get_client().get(url, headers=headers)
+        except Exception as e:
+            return {"url": url, "text": None, "from_cache": False, "error": f"impossibile scaricare il contenuto ({e})"}
+
+        if response.status_code == 304 and cached:
+            # La pagina non è cambiata: niente download e niente estrazione
+            self.cache.touch(url)
+            return {"url": url, "text": cached["text"], "from_cache": True, "error": None}
+        if response.status_code >= 400:
+            return {"url": url, "text": None, "from_cache": False,
+                    "error": f"impossibile scaricare il contenuto (HTTP {response.status_code})"}
+
+        # L'estrazione con trafilatura è CPU-bound, quindi non deve bloccare l'event loop
+        try:
+            text = await asyncio.to_thread(extract_main_text, response.text)
+        except Exception as e:
+            return {"url": url, "text": None, "from_cache": False, "error": f"impossibile estrarre il contenuto ({e})"}
+        if text is None:
+            return {"url": url, "text": None, "from_cache": False, "error": "impossibile estrarre il contenuto"}
+        self.cache.set(url, response.headers.get("ETag"), response.headers.get("Last-Modified"), text)
+        return {"url": url, "text": text, "from_cache": False, "error": None}
+
+    async def afetch_many(self, urls):
+        return await asyncio.gather(*(self.afetch(url) for url in urls))
+
+    async def aclose(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+# Lo scraper usa un solo httpx.AsyncClient, quindi le connessioni verso lo stesso sito vengono riutilizzate.
+# Ogni host ha al massimo SCRAPE_PER_HOST richieste contemporanee, per non sovraccaricare i siti delle fonti.
+# Il testo estratto viene salvato con ETag e Last-Modified: alla richiesta successiva il server può rispondere 304
+# e in quel caso si riusa il testo già estratto, senza riscaricare la pagina né rifare l'estrazione.
+
+
+# === EVENT LOOP DEDICATO ===
+# Il client asincrono è legato all'event loop in cui è stato creato. Per poterlo condividere tra i tool sincroni
+# e il codice asincrono, lo scraper gira sempre in un event loop su un thread separato.
+_loop = None
+_scraper = None
+_lock = threading.Lock()
+
+
+def _get_loop():
+    global _loop
+    with _lock:
+        if _loop is None:
+            _loop = asyncio.new_event_loop()
+            threading.Thread(target=_loop.run_forever, name="scraper-loop", daemon=True).start()
+    return _loop
+
+
+def get_scraper():
+    global _scraper
+    with _lock:
+        if _scraper is None:
+            _scraper = Scraper()
+    return _scraper
+
+
+def scrape(url):
+    """Scarica ed estrae il testo principale di un URL (chiamata sincrona)."""
+    return scrape_many([url])[0]
+
+
+def scrape_many(urls):
+    """Scarica ed estrae in parallelo una lista di URL (chiamata sincrona)."""
+    future = asyncio.run_coroutine_threadsafe(get_scraper().afetch_many(list(urls)), _get_loop())
+    return future.result()
+
+
+async def ascrape_many(urls):
+    """Come scrape_many, ma utilizzabile da codice asincrono in qualunque event loop."""
+    future = asyncio.run_coroutine_threadsafe(get_scraper().afetch_many(list(urls)), _get_loop())
+    return await asyncio.wrap_future(future)
@@ -0,0 +1,212 @@
+import os
+import re
+import json
+import uuid
+import asyncio
+import argparse
+import importlib
+from http import HTTPStatus
+from urllib.parse import urlsplit
+from concurrent.futures import ThreadPoolExecutor
+
+from langchain_core.messages import HumanMessage
+
+from domains import DOMAINS
+from governor import get_backend
+from llm_cache import get_cache
+from telemetry import get_telemetry
+
+# === CONFIGURAZIONE DEL SERVER ===
+SERVER_HOST = os.getenv("SERVER_HOST", "127.0.0.1")
+SERVER_PORT = int(os.getenv("SERVER_PORT", "8080"))
+SERVER_WORKERS = int(os.getenv("SERVER_WORKERS", "16"))  # turni di conversazione eseguiti contemporaneamente
+MAX_BODY_BYTES = 1024 * 1024
+
+
+class HTTPError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+def serialize_message(msg):
+    data = {"type": msg.type, "name": msg.name, "content": msg.content}
+    if getattr(msg, "tool_calls", None):
+        data["tool_calls"] = [{"name": call["name"], "args": call["args"]} for call in msg.tool_calls]
+    return data
+
+
+# === SESSIONI SUI GRAFI DEI DOMINI ===
+class BlogServer:
+    """Grafi di tutti i domini in un solo processo, con una sessione (thread_id) per ogni conversazione."""
+
+    def __init__(self, domains=None, workers=SERVER_WORKERS):
+        self.domains = list(domains or DOMAINS)
+        self.graphs = {}
+        self.turns = 0
+        self.running = 0
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="session")
+        self._sessions = {}  # session_id -> [lock, richieste in corso o in attesa]
+
+    def load(self):
+        # Ogni grafo viene compilato una volta, all'avvio: la prima sessione trova il processo già caldo
+        for name in self.domains:
+            module = importlib.import_module(DOMAINS[name]["module"])
+            if hasattr(module, "set_review_policy"):
+                module.set_review_policy("interrupt")  # niente terminale: la revisione si riprende con /resume
+            self.graphs[name] = module.get_graph()
+
+    def new_session(self, domain):
+        if domain not in self.graphs:
+            raise HTTPError(404, f"dominio sconosciuto: {domain}")
+        return f"{domain}-{uuid.uuid4().hex}"
+
+    def domain_of(self, session_id):
+        # Il dominio è nel session_id, così una sessione si riprende anche dopo un riavvio del server
+        domain = session_id.split("-", 1)[0]
+        if domain not in self.graphs or not re.fullmatch(r"[\w-]+", session_id):
+            raise HTTPError(404, f"sessione sconosciuta: {session_id}")
+        return domain
+
+    def _config(self, session_id):
+        return {"configurable": {"thread_id": session_id}, "callbacks": [get_telemetry()]}
+
+    def _run_turn(self, session_id, graph_input):
+        graph = self.graphs[self.domain_of(session_id)]
+        config = self._config(session_id)
+        before = len(graph.get_state(config).values.get("messages", []))
+        paused = []
+        for update in graph.stream(graph_input, config, stream_mode="updates"):
+            if "__interrupt__" in update:
+                paused.extend(item.value for item in update["__interrupt__"])
+        messages = graph.get_state(config).values.get("messages", [])
+        return {"session_id": session_id, "status": "paused" if paused else "done",
+                "messages": [serialize_message(m) for m in messages[before:]], "interrupt": paused or None}
+
+    async def turn(self, session_id, graph_input):
+        """Esegue un turno della sessione in un thread; i turni della stessa sessione vanno uno dopo l'altro."""
+        self.domain_of(session_id)
+        entry = self._sessions.setdefault(session_id, [asyncio.Lock(), 0])
+        entry[1] += 1
+        try:
+            async with entry[0]:
+                self.running += 1
+                try:
+                    loop = asyncio.get_running_loop()
+                    return await loop.run_in_executor(self._executor, self._run_turn, session_id, graph_input)
+                finally:
+                    self.running -= 1
+                    self.turns += 1
+        finally:
+            entry[1] -= 1
+            if not entry[1]:
+                del self._sessions[session_id]
+
+    async def history(self, session_id):
+        graph = self.graphs[self.domain_of(session_id)]
+        if not await asyncio.to_thread(graph.checkpointer.thread_exists, session_id):
+            raise HTTPError(404, f"sessione sconosciuta: {session_id}")
+        state = await asyncio.to_thread(graph.get_state, self._config(session_id))
+        return {"session_id": session_id, "messages": [serialize_message(m) for m in state.values.get("messages", [])],
+                "interrupt": [task.interrupts[0].value for task in state.tasks if task.interrupts] or None}
+
+    def stats(self):
+        return {"turns": self.turns, "running": self.running, "sessions_waiting": len(self._sessions),
+                "domains": self.domains, "llm_cache": get_cache().stats(),
+                "governor": {name: get_backend(name).stats() for name in ("openai", "tavily", "duckduckgo")}}
+
+    # === API HTTP ===
+    async def dispatch(self, method, path, body):
+        """Instrada una richiesta e restituisce (status, payload JSON)."""
+        parts = [p for p in path.split("/") if p]
+        data = {}
+        if method == "POST" and body:
+            try:
+                data = json.loads(body)
+            except ValueError:
+                raise HTTPError(400, "il corpo della richiesta non è JSON valido")
+        if method == "GET" and parts == ["domains"]:
+            return 200, {name: {"module": DOMAINS[name]["module"], "tools": DOMAINS[name]["tools"]}
+                         for name in self.domains}
+        if method == "GET" and parts == ["stats"]:
+            return 200, self.stats()
+        if method == "POST" and parts == ["sessions"]:
+            return 201, {"session_id": self.new_session(data.get("domain", ""))}
+        if len(parts) == 2 and parts[0] == "sessions" and method == "GET":
+            return 200, await self.history(parts[1])
+        if len(parts) == 3 and parts[0] == "sessions" and method == "POST":
+            if parts[2] == "messages" and data.get("message"):
+                return 200, await self.turn(parts[1], {"messages": [HumanMessage(content=data["message"])]})
+            if parts[2] == "resume" and "resume" in data:
+                from langgraph.types import Command
+                return 200, await self.turn(parts[1], Command(resume=data["resume"]))
+            raise HTTPError(400, "serve il campo 'message' (per /messages) o 'resume' (per /resume)")
+        raise HTTPError(404, f"{method} {path} non esiste")
+
+    async def handle_connection(self, reader, writer):
+        # HTTP/1.1 minimale con keep-alive: basta per un'API JSON locale e non richiede dipendenze
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line.strip():
+                    break
+                method, target, _ = request_line.decode("latin-1").split(" ", 2)
+                headers = {}
+                while (line := await reader.readline()) not in (b"\r\n", b"\n", b""):
+                    key, _, value = line.decode("latin-1").partition(":")
+                    headers[key.strip().lower()] = value.strip()
+                length = int(headers.get("content-length") or 0)
+                if length > MAX_BODY_BYTES:
+                    status, payload = 413, {"error": "richiesta troppo grande"}
+                else:
+                    body = await reader.readexactly(length)
+                    try:
+                        status, payload = await self.dispatch(method.upper(), urlsplit(target).path, body)
+                    except HTTPError as e:
+                        status, payload = e.status, {"error": str(e)}
+                    except Exception as e:
+                        status, payload = 500, {"error": f"{type(e).__name__}: {e}"}
+                keep_alive = headers.get("connection", "").lower() != "close" and length <= MAX_BODY_BYTES
+                data = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+                writer.write(f"HTTP/1.1 {status} {HTTPStatus(status).phrase}\r\n"
+                             "Content-Type: application/json; charset=utf-8\r\n"
+                             f"Content-Length: {len(data)}\r\n"
+                             f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n".encode("latin-1") + data)
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (asyncio.IncompleteReadError, ConnectionError, ValueError):
+            pass  # client disconnesso o richiesta malformata: si chiude la connessione
+        finally:
+            writer.close()
+
+    async def serve(self, host=SERVER_HOST, port=SERVER_PORT):
+        self.load()
+        server = await asyncio.start_server(self.handle_connection, host, port)
+        print(f"🌐 Server dei blog su http://{host}:{port} (domini: {', '.join(self.domains)})")
+        async with server:
+            await server.serve_forever()
+
+# Prima ogni blog era uno script a sé, con il suo client, la sua memoria e un avvio a freddo per ogni utente.
+# Qui i grafi di tutti i domini vivono nello stesso processo e condividono client, cache, indice, reputazione e
+# governatore; ogni conversazione è una sessione con il suo thread_id ("cinema-<uuid>"), salvata nel
+# checkpointer su disco. I grafi sono sincroni (checkpointer SQLite), quindi i turni girano in un pool di
+# SERVER_WORKERS thread mentre il loop asyncio continua ad accettare richieste.
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve i blog di tutti i domini da un solo processo, con un'API HTTP/JSON.")
+    parser.add_argument("--host", default=SERVER_HOST)
+    parser.add_argument("--port", type=int, default=SERVER_PORT)
+    parser.add_argument("--domains", nargs="+", choices=sorted(DOMAINS), default=sorted(DOMAINS),
+                        help="domini da servire (predefinito: tutti quelli di domains.py)")
+    parser.add_argument("--workers", type=int, default=SERVER_WORKERS, help="turni eseguiti contemporaneamente")
+    args = parser.parse_args()
+    try:
+        asyncio.run(BlogServer(args.domains, args.workers).serve(args.host, args.port))
+    except KeyboardInterrupt:
+        print("\nServer fermato.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,218 @@
+import os
+import json
+import time
+import threading
+from collections import OrderedDict
+
+from langchain_core.callbacks import BaseCallbackHandler
+
+# === CONFIGURAZIONE DELLA TELEMETRIA ===
+TELEMETRY_DIR = os.getenv("TELEMETRY_DIR", "telemetry")
+TRACE_PATH = os.path.join(TELEMETRY_DIR, "traces.jsonl")
+METRICS_PATH = os.path.join(TELEMETRY_DIR, "metrics.prom")
+METRICS_MAX_THREADS = int(os.getenv("TELEMETRY_MAX_THREADS", "200"))  # thread con serie proprie in metrics.prom
+
+# Prezzi in dollari per milione di token (prompt, completion); si usa il prefisso più lungo che corrisponde al modello
+PRICES_PER_MTOK = {
+    "gpt-4o-mini": (0.15, 0.60),
+    "gpt-4o": (2.50, 10.00),
+    "gpt-3.5-turbo-16k": (3.00, 4.00),
+    "gpt-3.5-turbo": (0.50, 1.50),
+}
+
+
+def estimate_cost(model, prompt_tokens, completion_tokens):
+    prefix = max((p for p in PRICES_PER_MTOK if (model or "").startswith(p)), key=len, default=None)
+    if prefix is None:
+        return 0.0
+    prompt_price, completion_price = PRICES_PER_MTOK[prefix]
+    return (prompt_tokens * prompt_price + completion_tokens * completion_price) / 1_000_000
+
+
+def _token_usage(response):
+    # I token arrivano nei usage_metadata del messaggio oppure, per i modelli più vecchi, in llm_output
+    for generations in response.generations:
+        for generation in generations:
+            usage = getattr(getattr(generation, "message", None), "usage_metadata", None)
+            if usage:
+                return usage.get("input_tokens", 0), usage.get("output_tokens", 0)
+    usage = (response.llm_output or {}).get("token_usage") or {}
+    return usage.get("prompt_tokens", 0), usage.get("completion_tokens", 0)
+
+
+def _label(value):
+    # Escape dei valori delle etichette nel formato testo di Prometheus
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+class TelemetryHandler(BaseCallbackHandler):
+    """Callback che misura nodi del grafo, tool e chiamate LLM, con token, costi, cache hit ed errori."""
+
+    def __init__(self, trace_path=TRACE_PATH, metrics_path=METRICS_PATH, max_threads=METRICS_MAX_THREADS):
+        self.trace_path = trace_path
+        self.metrics_path = metrics_path
+        self.max_threads = max_threads
+        self._lock = threading.Lock()
+        self._active = {}
+        self._threads = OrderedDict()  # thread_id con metriche, dal meno al più recente
+        self.metrics = {}
+        if os.path.dirname(trace_path):
+            os.makedirs(os.path.dirname(trace_path), exist_ok=True)
+        # Un solo file aperto per tutta la vita dell'handler; buffering=1 scrive ogni span appena completato
+        self._trace = open(trace_path, "a", encoding="utf-8", buffering=1)
+
+    # --- apertura e chiusura degli span ---
+    def _start(self, run_id, parent_run_id, kind, name, metadata, **attributes):
+        parent = self._active.get(parent_run_id)
+        thread_id = (metadata or {}).get("thread_id") or (parent["thread_id"] if parent else None)
+        # owner è il nodo o tool più vicino: serve ad attribuire latenza e costo delle chiamate LLM
+        owner = name if kind != "llm" else (parent["owner"] if parent else None)
+        self._active[run_id] = {"thread_id": thread_id, "span_id": str(run_id),
+                                "parent_id": str(parent_run_id) if parent_run_id else None,
+                                "kind": kind, "name": name, "owner": owner,
+                                "start": time.time(), "t0": time.perf_counter(), **attributes}
+
+    def _end(self, run_id, error=None, **attributes):
+        span = self._active.pop(run_id, None)
+        if span is None:
+            return
+        span["duration_s"] = round(time.perf_counter() - span.pop("t0"), 6)
+        span["status"] = "error" if error is not None else "ok"
+        if error is not None:
+            span["error"] = f"{type(error).__name__}: {error}"
+        span.update(attributes)
+        self._record(span)
+
+    def _record(self, span):
+        thread_id = span["thread_id"] or ""
+        key = (span["kind"], span["name"] if span["kind"] != "llm" else span["owner"] or "unknown", thread_id)
+        with self._lock:
+            self._threads[thread_id] = True
+            self._threads.move_to_end(thread_id)
+            while len(self._threads) > self.max_threads:
+                evicted = self._threads.popitem(last=False)[0]
+                for old in [k for k in self.metrics if k[2] == evicted]:
+                    del self.metrics[old]
+            m = self.metrics.setdefault(key, {"count": 0, "errors": 0, "seconds": 0.0, "prompt_tokens": 0,
+                                              "completion_tokens": 0, "cost_usd": 0.0, "cache_hits": 0,
+                                              "cache_misses": 0})
+            m["count"] += 1
+            m["errors"] += span["status"] == "error"
+            m["seconds"] += span["duration_s"]
+            m["prompt_tokens"] += span.get("prompt_tokens", 0)
+            m["completion_tokens"] += span.get("completion_tokens", 0)
+            m["cost_usd"] += span.get("cost_usd", 0.0)
+            m["cache_hits"] += span.get("cache_hits", 0)
+            m["cache_misses"] += span.get("cache_misses", 0)
+            self._trace.write(json.dumps(span, ensure_ascii=False, default=str) + "\n")
+
+    def close(self):
+        with self._lock:
+            self._trace.close()
+
+    # --- nodi del grafo ---
+    def on_chain_start(self, serialized, inputs, *, run_id, parent_run_id=None, metadata=None, **kwargs):
+        node = (metadata or {}).get("langgraph_node")
+        parent = self._active.get(parent_run_id)
+        if node and kwargs.get("name") == node and not (parent and parent["kind"] == "node" and parent["name"] == node):
+            self._start(run_id, parent_run_id, "node", node, metadata)
+        elif parent is not None:
+            # Runnable interni al nodo: non sono span, ma i figli devono ritrovare il nodo come genitore
+            self._active[run_id] = {**parent, "passthrough": True, "origin": parent.get("origin", parent_run_id)}
+
+    def on_chain_end(self, outputs, *, run_id, **kwargs):
+        self._close(run_id)
+
+    def on_chain_error(self, error, *, run_id, **kwargs):
+        # GraphInterrupt è il modo con cui LangGraph mette in pausa il grafo, non un errore
+        self._close(run_id, None if type(error).__name__ == "GraphInterrupt" else error)
+
+    def _close(self, run_id, error=None):
+        span = self._active.get(run_id)
+        if span is not None and span.get("passthrough"):
+            self._active.pop(run_id, None)
+        else:
+            self._end(run_id, error)
+
+    # --- tool ---
+    def on_tool_start(self, serialized, input_str, *, run_id, parent_run_id=None, metadata=None, **kwargs):
+        name = kwargs.get("name") or (serialized or {}).get("name", "tool")
+        self._start(run_id, parent_run_id, "tool", name, metadata)
+
+    def on_tool_end(self, output, *, run_id, **kwargs):
+        self._end(run_id)
+
+    def on_tool_error(self, error, *, run_id, **kwargs):
+        self._end(run_id, error)
+
+    # --- chiamate LLM ---
+    def on_chat_model_start(self, serialized, messages, *, run_id, parent_run_id=None, metadata=None, **kwargs):
+        params = kwargs.get("invocation_params") or {}
+        model = params.get("model_name") or params.get("model") or (metadata or {}).get("ls_model_name")
+        self._start(run_id, parent_run_id, "llm", "llm", metadata, model=model)
+
+    def on_llm_end(self, response, *, run_id, **kwargs):
+        span = self._active.get(run_id)
+        prompt_tokens, completion_tokens = _token_usage(response)
+        model = (span or {}).get("model") or (response.llm_output or {}).get("model_name")
+        self._end(run_id, prompt_tokens=prompt_tokens, completion_tokens=completion_tokens,
+                  cost_usd=estimate_cost(model, prompt_tokens, completion_tokens))
+
+    def on_llm_error(self, error, *, run_id, **kwargs):
+        self._end(run_id, error)
+
+    # --- eventi della cache (inviati da llm_cache) ---
+    def on_custom_event(self, name, data, *, run_id, **kwargs):
+        if name != "llm_cache":
+            return
+        span = self._active.get(run_id)
+        if span is not None and span.get("passthrough"):
+            span = self._active.get(span["origin"])
+        if span is not None:
+            counter = "cache_hits" if data.get("hit") else "cache_misses"
+            span[counter] = span.get(counter, 0) + 1
+
+    # --- esportazione in formato Prometheus ---
+    def export_metrics(self):
+        """Riscrive il file delle metriche in formato testo di Prometheus."""
+        series = [
+            ("blog_agent_span_total", "counter", "Numero di esecuzioni di nodi, tool e chiamate LLM", "count"),
+            ("blog_agent_span_errors_total", "counter", "Esecuzioni terminate con un errore", "errors"),
+            ("blog_agent_span_seconds_total", "counter", "Tempo totale speso (secondi)", "seconds"),
+            ("blog_agent_prompt_tokens_total", "counter", "Token di prompt inviati all'LLM", "prompt_tokens"),
+            ("blog_agent_completion_tokens_total", "counter", "Token generati dall'LLM", "completion_tokens"),
+            ("blog_agent_cost_usd_total", "counter", "Costo stimato delle chiamate LLM (dollari)", "cost_usd"),
+            ("blog_agent_cache_hits_total", "counter", "Risposte servite dalla cache LLM", "cache_hits"),
+            ("blog_agent_cache_misses_total", "counter", "Richieste non presenti nella cache LLM", "cache_misses"),
+        ]
+        with self._lock:
+            snapshot = {key: dict(values) for key, values in self.metrics.items()}
+        lines = []
+        for metric, metric_type, help_text, field in series:
+            lines.append(f"# HELP {metric} {help_text}")
+            lines.append(f"# TYPE {metric} {metric_type}")
+            for (kind, name, thread_id), values in sorted(snapshot.items()):
+                labels = f'kind="{kind}",name="{_label(name)}",thread_id="{_label(thread_id)}"'
+                lines.append(f"{metric}{{{labels}}} {round(values[field], 6)}")
+        tmp_path = self.metrics_path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write("\n".join(lines) + "\n")
+        os.replace(tmp_path, self.metrics_path)  # Scrittura atomica, per chi legge il file in quel momento
+
+# Ogni nodo del grafo, ogni tool e ogni chiamata LLM diventa uno span con durata, esito ed eventuale errore,
+# etichettato con il thread_id della conversazione e scritto in traces.jsonl. Le chiamate LLM sono attribuite
+# al nodo o tool che le ha fatte (owner), così nelle metriche si vede quale tool consuma più latenza, token e budget.
+# Le metriche aggregate vengono riscritte in metrics.prom, leggibile da Prometheus (ad esempio con il textfile collector),
+# anch'esse con l'etichetta thread_id. Ogni conversazione è una serie nuova, quindi per limitare la cardinalità
+# il file contiene solo gli ultimi METRICS_MAX_THREADS thread attivi: le serie dei thread più vecchi spariscono, e
+# il loro dettaglio resta in traces.jsonl.
+
+
+_telemetry = None
+
+
+def get_telemetry():
+    global _telemetry
+    if _telemetry is None:
+        _telemetry = TelemetryHandler()
+    return _telemetry
@@ -0,0 +1,51 @@
+import json
+import asyncio
+
+import claims
+from claims import ClaimStore, acheck_claims, parse_verdicts, split_claims
+
+ARTICLE = ("Oppenheimer è stato diretto da Christopher Nolan. Il film ha vinto sette premi Oscar. "
+           "Cillian Murphy interpreta il fisico protagonista. La colonna sonora è di Ludwig Göransson.")
+
+
+def batch_response(items):
+    return json.dumps({"verdicts": items}, ensure_ascii=False)
+
+
+def test_malformed_item_keeps_the_rest_of_the_batch():
+    batch = split_claims(ARTICLE)
+    text = batch_response([
+        {"id": 1, "verdict": "confermata", "explanation": "la fonte lo conferma"},
+        {"id": 2, "verdict": "forse", "explanation": "etichetta non prevista"},
+        {"id": 3, "verdict": "smentita", "explanation": "x" * 2000},
+        {"id": 4},
+    ])
+    verdicts = parse_verdicts(text, batch)
+    assert set(verdicts) == {batch[0]["hash"], batch[2]["hash"]}
+    assert verdicts[batch[0]["hash"]]["verdict"] == "confermata"
+    assert verdicts[batch[2]["hash"]]["verdict"] == "smentita"
+    assert len(verdicts[batch[2]["hash"]]["explanation"]) == claims.MAX_EXPLANATION_CHARS
+
+
+def test_invalid_json_gives_no_verdicts():
+    batch = split_claims(ARTICLE)
+    assert parse_verdicts("non è JSON", batch) == {}
+    assert parse_verdicts('{"verdicts": "nessuno"}', batch) == {}
+
+
+def test_valid_verdicts_of_a_malformed_batch_are_stored(tmp_path, monkeypatch):
+    monkeypatch.setattr(claims, "_store", ClaimStore(path=str(tmp_path / "claims.sqlite")))
+    calls = []
+
+    async def ask_llm(messages):
+        calls.append(messages)
+        return batch_response([{"id": 1, "verdict": "confermata"}, {"id": 2, "verdict": "boh"},
+                               {"id": 3, "verdict": "smentita"}, {"id": 4, "verdict": "confermata"}])
+
+    first = asyncio.run(acheck_claims(ARTICLE, "https://example.com/a", "{}", ask_llm))
+    assert [v["verdict"] for v in first] == ["confermata", claims.UNCHECKED, "smentita", "confermata"]
+    asyncio.run(acheck_claims(ARTICLE, "https://example.com/a", "{}", ask_llm))
+    # Alla seconda verifica torna all'LLM solo l'affermazione rimasta senza verdetto
+    assert len(calls) == 2
+    assert "Il film ha vinto sette premi Oscar." in calls[1][1].content
+    assert "Christopher Nolan" not in calls[1][1].content
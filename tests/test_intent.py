@@ -0,0 +1,39 @@
+import pytest
+
+from Agent_AI import classify_intent
+
+
+@pytest.mark.parametrize("text, topic", [
+    ("Scrivi un articolo su Oppenheimer", "Oppenheimer"),
+    ("scrivi un articolo sul nuovo film di Nolan, massimo 100 parole", "nuovo film di Nolan"),
+    ("Genera un articolo breve su Dune parte due; tono ironico", "Dune parte due"),
+    ("Scrivi un articolo su Barbie massimo 200 parole", "Barbie"),
+    ("Scrivi un articolo su Barbie al massimo 200 parole", "Barbie"),
+    ("Prepara un articolo su Past Lives in 150 parole", "Past Lives"),
+    ("Scrivi un articolo su Povere creature in stile recensione", "Povere creature"),
+    ("Scrivi un articolo su Killers of the Flower Moon con un tono leggero", "Killers of the Flower Moon"),
+    ("Scrivi un articolo di 200 parole su Anatomia di una caduta", "Anatomia di una caduta"),
+    ("Scrivi un articolo su Titanic con Leonardo DiCaprio", "Titanic con Leonardo DiCaprio"),
+    ("Scrivi un articolo sul cinema in concorso a Venezia", "cinema in concorso a Venezia"),
+    ("Scrivi un articolo su Dune entro domani", "Dune"),
+    ("Scrivi un articolo su Oppenheimer, max 150 parole", "Oppenheimer"),
+    ("Scrivi un articolo su Oppenheimer, per Instagram", "Oppenheimer"),
+    # Titoli che contengono le parole dei vincoli, senza un vincolo vero
+    ("Scrivi un articolo su Mad Max: Fury Road", "Mad Max: Fury Road"),
+    ("Scrivi un articolo su Il ritorno di Max", "Il ritorno di Max"),
+    ("Scrivi un articolo sul film Lunga vita alla signora", "film Lunga vita alla signora"),
+    ("Scrivi un articolo su Il buono, il brutto, il cattivo", "Il buono, il brutto, il cattivo"),
+    ("Scrivi un articolo su Lola corre entro il 1998", "Lola corre entro il 1998"),
+    ("Scrivi un articolo su Mad Max: Fury Road, massimo 100 parole", "Mad Max: Fury Road"),
+])
+def test_topic_without_constraints(text, topic):
+    assert classify_intent(text) == topic
+
+
+@pytest.mark.parametrize("text", [
+    "Suggeriscimi qualche idea per un articolo",
+    "Me lo potresti riformulare?",
+    "Ciao, come stai?",
+])
+def test_not_an_article_request(text):
+    assert classify_intent(text) is None
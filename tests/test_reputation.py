@@ -0,0 +1,25 @@
+import json
+
+import reputation
+from reputation import ReputationStore, parse_evaluation
+
+
+def test_long_comment_is_truncated_not_dropped():
+    evaluation = parse_evaluation(json.dumps({"score": 8, "comment": "x" * 2000}))
+    assert evaluation is not None
+    assert evaluation.score == 8
+    assert len(evaluation.comment) == reputation.MAX_COMMENT_CHARS
+
+
+def test_invalid_evaluation_is_rejected():
+    assert parse_evaluation(json.dumps({"score": 11, "comment": "fuori scala"})) is None
+    assert parse_evaluation(json.dumps({"score": 7, "comment": ""})) is None
+    assert parse_evaluation("nessun JSON qui") is None
+
+
+def test_long_comment_reaches_the_store(tmp_path):
+    store = ReputationStore(path=str(tmp_path / "reputation.sqlite"), blog="cinema")
+    store.record("https://www.example.com/recensione", parse_evaluation(json.dumps({"score": 9, "comment": "y" * 900})))
+    rep = store.reputation("example.com")
+    assert rep["score"] == 9
+    assert len(rep["comment"]) == reputation.MAX_COMMENT_CHARS
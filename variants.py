@@ -0,0 +1,79 @@
+import os
+import time
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+# === CONFIGURAZIONE DELLE VARIANTI DELL'ARTICOLO ===
+ARTICLE_VARIANTS = int(os.getenv("ARTICLE_VARIANTS", "3"))  # bozze alternative preparate durante la revisione
+VARIANT_WORKERS = int(os.getenv("VARIANT_WORKERS", "4"))
+VARIANT_MAX_PROMPTS = 64  # prompt di cui si tengono in memoria le varianti
+
+# Tagli e toni delle varianti, nell'ordine in cui vengono proposte
+ANGLES = [
+    ("analisi critica", "Scrivi un'analisi critica e argomentata: regia, interpretazioni, punti di forza e debolezze."),
+    ("retroscena", "Racconta il film attraverso retroscena, curiosità di produzione e aneddoti dal set."),
+    ("tono leggero", "Usa un tono ironico e colloquiale, adatto ai social, senza perdere le informazioni."),
+    ("contesto", "Inquadra il film nella carriera dell'autore e nel suo genere, con confronti con altre opere."),
+    ("cronaca", "Scrivi in stile notizia: fatti essenziali in apertura, tono neutro e frasi brevi."),
+]
+
+
+class VariantPool:
+    """Varianti di un articolo generate in background e tenute in memoria per prompt."""
+
+    def __init__(self, workers=VARIANT_WORKERS, max_prompts=VARIANT_MAX_PROMPTS):
+        self.max_prompts = max_prompts
+        self.started = 0
+        self.served = 0
+        self.waited = 0.0  # secondi passati ad aspettare varianti non ancora pronte
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="variants")
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def prefetch(self, prompt, generate, k=ARTICLE_VARIANTS):
+        """Avvia generate(prompt, istruzioni) per le prime k varianti del prompt che non sono già state avviate."""
+        with self._lock:
+            futures = self._entries.setdefault(prompt, [])
+            self._entries.move_to_end(prompt)
+            for _, instructions in ANGLES[len(futures):k]:
+                futures.append(self._executor.submit(generate, prompt, instructions))
+                self.started += 1
+            while len(self._entries) > self.max_prompts:
+                for future in self._entries.popitem(last=False)[1]:
+                    future.cancel()
+
+    def get(self, prompt, index, generate):
+        """Taglio e testo della variante index del prompt, aspettandola se non è pronta; None se non ce ne sono altre."""
+        if index >= len(ANGLES):
+            return None
+        self.prefetch(prompt, generate, index + 1)  # ad esempio dopo un riavvio, quando la memoria è vuota
+        with self._lock:
+            future = self._entries[prompt][index]
+        start = time.perf_counter()
+        text = future.result()
+        with self._lock:
+            self.served += 1
+            self.waited += time.perf_counter() - start
+        return ANGLES[index][0], text
+
+    def stats(self):
+        with self._lock:
+            return {"started": self.started, "served": self.served, "waited_s": round(self.waited, 3)}
+
+# Quando l'articolo arriva alla revisione umana le varianti partono subito in background, una per taglio, mentre
+# l'editor legge la prima bozza: "prossima variante" di solito è già pronta e non serve scrivere un nuovo prompt
+# né ripassare da assistant e generate_article. Il testo passa dalla cache LLM, quindi lo stesso prompt con lo
+# stesso taglio non viene rigenerato neanche dopo un riavvio; le varianti non richieste restano solo in cache.
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_variants():
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = VariantPool()
+    return _pool